@@ -19,6 +19,8 @@ class Settings(BaseSettings):
     API_HOST: str = "0.0.0.0"
     API_PORT: int = 8000
     API_PREFIX: str = "/api/v1"
+    WARMUP_ON_STARTUP: bool = True  # 启动时在后台预热嵌入模型、Milvus和Neo4j（完成前 /ready 返回503）
+    WARMUP_RETRY_INTERVAL: float = 10.0  # 预热失败后的重试间隔（秒）
     
     # CORS配置（环境变量中应使用逗号分隔的字符串，如：http://localhost:3000,http://localhost:5173）
     CORS_ORIGINS: str = "http://localhost:3000,http://localhost:5173"
@@ -39,6 +41,53 @@ class Settings(BaseSettings):
     # 代码嵌入配置
     EMBEDDING_MODEL: str = "microsoft/codebert-base"  # CodeBERT模型
     EMBEDDING_DEVICE: str = "cpu"  # cpu 或 cuda
+    EMBEDDING_MAX_BATCH_TOKENS: int = 8192  # 批量编码时每批的token预算（含填充）
+    EMBEDDING_BACKEND: str = "torch"  # torch 或 onnx（CPU上使用ONNX Runtime推理）
+    EMBEDDING_ONNX_DIR: str = "./data/models/onnx"  # 导出的ONNX模型目录
+    EMBEDDING_ONNX_QUANTIZE: bool = False  # 是否使用int8动态量化的ONNX模型
+    EMBEDDING_ONNX_THREADS: int = 0  # ONNX Runtime线程数（0 表示使用默认值）
+    
+    # 多进程嵌入配置（批量向量化使用）
+    EMBEDDING_POOL_WORKERS: int = 1  # 嵌入进程数（1 表示在当前进程中编码）
+    EMBEDDING_POOL_THREADS: int = 0  # 每个嵌入进程的线程数（0 表示CPU核数 / 进程数）
+    EMBEDDING_POOL_CHUNK_SIZE: int = 256  # 每次提交给嵌入进程的文本数
+    EMBEDDING_CACHE_DIR: str = "./data/embedding_cache"  # 向量缓存目录（按模型和内容哈希复用已编码的向量）
+    
+    # 共享嵌入服务配置（多个API工作进程共用一份模型）
+    EMBEDDING_MODE: str = "local"  # local（进程内加载模型）或 server（连接scripts/embedding_server.py）
+    EMBEDDING_SERVER_SOCKET: str = "./data/run/embedding.sock"  # 嵌入服务的Unix socket路径
+    EMBEDDING_SERVER_AUTHKEY: str = ""  # 连接认证密钥（为空时使用SECRET_KEY）
+    EMBEDDING_SERVER_TIMEOUT: float = 30.0  # 单次编码请求的超时（秒）
+    
+    # 长代码分块配置（CodeBERT最多编码512个token）
+    CHUNK_MAX_TOKENS: int = 480  # 每个窗口的token上限（含名称前缀）
+    CHUNK_OVERLAP_TOKENS: int = 64  # 相邻窗口重叠的token数
+    CHUNK_AGGREGATION: str = "max"  # 检索时窗口命中的聚合方式：max 或 sum
+    CHUNK_SEARCH_OVERFETCH: int = 3  # 检索时多取的倍数，聚合后仍能凑满top_k
+    
+    # 词法检索配置（BM25倒排索引，与向量检索按RRF融合）
+    LEXICAL_INDEX_ENABLED: bool = True  # 检索时是否融合词法检索结果
+    LEXICAL_INDEX_DIR: str = "./data/lexical_index"  # 索引目录（SQLite词频库和内存映射快照）
+    LEXICAL_INDEX_RELOAD_INTERVAL: float = 5.0  # 检查新快照的间隔（秒）
+    LEXICAL_INDEX_BUILD_DELAY: float = 10.0  # 写入停止多少秒后由API进程在后台重新编译快照
+    LEXICAL_INDEX_BUILD_MAX_WAIT: float = 300.0  # 持续写入时两次编译快照的最长间隔（秒）
+    LEXICAL_INDEX_MAX_DELTA: int = 5000  # 检索时合并的未编译片段上限，超出时只检索快照（等待编译）
+    LEXICAL_NAME_WEIGHT: int = 3  # 片段名称中词项的词频权重
+    LEXICAL_BM25_K1: float = 1.2  # BM25词频饱和参数
+    LEXICAL_BM25_B: float = 0.75  # BM25文档长度归一化参数
+    SEARCH_RRF_K: int = 60  # 倒数排名融合的平滑常数
+    SEARCH_FUSION_CANDIDATES: int = 50  # 融合前每种检索取的候选数
+    
+    # 重排序配置（对检索候选按特征和可选的交叉编码器重新打分）
+    RERANK_ENABLED: bool = False  # 是否默认重排序（请求中的rerank参数优先）
+    RERANK_CANDIDATES: int = 30  # 参与重排序的候选数
+    RERANK_MODEL: str = ""  # 交叉编码器模型，如 cross-encoder/ms-marco-MiniLM-L-6-v2（留空只用特征打分）
+    RERANK_MODEL_WEIGHT: float = 0.7  # 交叉编码器得分在最终得分中的权重
+    RERANK_BATCH_SIZE: int = 16  # 交叉编码器每批打分的候选数
+    RERANK_BUDGET_MS: float = 200.0  # 重排序的延迟预算（毫秒），超出后剩余候选只用特征得分
+    RERANK_MAX_CONCURRENCY: int = 2  # 同时使用交叉编码器的请求数上限（每个进程），超出时只用特征得分
+    RERANK_CACHE_TTL: int = 3600  # (查询, 代码片段) 模型得分的缓存时间（秒）
+    RERANK_POPULAR_REPOS: int = 1000  # 仓库规模特征统计的仓库数（按片段数取前N个）
     
     # Pinecone配置（可选）
     PINECONE_API_KEY: str = ""
@@ -49,6 +98,9 @@ class Settings(BaseSettings):
     NEO4J_URI: str = "bolt://localhost:7687"
     NEO4J_USER: str = "neo4j"
     NEO4J_PASSWORD: str = ""  # 从环境变量读取
+    NEO4J_MAX_CONNECTION_POOL_SIZE: int = 50  # 连接池最大连接数
+    NEO4J_CONNECTION_ACQUISITION_TIMEOUT: float = 30.0  # 从连接池获取连接的超时（秒）
+    NEO4J_MAX_CONNECTION_LIFETIME: float = 3600.0  # 连接的最长存活时间（秒），超过后关闭重建
     
     # 大模型API配置（支持OpenAI和DeepSeek）
     LLM_PROVIDER: str = "deepseek"  # openai 或 deepseek
@@ -56,6 +108,14 @@ class Settings(BaseSettings):
     LLM_BASE_URL: str = ""  # DeepSeek: https://api.deepseek.com, OpenAI: 留空使用默认
     LLM_MODEL: str = "deepseek-chat"  # deepseek-chat 或 gpt-3.5-turbo
     LLM_MAX_TOKENS: int = 1000
+    LLM_MAX_CONCURRENCY: int = 5  # 同时进行的LLM请求数上限（每个进程）
+    LLM_TIMEOUT: float = 30.0  # 单次LLM请求的超时（秒）
+    LLM_CODE_MAX_TOKENS: int = 1024  # 说明提示词中代码的token预算，超出时省略函数体
+    EXPLANATION_CACHE_ENABLED: bool = True  # 是否缓存生成的复用说明
+    EXPLANATION_CACHE_PATH: str = "./data/explanation_cache.db"  # 说明缓存数据库（多个工作进程共用）
+    EXPLANATION_CACHE_TTL: float = 7 * 24 * 3600  # 说明的有效期（秒），过期后重新生成
+    EXPLANATION_CACHE_MAX_ENTRIES: int = 20000  # 最多缓存的说明数，超出时淘汰最久未使用的
+    EXPLANATION_CACHE_BY_QUERY: bool = False  # 是否按（规范化后的）查询分别缓存说明
     
     # OpenAI配置（兼容旧配置，已废弃，使用LLM_*配置）
     OPENAI_API_KEY: str = ""
@@ -69,11 +129,28 @@ class Settings(BaseSettings):
     # GitHub配置
     GITHUB_TOKEN: str = ""
     GITHUB_RATE_LIMIT: int = 5000
+    GITHUB_REQUESTS_PER_SECOND: float = 10.0  # 所有下载线程共享的请求速率上限（<=0 不限速）
+    
+    # 代码采集并发配置
+    COLLECT_DOWNLOAD_WORKERS: int = 8  # 文件下载线程数
+    COLLECT_PARSE_WORKERS: int = 0  # 解析/清洗进程数（0 表示使用CPU核数）
+    
+    # 并行解析服务配置
+    PARSE_POOL_WORKERS: int = 0  # API使用的解析进程数（0 表示使用CPU核数）
+    PARSE_CHUNK_SIZE: int = 16  # 每次提交给解析进程的文件数
     
     # 数据存储配置
     DATA_DIR: str = "./data"
     CODE_SNIPPETS_DIR: str = "./data/code_snippets"
     METADATA_DIR: str = "./data/metadata"
+    COLLECT_MANIFEST_PATH: str = "./data/metadata/collect_manifest.json"  # 增量采集清单
+    
+    # 语料级去重配置（MinHash + LSH）
+    DEDUP_INDEX_PATH: str = "./data/metadata/dedup_index.db"  # 去重索引文件
+    DEDUP_THRESHOLD: float = 0.85  # 判定为近似重复的Jaccard相似度
+    DEDUP_NUM_PERM: int = 128  # MinHash置换数量
+    DEDUP_BANDS: int = 16  # LSH分段数量（需要整除DEDUP_NUM_PERM）
+    DEDUP_SHINGLE_SIZE: int = 5  # 每个shingle包含的token数
     
     # 日志配置
     LOG_LEVEL: str = "INFO"
@@ -2,16 +2,45 @@
 FastAPI应用主入口
 """
 
+import asyncio
+import json
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Any, Dict
 from app.core.config import settings
 from app.services.embedding_service import get_embedding_service
 from app.services.milvus_service import get_milvus_service
-from app.services.neo4j_service import get_neo4j_service
-from app.services.llm_service import get_llm_service
+from app.services.async_neo4j_service import get_async_neo4j_service, close_async_neo4j_service
+from app.services.llm_service import get_llm_service, close_llm_service
 from app.services.cache_service import get_cache_service
+from app.services.parse_pool import get_parse_pool
+from app.services.chunker import CodeChunker
+from app.services.prompt_budget import get_prompt_budgeter
+from app.services.lexical_index import get_lexical_index, reciprocal_rank_fusion
+from app.services.reranker import get_reranker
+from app.services.warmup_service import get_warmup_service
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动后在后台预热各个服务，不阻塞进程开始接收请求"""
+    if settings.WARMUP_ON_STARTUP:
+        get_warmup_service().start(asyncio.get_running_loop())
+    if settings.LEXICAL_INDEX_ENABLED:
+        try:
+            get_lexical_index().start_background_build()
+        except Exception as e:
+            print(f"[!] 启动词法索引后台编译失败: {e}")
+    yield
+    get_warmup_service().stop()
+    if settings.LEXICAL_INDEX_ENABLED:
+        await asyncio.to_thread(get_lexical_index().stop_background_build)
+    await close_async_neo4j_service()
+    await close_llm_service()
+
 
 app = FastAPI(
     title="CodeRetrievr API",
@@ -19,6 +48,7 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
 # CORS配置
@@ -43,10 +73,25 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """健康检查"""
+    """健康检查（进程存活即返回healthy，是否可以接收流量见 /ready）"""
     return {"status": "healthy"}
 
 
+@app.get("/ready")
+async def readiness_check():
+    """
+    就绪检查：所有服务预热完成前返回503，供负载均衡判断是否转发请求
+    """
+    if not settings.WARMUP_ON_STARTUP:
+        return {"status": "ready", "services": {}}
+    
+    warmup_service = get_warmup_service()
+    services = warmup_service.snapshot()
+    if not warmup_service.ready:
+        return JSONResponse(status_code=503, content={"status": "warming_up", "services": services})
+    return {"status": "ready", "services": services}
+
+
 # ===== 检索 API =====
 class SearchRequest(BaseModel):
     query: str
@@ -56,6 +101,7 @@ class SearchRequest(BaseModel):
     repo_name: Optional[str] = None     # 可选的仓库过滤
     explain: bool = False               # 是否生成复用说明
     explain_top_n: int = 1              # 生成前N条的说明（其余只返回基础信息）
+    rerank: Optional[bool] = None       # 是否重排序（为None时使用RERANK_ENABLED配置）
 
 
 class SearchResultItem(BaseModel):
@@ -81,11 +127,53 @@ class SearchResponse(BaseModel):
     results: List[SearchResultItem]
 
 
-@app.post("/search", response_model=SearchResponse)
-async def search_code(req: SearchRequest) -> SearchResponse:
+async def _hybrid_hits(
+    req: SearchRequest,
+    milvus_service: Any,
+    query_vec: Any,
+    filter_expr: Optional[str],
+    search_k: int
+) -> List[Dict]:
     """
-    自然语言检索代码片段：query -> 向量 -> Milvus搜索 -> Neo4j补充信息
+    向量检索和BM25词法检索的结果按倒数排名融合（RRF）
+    
+    两种得分不在同一尺度上，只按各自的排名融合；只被词法检索召回的片段从Milvus取回代码等字段。
+    融合得分除以两种检索都排第一时的得分，归一化到 (0, 1]。
     """
+    candidates = max(search_k, settings.SEARCH_FUSION_CANDIDATES)
+    vector_hits = milvus_service.search_snippets(query_vec, top_k=candidates, filter_expr=filter_expr)
+    try:
+        lexical_hits = await asyncio.to_thread(
+            get_lexical_index().search, req.query, candidates, req.language, req.repo_name
+        )
+    except Exception as e:
+        print(f"[!] 词法检索失败，只使用向量检索: {e}")
+        lexical_hits = []
+    if not lexical_hits:
+        return vector_hits[:search_k]
+    
+    hits_by_id = {hit["code_id"]: hit for hit in vector_hits if hit.get("code_id")}
+    fused = reciprocal_rank_fusion([
+        list(hits_by_id),
+        [code_id for code_id, _ in lexical_hits],
+    ])[:search_k]
+    missing = [code_id for code_id, _ in fused if code_id not in hits_by_id]
+    if missing:
+        hits_by_id.update(milvus_service.get_by_code_ids(missing))
+    
+    best = 2.0 / (settings.SEARCH_RRF_K + 1)
+    hits = []
+    for code_id, score in fused:
+        hit = hits_by_id.get(code_id)
+        # 词法索引中还有、Milvus中已删除的片段
+        if hit is None:
+            continue
+        hits.append({**hit, "code_id": code_id, "similarity": score / best})
+    return hits
+
+
+async def _retrieve(req: SearchRequest) -> List[SearchResultItem]:
+    """检索并补充关联信息（/search 和 /search/stream 共用）"""
     # 1) 向量化查询
     embedding_service = get_embedding_service()
     query_vec = embedding_service.encode_code(req.query)
@@ -106,23 +194,39 @@ async def search_code(req: SearchRequest) -> SearchResponse:
     
     # 如果需要在Neo4j中筛选依赖库，增加搜索数量（因为依赖库筛选在Neo4j中进行）
     # 仓库筛选已经在Milvus中完成，所以不需要增加搜索数量
-    search_k = req.top_k * 3 if req.dependency else req.top_k
-    milvus_hits = milvus_service.search(query_vec, top_k=search_k, filter_expr=filter_expr)
-
-    # 3) 用 Neo4j 补充关联信息并应用依赖库筛选
-    neo4j_service = get_neo4j_service()
-    enriched_results: List[SearchResultItem] = []
+    # 长代码的多个分块命中会聚合为一条结果
+    # 重排序时先取RERANK_CANDIDATES个候选，重新打分后再截取top_k
+    rerank = settings.RERANK_ENABLED if req.rerank is None else req.rerank
+    candidate_k = max(req.top_k, settings.RERANK_CANDIDATES) if rerank else req.top_k
+    search_k = candidate_k * 3 if req.dependency else candidate_k
+    if settings.LEXICAL_INDEX_ENABLED:
+        milvus_hits = await _hybrid_hits(req, milvus_service, query_vec, filter_expr, search_k)
+    else:
+        milvus_hits = milvus_service.search_snippets(query_vec, top_k=search_k, filter_expr=filter_expr)
+
+    # 3) 用 Neo4j 补充关联信息并应用依赖库筛选（一次批量查询所有命中）
+    candidates: List[Dict[str, Any]] = []
     filtered_count = 0
+    infos: Dict[str, Dict] = {}
+    enrichment_failed = False
+    code_ids = [hit.get("code_id") for hit in milvus_hits if hit.get("code_id")]
+    if code_ids:
+        try:
+            neo4j_service = await get_async_neo4j_service()
+            infos = await neo4j_service.get_code_snippets_info(code_ids)
+        except Exception:
+            # 补充失败时保证检索可用（依赖库筛选无法判断，相关结果会被排除）
+            enrichment_failed = True
     
     for hit in milvus_hits:
         # 如果已经达到所需数量，停止处理
-        if len(enriched_results) >= req.top_k:
+        if len(candidates) >= candidate_k:
             break
         # Milvus返回的是L2距离，越小越相似
-        # 转换为相似度分数：similarity = 1 / (1 + distance)
-        # 这样距离为0时相似度为1，距离越大相似度越小
+        # search_snippets已转换为相似度分数：similarity = 1 / (1 + distance)
+        # 这样距离为0时相似度为1，距离越大相似度越小（sum聚合时多个分块的相似度相加）
         distance = float(hit.get("score", 0.0))
-        similarity = 1.0 / (1.0 + distance)  # 转换为0-1之间的相似度
+        similarity = hit.get("similarity", 1.0 / (1.0 + distance))
         
         item: Dict[str, Any] = {
             "id": hit.get("id"),
@@ -140,63 +244,63 @@ async def search_code(req: SearchRequest) -> SearchResponse:
         code_id = hit.get("code_id")
         should_include = True
         
+        # 补充依赖库和相关代码
+        info = infos.get(code_id) if code_id else None
+        if info:
+            item["dependencies"] = info.get("dependencies") or []
+            item["related_codes"] = info.get("similar_codes") or []
         # 如果指定了依赖库筛选，检查代码是否使用该依赖库
-        if req.dependency and code_id:
-            try:
-                info = neo4j_service.get_code_snippet_info(code_id)
-                if info:
-                    item["dependencies"] = info.get("dependencies") or []
-                    item["related_codes"] = info.get("similar_codes") or []
-                    # 检查是否包含指定的依赖库
-                    dependencies = item.get("dependencies", [])
-                    if req.dependency not in dependencies:
-                        should_include = False
-                else:
-                    # 如果Neo4j中没有信息，且要求依赖库筛选，则排除
-                    should_include = False
-            except Exception:
-                # 如果查询失败，且要求依赖库筛选，则排除
-                if req.dependency:
-                    should_include = False
-        elif code_id:
-            # 没有依赖库筛选要求，但仍需要补充信息
-            try:
-                info = neo4j_service.get_code_snippet_info(code_id)
-                if info:
-                    item["dependencies"] = info.get("dependencies") or []
-                    item["related_codes"] = info.get("similar_codes") or []
-            except Exception:
-                # 忽略单条补充失败，保证检索可用
-                pass
+        # Neo4j中没有信息或查询失败时无法确认，排除该结果
+        if req.dependency:
+            if enrichment_failed or not info or req.dependency not in item.get("dependencies", []):
+                should_include = False
         
         # 只有通过所有筛选条件才添加到结果中
         if should_include:
-            enriched_results.append(SearchResultItem(**item))
+            candidates.append(item)
             filtered_count += 1
+    
+    # 4) 重排序（可选，失败时保持检索顺序）
+    if rerank and len(candidates) > 1:
+        try:
+            candidates = await get_reranker().rerank(req.query, candidates)
+        except Exception as e:
+            print(f"[!] 重排序失败，使用检索顺序: {e}")
+
+    return [SearchResultItem(**item) for item in candidates[:req.top_k]]
+
+
+def _explanation_items(req: SearchRequest, results: List[SearchResultItem]) -> List[Dict[str, Any]]:
+    """构建前N条结果生成复用说明所需的参数（使用最终结果自身的代码）"""
+    budgeter = get_prompt_budgeter()
+    items = []
+    for r in results[:req.explain_top_n]:
+        # 代码超出token预算时省略函数体、保留签名，而不是按字符截断
+        code_text = budgeter.trim_code(r.code or "", r.language)
+        items.append({
+            "code_snippet": code_text,
+            "language": r.language or "python",
+            "dependencies": r.dependencies or [],
+        })
+    return items
+
 
-    # 4) 生成复用说明（可选，仅对前N条）
+@app.post("/search", response_model=SearchResponse)
+async def search_code(req: SearchRequest) -> SearchResponse:
+    """
+    自然语言检索代码片段：query -> 向量 -> Milvus搜索 -> Neo4j补充信息
+    """
+    enriched_results = await _retrieve(req)
+    
+    # 5) 生成复用说明（可选，仅对前N条，并发生成）
     if req.explain and enriched_results:
         try:
             llm = get_llm_service()
-            limit = min(req.explain_top_n, len(enriched_results))
-            for i in range(limit):
-                r = enriched_results[i]
-                # 需要原始代码文本用于说明生成：从 Milvus 命中中取回的 code 字段
-                # 为简洁，使用上面 milvus_hits 的 code 对应索引
-                code_text = milvus_hits[i].get("code") or ""
-                # 防止提示词过长导致模型拒绝或超限，截断到合理长度
-                if code_text and len(code_text) > 2000:
-                    code_text = code_text[:2000]
-                try:
-                    r.explanation = await llm.generate_code_reuse_instruction(
-                        code_snippet=code_text,
-                        language=r.language or "python",
-                        dependencies=r.dependencies or [],
-                        user_query=req.query
-                    )
-                except Exception:
-                    # 单条失败不影响整体
-                    r.explanation = None
+            items = _explanation_items(req, enriched_results)
+            # 单条失败或超时的说明为None，不影响整体
+            explanations = await llm.generate_code_reuse_instructions(items, user_query=req.query)
+            for r, explanation in zip(enriched_results, explanations):
+                r.explanation = explanation
         except Exception:
             # 忽略说明生成阶段的总失败
             pass
@@ -204,6 +308,79 @@ async def search_code(req: SearchRequest) -> SearchResponse:
     return SearchResponse(query=req.query, top_k=req.top_k, results=enriched_results)
 
 
+def _sse(event: str, data: Any) -> str:
+    """编码一条Server-Sent Events消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/search/stream")
+async def search_code_stream(req: SearchRequest) -> StreamingResponse:
+    """
+    流式检索（Server-Sent Events）：检索结果完成后立即推送，复用说明随后逐段推送
+    
+    事件：
+    - results: 检索结果（格式与 /search 的响应相同，不含说明）
+    - explanation: {"index": 结果序号, "delta": 新生成的文本}
+    - explanation_done: {"index": 结果序号, "explanation": 完整说明（失败时为null）, "error": 错误信息}
+    - done: 全部完成
+    """
+    # 检索阶段的错误按普通HTTP错误返回
+    enriched_results = await _retrieve(req)
+    response = SearchResponse(query=req.query, top_k=req.top_k, results=enriched_results)
+    items = _explanation_items(req, enriched_results) if req.explain else []
+    
+    async def explain(llm: Any, index: int, item: Dict[str, Any], queue: asyncio.Queue):
+        """流式生成一条说明，把增量文本放入队列"""
+        parts = []
+        try:
+            async for delta in llm.stream_code_reuse_instruction(user_query=req.query, **item):
+                parts.append(delta)
+                await queue.put(("explanation", {"index": index, "delta": delta}))
+            done = {"index": index, "explanation": "".join(parts).strip(), "error": None}
+        except Exception as e:
+            done = {"index": index, "explanation": None, "error": str(e)}
+        await queue.put(("explanation_done", done))
+    
+    async def events():
+        yield _sse("results", response.model_dump())
+        
+        tasks = []
+        try:
+            if items:
+                try:
+                    llm = get_llm_service()
+                except Exception as e:
+                    for index in range(len(items)):
+                        yield _sse("explanation_done", {"index": index, "explanation": None, "error": str(e)})
+                    llm = None
+                
+                if llm is not None:
+                    # 多条说明并发生成，增量文本按到达顺序交错推送
+                    queue: asyncio.Queue = asyncio.Queue()
+                    tasks = [
+                        asyncio.create_task(explain(llm, index, item, queue))
+                        for index, item in enumerate(items)
+                    ]
+                    remaining = len(tasks)
+                    while remaining:
+                        event, data = await queue.get()
+                        if event == "explanation_done":
+                            remaining -= 1
+                        yield _sse(event, data)
+            
+            yield _sse("done", {})
+        finally:
+            # 客户端提前断开时停止生成
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # ===== 统计 API =====
 class StatisticsResponse(BaseModel):
     total_code_snippets: int
@@ -235,11 +412,13 @@ async def get_statistics() -> StatisticsResponse:
         milvus_stats = milvus_service.get_collection_stats()
         
         # 获取Neo4j统计（详细统计信息）
-        neo4j_service = get_neo4j_service()
-        neo4j_stats = neo4j_service.get_statistics()
-        language_distribution = neo4j_service.get_language_distribution()
-        repo_distribution = neo4j_service.get_repo_distribution(limit=20)
-        top_deps = neo4j_service.get_top_dependencies(limit=20)
+        neo4j_service = await get_async_neo4j_service()
+        neo4j_stats, language_distribution, repo_distribution, top_deps = await asyncio.gather(
+            neo4j_service.get_statistics(),
+            neo4j_service.get_language_distribution(),
+            neo4j_service.get_repo_distribution(limit=20),
+            neo4j_service.get_top_dependencies(limit=20),
+        )
         
         stats = StatisticsResponse(
             total_code_snippets=milvus_stats.get("num_entities", 0),
@@ -298,6 +477,40 @@ class CodeSnippetResponse(BaseModel):
     dependencies: Optional[List[str]] = None
 
 
+class SourceFile(BaseModel):
+    path: str
+    content: str
+    language: Optional[str] = None  # 为空时根据扩展名检测
+
+
+class ExtractRequest(BaseModel):
+    files: List[SourceFile]
+
+
+class ExtractedFile(BaseModel):
+    file_path: str
+    snippets: List[Dict[str, Any]]
+
+
+@app.post("/code/extract", response_model=List[ExtractedFile])
+async def extract_code_snippets(req: ExtractRequest) -> List[ExtractedFile]:
+    """
+    从源文件中提取代码片段（多进程解析和清洗，不写入数据库）
+    """
+    try:
+        parse_pool = get_parse_pool()
+        results = await parse_pool.parse_files_async(
+            [(f.path, f.content, f.language) for f in req.files]
+        )
+        return [
+            ExtractedFile(file_path=file_path, snippets=snippets)
+            for file_path, snippets in results
+        ]
+    except Exception as e:
+        from fastapi import HTTPException
+        raise HTTPException(status_code=500, detail=f"提取代码片段失败: {str(e)}")
+
+
 @app.get("/code", response_model=List[CodeSnippetResponse])
 async def list_code_snippets(
     skip: int = 0,
@@ -309,54 +522,35 @@ async def list_code_snippets(
     获取代码片段列表
     """
     try:
-        neo4j_service = get_neo4j_service()
-        with neo4j_service.driver.session() as session:
-            # 构建查询
-            query = "MATCH (c:CodeSnippet)"
-            conditions = []
-            params = {}
-            
-            if language:
-                conditions.append("c.language = $language")
-                params["language"] = language
-            if repo_name:
-                conditions.append("c.repo_name = $repo_name")
-                params["repo_name"] = repo_name
-            
-            if conditions:
-                query += " WHERE " + " AND ".join(conditions)
-            
-            query += " RETURN c.code_id as code_id, c.name as name, c.type as type, "
-            query += "c.language as language, c.file_path as file_path, "
-            query += "c.repo_name as repo_name, c.repo_url as repo_url "
-            query += f"SKIP $skip LIMIT $limit"
-            
-            params["skip"] = skip
-            params["limit"] = limit
-            
-            result = session.run(query, params)
-            codes = []
-            
-            milvus_service = get_milvus_service()
-            for record in result:
-                code_id = record["code_id"]
-                # 从Milvus获取代码内容
-                milvus_data = milvus_service.get_by_code_id(code_id)
-                # 获取依赖库
-                info = neo4j_service.get_code_snippet_info(code_id)
-                codes.append(CodeSnippetResponse(
-                    code_id=code_id,
-                    code=milvus_data.get("code", "") if milvus_data else "",
-                    name=record.get("name") or (milvus_data.get("name") if milvus_data else None),
-                    type=record.get("type") or (milvus_data.get("type") if milvus_data else None),
-                    language=record.get("language", "python") or (milvus_data.get("language", "python") if milvus_data else "python"),
-                    file_path=record.get("file_path") or (milvus_data.get("file_path") if milvus_data else None),
-                    repo_name=record.get("repo_name") or (milvus_data.get("repo_name") if milvus_data else None),
-                    repo_url=record.get("repo_url") or (milvus_data.get("repo_url") if milvus_data else None),
-                    dependencies=info.get("dependencies", []) if info else [],
-                ))
-            
-            return codes
+        neo4j_service = await get_async_neo4j_service()
+        records = await neo4j_service.list_code_snippets(
+            skip=skip,
+            limit=limit,
+            language=language,
+            repo_name=repo_name
+        )
+        
+        # 从Milvus批量获取代码内容
+        milvus_service = get_milvus_service()
+        milvus_rows = milvus_service.get_by_code_ids([record["code_id"] for record in records])
+        
+        codes = []
+        for record in records:
+            code_id = record["code_id"]
+            milvus_data = milvus_rows.get(code_id)
+            codes.append(CodeSnippetResponse(
+                code_id=code_id,
+                code=milvus_data.get("code", "") if milvus_data else "",
+                name=record.get("name") or (milvus_data.get("name") if milvus_data else None),
+                type=record.get("type") or (milvus_data.get("type") if milvus_data else None),
+                language=record.get("language", "python") or (milvus_data.get("language", "python") if milvus_data else "python"),
+                file_path=record.get("file_path") or (milvus_data.get("file_path") if milvus_data else None),
+                repo_name=record.get("repo_name") or (milvus_data.get("repo_name") if milvus_data else None),
+                repo_url=record.get("repo_url") or (milvus_data.get("repo_url") if milvus_data else None),
+                dependencies=record.get("dependencies") or [],
+            ))
+        
+        return codes
     except Exception as e:
         from fastapi import HTTPException
         raise HTTPException(status_code=500, detail=f"获取代码列表失败: {str(e)}")
@@ -368,8 +562,8 @@ async def get_code_snippet(code_id: str) -> CodeSnippetResponse:
     获取代码片段详情
     """
     try:
-        neo4j_service = get_neo4j_service()
-        info = neo4j_service.get_code_snippet_info(code_id)
+        neo4j_service = await get_async_neo4j_service()
+        info = await neo4j_service.get_code_snippet_info(code_id)
         
         if not info:
             from fastapi import HTTPException
@@ -397,6 +591,47 @@ async def get_code_snippet(code_id: str) -> CodeSnippetResponse:
         raise HTTPException(status_code=500, detail=f"获取代码片段失败: {str(e)}")
 
 
+def _update_lexical_index(snippet: Optional[Dict[str, Any]] = None, removed_code_id: Optional[str] = None):
+    """
+    把API写入的变化同步到词法索引（失败时只影响词法召回，不影响写入）
+    
+    只更新SQLite中的片段，检索时立即可见；快照由后台线程在写入停止后重新编译
+    
+    Args:
+        snippet: 新增或更新的代码片段
+        removed_code_id: 删除的代码片段ID
+    """
+    if not settings.LEXICAL_INDEX_ENABLED:
+        return
+    try:
+        lexical_index = get_lexical_index()
+        if removed_code_id:
+            lexical_index.remove_code_ids([removed_code_id])
+        if snippet:
+            lexical_index.add_snippets([snippet])
+    except Exception as e:
+        print(f"[!] 更新词法索引失败: {e}")
+
+
+def _insert_snippet_vectors(snippet: Dict[str, Any]) -> Optional[int]:
+    """
+    向量化单个代码片段并写入Milvus（长代码切分成多个窗口分别编码）
+    
+    Returns:
+        片段第一条记录的Milvus ID
+    """
+    embedding_service = get_embedding_service()
+    milvus_service = get_milvus_service()
+    
+    records = CodeChunker(embedding_service.tokenizer).chunk_snippets(
+        [snippet],
+        split_long=milvus_service.supports_chunks
+    )
+    vectors = embedding_service.encode_batch([record["embedding_text"] for record in records])
+    milvus_ids = milvus_service.insert_code_snippets(code_snippets=records, vectors=vectors)
+    return milvus_ids[0] if milvus_ids else None
+
+
 @app.post("/code", response_model=CodeSnippetResponse)
 async def add_code_snippet(snippet: CodeSnippetRequest) -> CodeSnippetResponse:
     """
@@ -408,30 +643,22 @@ async def add_code_snippet(snippet: CodeSnippetRequest) -> CodeSnippetResponse:
         # 生成唯一ID
         code_id = str(uuid.uuid4())
         
-        # 向量化代码
-        embedding_service = get_embedding_service()
-        code_vec = embedding_service.encode_code(snippet.code)
-        
-        # 插入到Milvus
-        milvus_service = get_milvus_service()
-        milvus_ids = milvus_service.insert_code_snippets(
-            code_snippets=[{
-                "code_id": code_id,
-                "code": snippet.code,
-                "name": snippet.name or "",
-                "type": snippet.type or "function",
-                "language": snippet.language,
-                "file_path": snippet.file_path or "",
-                "repo_name": snippet.repo_name or "",
-                "repo_url": snippet.repo_url or "",
-            }],
-            vectors=[code_vec]
-        )
-        milvus_id = milvus_ids[0] if milvus_ids else None
+        # 向量化代码并插入到Milvus
+        record = {
+            "code_id": code_id,
+            "code": snippet.code,
+            "name": snippet.name or "",
+            "type": snippet.type or "function",
+            "language": snippet.language,
+            "file_path": snippet.file_path or "",
+            "repo_name": snippet.repo_name or "",
+            "repo_url": snippet.repo_url or "",
+        }
+        milvus_id = _insert_snippet_vectors(record)
         
         # 插入到Neo4j
-        neo4j_service = get_neo4j_service()
-        neo4j_service.create_code_snippet_node(
+        neo4j_service = await get_async_neo4j_service()
+        await neo4j_service.create_code_snippet_node(
             code_id=code_id,
             name=snippet.name or "",
             code_type=snippet.type or "function",
@@ -444,10 +671,13 @@ async def add_code_snippet(snippet: CodeSnippetRequest) -> CodeSnippetResponse:
         
         # 创建依赖关系
         if snippet.dependencies:
-            neo4j_service.create_dependency_relationships(code_id, snippet.dependencies)
+            await neo4j_service.replace_dependency_relationships(code_id, snippet.dependencies)
         
         # 创建语言关系
-        neo4j_service.create_language_relationship(code_id, snippet.language)
+        await neo4j_service.create_language_relationship(code_id, snippet.language)
+        
+        # 同步词法索引
+        await asyncio.to_thread(_update_lexical_index, record)
         
         # 清除统计信息缓存（因为数据已更新）
         cache_service = get_cache_service()
@@ -479,8 +709,8 @@ async def update_code_snippet(
     """
     try:
         # 检查代码片段是否存在
-        neo4j_service = get_neo4j_service()
-        info = neo4j_service.get_code_snippet_info(code_id)
+        neo4j_service = await get_async_neo4j_service()
+        info = await neo4j_service.get_code_snippet_info(code_id)
         
         if not info:
             from fastapi import HTTPException
@@ -488,29 +718,23 @@ async def update_code_snippet(
         
         # 更新Milvus中的数据（需要删除旧数据并插入新数据）
         milvus_service = get_milvus_service()
-        # 删除旧数据
+        # 删除旧数据（包括旧代码的全部分块）
         milvus_service.delete_by_code_id(code_id)
-        # 向量化新代码
-        embedding_service = get_embedding_service()
-        code_vec = embedding_service.encode_code(snippet.code)
-        # 插入新数据
-        milvus_ids = milvus_service.insert_code_snippets(
-            code_snippets=[{
-                "code_id": code_id,
-                "code": snippet.code,
-                "name": snippet.name or "",
-                "type": snippet.type or "function",
-                "language": snippet.language,
-                "file_path": snippet.file_path or "",
-                "repo_name": snippet.repo_name or "",
-                "repo_url": snippet.repo_url or "",
-            }],
-            vectors=[code_vec]
-        )
-        milvus_id = milvus_ids[0] if milvus_ids else None
+        # 向量化新代码并插入新数据
+        record = {
+            "code_id": code_id,
+            "code": snippet.code,
+            "name": snippet.name or "",
+            "type": snippet.type or "function",
+            "language": snippet.language,
+            "file_path": snippet.file_path or "",
+            "repo_name": snippet.repo_name or "",
+            "repo_url": snippet.repo_url or "",
+        }
+        milvus_id = _insert_snippet_vectors(record)
         
         # 更新Neo4j中的节点
-        neo4j_service.create_code_snippet_node(
+        await neo4j_service.create_code_snippet_node(
             code_id=code_id,
             name=snippet.name or "",
             code_type=snippet.type or "function",
@@ -521,18 +745,11 @@ async def update_code_snippet(
             milvus_id=milvus_id
         )
         
-        # 删除旧依赖关系，创建新依赖关系
-        with neo4j_service.driver.session() as session:
-            # 删除旧依赖关系
-            delete_query = """
-            MATCH (c:CodeSnippet {code_id: $code_id})-[r:DEPENDS_ON]->()
-            DELETE r
-            """
-            session.run(delete_query, code_id=code_id)
+        # 删除旧依赖关系，创建新依赖关系（同一个写事务）
+        await neo4j_service.replace_dependency_relationships(code_id, snippet.dependencies or [])
         
-        # 创建新依赖关系
-        if snippet.dependencies:
-            neo4j_service.create_dependency_relationships(code_id, snippet.dependencies)
+        # 同步词法索引
+        await asyncio.to_thread(_update_lexical_index, record)
         
         # 清除统计信息缓存（因为数据已更新）
         cache_service = get_cache_service()
@@ -563,8 +780,8 @@ async def delete_code_snippet(code_id: str):
     """
     try:
         # 检查代码片段是否存在
-        neo4j_service = get_neo4j_service()
-        info = neo4j_service.get_code_snippet_info(code_id)
+        neo4j_service = await get_async_neo4j_service()
+        info = await neo4j_service.get_code_snippet_info(code_id)
         
         if not info:
             from fastapi import HTTPException
@@ -575,13 +792,10 @@ async def delete_code_snippet(code_id: str):
         milvus_deleted = milvus_service.delete_by_code_id(code_id)
         
         # 从Neo4j删除节点和关系
-        with neo4j_service.driver.session() as session:
-            # 删除节点及其所有关系
-            query = """
-            MATCH (c:CodeSnippet {code_id: $code_id})
-            DETACH DELETE c
-            """
-            session.run(query, code_id=code_id)
+        await neo4j_service.delete_code_snippet(code_id)
+        
+        # 从词法索引删除
+        await asyncio.to_thread(_update_lexical_index, None, code_id)
         
         if not milvus_deleted:
             from fastapi import HTTPException
@@ -0,0 +1,381 @@
+"""
+异步Neo4j知识图谱服务 - 供API使用
+
+基于AsyncGraphDatabase，请求处理函数可以直接await查询，不会阻塞事件循环。
+读查询使用读事务（集群部署时由驱动路由到读副本），写查询使用写事务；
+事务函数在遇到可重试的错误（如主节点切换）时由驱动自动重试。
+"""
+
+import asyncio
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.services.neo4j_service import neo4j_driver_options
+
+
+def _snippet_info(record: Any) -> Dict:
+    """把代码片段查询结果转换为字典"""
+    node = record["c"]
+    return {
+        "code_id": node["code_id"],
+        "name": node.get("name"),
+        "type": node.get("type"),
+        "language": node.get("language"),
+        "file_path": node.get("file_path"),
+        "repo_name": node.get("repo_name"),
+        "repo_url": node.get("repo_url"),
+        "dependencies": record["dependencies"],
+        "languages": record["languages"],
+        "similar_codes": record["similar_codes"],
+    }
+
+
+async def _fetch_all(tx: Any, query: str, params: Dict) -> List[Any]:
+    """在事务中执行查询并读取全部记录（记录必须在事务结束前读取）"""
+    result = await tx.run(query, params)
+    return [record async for record in result]
+
+
+class AsyncNeo4jService:
+    """异步Neo4j知识图谱服务"""
+    
+    def __init__(self):
+        """初始化异步Neo4j服务（连接在verify_connectivity中验证）"""
+        self.uri = settings.NEO4J_URI
+        self.user = settings.NEO4J_USER
+        self.password = settings.NEO4J_PASSWORD
+        
+        if not self.password:
+            raise ValueError("未配置NEO4J_PASSWORD，请在.env文件中设置")
+        
+        # 延迟导入neo4j驱动，只在创建服务时导入
+        from neo4j import AsyncGraphDatabase
+        self.driver = AsyncGraphDatabase.driver(
+            self.uri,
+            auth=(self.user, self.password),
+            **neo4j_driver_options()
+        )
+    
+    async def verify_connectivity(self):
+        """验证连接"""
+        try:
+            await self.driver.verify_connectivity()
+            print(f"✅ 已连接到Neo4j（异步）: {self.uri}")
+        except Exception as e:
+            raise Exception(f"连接Neo4j失败: {str(e)}")
+    
+    async def close(self):
+        """关闭连接"""
+        await self.driver.close()
+    
+    async def _read(self, query: str, **params) -> List[Any]:
+        """在读事务中执行查询"""
+        async with self.driver.session() as session:
+            return await session.execute_read(_fetch_all, query, params)
+    
+    async def _write(self, query: str, **params) -> List[Any]:
+        """在写事务中执行查询"""
+        async with self.driver.session() as session:
+            return await session.execute_write(_fetch_all, query, params)
+    
+    async def get_code_snippet_info(self, code_id: str) -> Optional[Dict]:
+        """
+        获取代码片段信息及其关联
+        
+        Args:
+            code_id: 代码片段ID
+        
+        Returns:
+            代码片段信息及关联数据（不存在时返回None）
+        """
+        infos = await self.get_code_snippets_info([code_id])
+        return infos.get(code_id)
+    
+    async def get_code_snippets_info(self, code_ids: List[str]) -> Dict[str, Dict]:
+        """
+        批量获取代码片段信息（一次查询，避免检索结果逐条查询）
+        
+        Args:
+            code_ids: 代码片段ID列表
+        
+        Returns:
+            {code_id: 代码片段信息}，不存在的ID不在结果中
+        """
+        if not code_ids:
+            return {}
+        
+        query = """
+        UNWIND $code_ids AS code_id
+        MATCH (c:CodeSnippet {code_id: code_id})
+        OPTIONAL MATCH (c)-[:DEPENDS_ON]->(d:Library)
+        OPTIONAL MATCH (c)-[:WRITTEN_IN]->(l:Language)
+        OPTIONAL MATCH (c)-[:SIMILAR_TO]->(similar:CodeSnippet)
+        RETURN c,
+               collect(DISTINCT d.name) as dependencies,
+               collect(DISTINCT l.name) as languages,
+               collect(DISTINCT similar.code_id) as similar_codes
+        """
+        records = await self._read(query, code_ids=list(dict.fromkeys(code_ids)))
+        return {record["c"]["code_id"]: _snippet_info(record) for record in records}
+    
+    async def list_code_snippets(
+        self,
+        skip: int = 0,
+        limit: int = 100,
+        language: Optional[str] = None,
+        repo_name: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        分页获取代码片段列表（包含依赖库）
+        
+        Args:
+            skip: 跳过的数量
+            limit: 返回数量限制
+            language: 按语言过滤
+            repo_name: 按仓库过滤
+        
+        Returns:
+            代码片段列表
+        """
+        conditions = []
+        params: Dict[str, Any] = {"skip": skip, "limit": limit}
+        if language:
+            conditions.append("c.language = $language")
+            params["language"] = language
+        if repo_name:
+            conditions.append("c.repo_name = $repo_name")
+            params["repo_name"] = repo_name
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"""
+        MATCH (c:CodeSnippet)
+        {where}
+        WITH c SKIP $skip LIMIT $limit
+        OPTIONAL MATCH (c)-[:DEPENDS_ON]->(d:Library)
+        RETURN c.code_id as code_id, c.name as name, c.type as type,
+               c.language as language, c.file_path as file_path,
+               c.repo_name as repo_name, c.repo_url as repo_url,
+               collect(DISTINCT d.name) as dependencies
+        """
+        records = await self._read(query, **params)
+        return [dict(record) for record in records]
+    
+    async def search_by_dependency(self, library_name: str, limit: int = 10) -> List[Dict]:
+        """
+        根据依赖库搜索代码片段
+        
+        Args:
+            library_name: 依赖库名称
+            limit: 返回数量限制
+        
+        Returns:
+            代码片段列表
+        """
+        query = """
+        MATCH (c:CodeSnippet)-[:DEPENDS_ON]->(d:Library {name: $lib_name})
+        RETURN c.code_id as code_id,
+               c.name as name,
+               c.type as type,
+               c.language as language,
+               c.repo_name as repo_name
+        LIMIT $limit
+        """
+        records = await self._read(query, lib_name=library_name, limit=limit)
+        return [dict(record) for record in records]
+    
+    async def get_statistics(self) -> Dict:
+        """获取知识图谱统计信息"""
+        queries = {
+            "code_snippets": "MATCH (c:CodeSnippet) RETURN count(c) as count",
+            "libraries": "MATCH (l:Library) RETURN count(l) as count",
+            "languages": "MATCH (lang:Language) RETURN count(lang) as count",
+            "dependencies": "MATCH ()-[r:DEPENDS_ON]->() RETURN count(r) as count",
+        }
+        
+        async def count_all(tx: Any) -> Dict:
+            stats = {}
+            for key, query in queries.items():
+                result = await tx.run(query)
+                stats[key] = (await result.single())["count"]
+            return stats
+        
+        # 所有计数在同一个读事务中完成
+        async with self.driver.session() as session:
+            return await session.execute_read(count_all)
+    
+    async def get_language_distribution(self) -> Dict[str, int]:
+        """获取语言分布统计"""
+        query = """
+        MATCH (c:CodeSnippet)
+        WHERE c.language IS NOT NULL
+        RETURN c.language as language, count(c) as count
+        ORDER BY count DESC
+        """
+        records = await self._read(query)
+        return {record["language"]: record["count"] for record in records}
+    
+    async def get_repo_distribution(self, limit: int = 20) -> Dict[str, int]:
+        """获取仓库分布统计"""
+        query = """
+        MATCH (c:CodeSnippet)
+        WHERE c.repo_name IS NOT NULL
+        RETURN c.repo_name as repo_name, count(c) as count
+        ORDER BY count DESC
+        LIMIT $limit
+        """
+        records = await self._read(query, limit=limit)
+        return {record["repo_name"]: record["count"] for record in records}
+    
+    async def get_top_dependencies(self, limit: int = 20) -> Dict[str, int]:
+        """获取热门依赖库统计"""
+        query = """
+        MATCH (c:CodeSnippet)-[:DEPENDS_ON]->(l:Library)
+        RETURN l.name as library, count(c) as count
+        ORDER BY count DESC
+        LIMIT $limit
+        """
+        records = await self._read(query, limit=limit)
+        return {record["library"]: record["count"] for record in records}
+    
+    async def create_code_snippet_node(
+        self,
+        code_id: str,
+        name: str,
+        code_type: str,
+        language: str,
+        file_path: str,
+        repo_name: str,
+        repo_url: str,
+        milvus_id: Optional[int] = None
+    ) -> bool:
+        """
+        创建（或更新）代码片段节点
+        
+        Args:
+            code_id: 代码片段唯一ID
+            name: 函数/类名称
+            code_type: 类型（function/class）
+            language: 编程语言
+            file_path: 文件路径
+            repo_name: 仓库名称
+            repo_url: 仓库URL
+            milvus_id: Milvus中的ID（用于关联）
+        
+        Returns:
+            是否成功
+        """
+        query = """
+        MERGE (c:CodeSnippet {code_id: $code_id})
+        SET c.name = $name,
+            c.type = $code_type,
+            c.language = $language,
+            c.file_path = $file_path,
+            c.repo_name = $repo_name,
+            c.repo_url = $repo_url,
+            c.milvus_id = $milvus_id
+        RETURN c
+        """
+        records = await self._write(
+            query,
+            code_id=code_id,
+            name=name,
+            code_type=code_type,
+            language=language,
+            file_path=file_path,
+            repo_name=repo_name,
+            repo_url=repo_url,
+            milvus_id=milvus_id
+        )
+        return bool(records)
+    
+    async def replace_dependency_relationships(
+        self,
+        code_id: str,
+        dependencies: List[str]
+    ) -> bool:
+        """
+        用新的依赖库列表替换代码片段的依赖关系（一个写事务）
+        
+        Args:
+            code_id: 代码片段ID
+            dependencies: 依赖库列表（为空时只删除旧关系）
+        
+        Returns:
+            是否成功
+        """
+        query = """
+        MATCH (c:CodeSnippet {code_id: $code_id})
+        OPTIONAL MATCH (c)-[r:DEPENDS_ON]->()
+        DELETE r
+        WITH DISTINCT c
+        UNWIND $dependencies AS dep_name
+        MERGE (d:Library {name: dep_name})
+        MERGE (c)-[:DEPENDS_ON]->(d)
+        """
+        await self._write(query, code_id=code_id, dependencies=list(dependencies or []))
+        return True
+    
+    async def create_language_relationship(self, code_id: str, language: str) -> bool:
+        """
+        创建语言关系
+        
+        Args:
+            code_id: 代码片段ID
+            language: 编程语言
+        
+        Returns:
+            是否成功
+        """
+        query = """
+        MATCH (c:CodeSnippet {code_id: $code_id})
+        MERGE (l:Language {name: $lang_name})
+        MERGE (c)-[:WRITTEN_IN]->(l)
+        """
+        await self._write(query, code_id=code_id, lang_name=language)
+        return True
+    
+    async def delete_code_snippet(self, code_id: str) -> int:
+        """
+        删除代码片段节点及其所有关系
+        
+        Args:
+            code_id: 代码片段ID
+        
+        Returns:
+            删除的节点数量
+        """
+        query = """
+        MATCH (c:CodeSnippet {code_id: $code_id})
+        DETACH DELETE c
+        RETURN count(c) as count
+        """
+        records = await self._write(query, code_id=code_id)
+        return records[0]["count"] if records else 0
+
+
+# 全局实例
+_async_neo4j_service: Optional[AsyncNeo4jService] = None
+_async_neo4j_service_lock = asyncio.Lock()
+
+
+async def get_async_neo4j_service() -> AsyncNeo4jService:
+    """获取异步Neo4j服务实例（单例模式，首次调用时验证连接）"""
+    global _async_neo4j_service
+    if _async_neo4j_service is None:
+        async with _async_neo4j_service_lock:
+            if _async_neo4j_service is None:
+                service = AsyncNeo4jService()
+                try:
+                    await service.verify_connectivity()
+                except Exception:
+                    await service.close()
+                    raise
+                _async_neo4j_service = service
+    return _async_neo4j_service
+
+
+async def close_async_neo4j_service():
+    """关闭异步Neo4j服务（应用退出时调用）"""
+    global _async_neo4j_service
+    if _async_neo4j_service is not None:
+        await _async_neo4j_service.close()
+        _async_neo4j_service = None
@@ -0,0 +1,190 @@
+"""
+代码分块服务 - 把长代码片段按token数切分成有重叠的窗口
+
+CodeBERT最多只能编码512个token，超出部分会被截断。长片段按行切分成
+不超过CHUNK_MAX_TOKENS的窗口分别编码，每个窗口作为一条Milvus记录，
+通过parent_code_id关联到原片段；检索时再把窗口命中聚合回原片段。
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from app.core.config import settings
+
+
+# 没有tokenizer时用于估算token数
+_APPROX_TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]')
+
+# tokenizer为输入添加的特殊token数（<s> 和 </s>）
+_SPECIAL_TOKENS = 2
+
+
+class CodeChunker:
+    """按token预算把代码切分成有重叠的行窗口"""
+    
+    def __init__(
+        self,
+        tokenizer: Any = None,
+        max_tokens: Optional[int] = None,
+        overlap_tokens: Optional[int] = None
+    ):
+        """
+        初始化分块器
+        
+        Args:
+            tokenizer: 嵌入模型的tokenizer（为None时按正则估算token数）
+            max_tokens: 每个窗口的token上限，包含名称前缀（默认使用CHUNK_MAX_TOKENS配置）
+            overlap_tokens: 相邻窗口重叠的token数（默认使用CHUNK_OVERLAP_TOKENS配置）
+        """
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens or settings.CHUNK_MAX_TOKENS
+        self.overlap_tokens = (
+            overlap_tokens if overlap_tokens is not None else settings.CHUNK_OVERLAP_TOKENS
+        )
+    
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """
+        统计每段文本的token数（不含特殊token）
+        
+        Args:
+            texts: 文本列表
+        
+        Returns:
+            token数列表
+        """
+        if not texts:
+            return []
+        if self.tokenizer is not None:
+            encoded = self.tokenizer(texts, add_special_tokens=False)["input_ids"]
+            return [len(ids) for ids in encoded]
+        return [len(_APPROX_TOKEN_PATTERN.findall(text)) + 1 for text in texts]
+    
+    def split(self, code: str, prefix: str = "") -> List[Tuple[int, int]]:
+        """
+        把代码按行切分成窗口
+        
+        Args:
+            code: 代码文本
+            prefix: 每个窗口前都会拼接的文本（如名称和类型），占用token预算
+        
+        Returns:
+            窗口列表 [(起始行, 结束行)]，行号从0开始、左闭右开；不需要切分时只有一个窗口
+        """
+        lines = code.split('\n')
+        # 每行按带换行符计数，逐行计数的总和略大于整体编码，窗口因此偏保守
+        counts = self.count_tokens([line + '\n' for line in lines])
+        prefix_tokens = self.count_tokens([prefix])[0] if prefix else 0
+        budget = max(1, self.max_tokens - prefix_tokens - _SPECIAL_TOKENS)
+        
+        if sum(counts) <= budget:
+            return [(0, len(lines))]
+        
+        windows = []
+        start = 0
+        while start < len(lines):
+            end = start
+            total = 0
+            # 至少包含一行（单行超出预算时由模型截断）
+            while end < len(lines) and (end == start or total + counts[end] <= budget):
+                total += counts[end]
+                end += 1
+            windows.append((start, end))
+            if end >= len(lines):
+                break
+            
+            # 下一个窗口从末尾往回退overlap_tokens个token开始，但必须前进
+            next_start = end
+            overlap = 0
+            while next_start - 1 > start and overlap + counts[next_start - 1] <= self.overlap_tokens:
+                next_start -= 1
+                overlap += counts[next_start]
+            start = next_start
+        
+        return windows
+    
+    def chunk_snippets(self, snippets: List[Dict], split_long: bool = True) -> List[Dict]:
+        """
+        把代码片段展开为待编码的记录
+        
+        每个片段的第一条记录使用片段自己的code_id并保存完整代码（供检索结果展示），
+        其余窗口的code_id为 "{code_id}#{序号}"，只保存窗口内的代码。
+        所有记录的parent_code_id都是片段的code_id。
+        
+        Args:
+            snippets: 代码片段列表（需要已有code_id）
+            split_long: 是否切分长片段（为False时每个片段一条记录，超出部分由模型截断）
+        
+        Returns:
+            记录列表，每条记录在片段字段之外包含：
+            parent_code_id, chunk_index, embedding_text
+        """
+        records = []
+        for snippet in snippets:
+            code = snippet.get('code', '')
+            prefix = f"{snippet.get('name', '')} {snippet.get('type', '')} "
+            windows = self.split(code, prefix) if split_long else [(0, code.count('\n') + 1)]
+            lines = code.split('\n')
+            
+            for index, (start, end) in enumerate(windows):
+                window_code = '\n'.join(lines[start:end])
+                record = dict(snippet)
+                record['parent_code_id'] = snippet['code_id']
+                record['chunk_index'] = index
+                record['embedding_text'] = prefix + window_code
+                if index > 0:
+                    record['code_id'] = f"{snippet['code_id']}#{index}"
+                    record['code'] = window_code
+                records.append(record)
+        
+        return records
+
+
+def aggregate_chunk_hits(
+    hits: List[Dict],
+    mode: Optional[str] = None
+) -> List[Dict]:
+    """
+    把窗口命中聚合回原片段
+    
+    Milvus返回L2距离，先换算为相似度 1 / (1 + distance)，
+    再按parent_code_id分组：max取组内最高相似度，sum把组内相似度相加
+    （多个窗口同时命中的长片段排名更靠前，分数可能大于1）。
+    
+    Args:
+        hits: Milvus检索结果（按距离升序）
+        mode: 聚合方式 max 或 sum（默认使用CHUNK_AGGREGATION配置）
+    
+    Returns:
+        每个原片段一条结果，按聚合后的相似度降序；结果中增加：
+        similarity（聚合相似度）、matched_chunks（命中的窗口数）；
+        代表记录优先取片段的第一条记录（包含完整代码），否则取最相似的窗口
+    """
+    mode = mode or settings.CHUNK_AGGREGATION
+    if mode not in ("max", "sum"):
+        raise ValueError(f"不支持的聚合方式: {mode}（可选 max、sum）")
+    
+    groups: Dict[str, Dict] = {}
+    for hit in hits:
+        similarity = 1.0 / (1.0 + float(hit.get("score", 0.0)))
+        parent_id = hit.get("parent_code_id") or hit.get("code_id")
+        group = groups.get(parent_id)
+        
+        if group is None:
+            group = groups[parent_id] = dict(hit)
+            group["parent_code_id"] = parent_id
+            group["similarity"] = similarity
+            group["matched_chunks"] = 1
+            continue
+        
+        group["matched_chunks"] += 1
+        if mode == "sum":
+            group["similarity"] += similarity
+        else:
+            group["similarity"] = max(group["similarity"], similarity)
+        
+        # 命中片段的第一条记录时，用它的完整代码替换窗口代码（保留最小距离）
+        if hit.get("code_id") == parent_id:
+            best_score = min(group["score"], hit.get("score", group["score"]))
+            group.update({key: value for key, value in hit.items() if key != "score"})
+            group["score"] = best_score
+    
+    return sorted(groups.values(), key=lambda group: group["similarity"], reverse=True)
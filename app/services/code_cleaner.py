@@ -2,10 +2,69 @@
 代码清洗服务 - 过滤和优化代码片段
 """
 
+import hashlib
 import re
+from functools import lru_cache
 from typing import List, Dict, Optional
 
 
+# 注释行前缀
+_HASH_COMMENT_PREFIXES = ('#',)
+_C_COMMENT_PREFIXES = ('//', '/*')
+_HASH_COMMENT_LANGUAGES = {'python'}
+
+# 明显的未完成标记：TODO/FIXME标记（所有语言）
+_ERROR_PATTERN = re.compile(r'TODO.*FIXME', re.IGNORECASE)
+# Python中的省略号通常表示未完成的函数体；其他语言中是展开运算符、可变参数等正常语法
+_ELLIPSIS_PATTERN = re.compile(r'\.\.\.')
+_ELLIPSIS_LANGUAGES = {'python'}
+
+# 括号检查前需要去掉的字符串字面量和注释
+_TRIPLE_QUOTED = r'"""[\s\S]*?"""|\'\'\'[\s\S]*?\'\'\''
+_DOUBLE_QUOTED = r'"(?:\\.|[^"\\\n])*"'
+_SINGLE_QUOTED = r'\'(?:\\.|[^\'\\\n])*\''
+# 字符字面量只有一个字符（或一个转义序列），避免把Rust生命周期'a当作字符串开头
+_CHAR_LITERAL = r'\'(?:\\[^\n]{1,9}?|[^\'\\\n])\''
+_TEMPLATE_LITERAL = r'`(?:\\.|[^`\\])*`'
+_HASH_COMMENT = r'#[^\n]*'
+_C_COMMENT = r'//[^\n]*|/\*[\s\S]*?\*/'
+_CHAR_LITERAL_LANGUAGES = {'cpp', 'java', 'csharp', 'rust', 'go'}
+_TEMPLATE_LITERAL_LANGUAGES = {'javascript', 'typescript', 'tsx'}
+
+_NON_BRACKET_PATTERN = re.compile(r'[^()\[\]{}]+')
+_BRACKET_PAIRS = {')': '(', ']': '[', '}': '{'}
+
+
+def content_hash(code: str) -> str:
+    """
+    计算代码内容的稳定哈希（跨进程、跨运行保持一致）
+    
+    Args:
+        code: 代码内容（首尾空白不参与计算）
+    
+    Returns:
+        32位十六进制的blake2b摘要
+    """
+    return hashlib.blake2b(code.strip().encode('utf-8'), digest_size=16).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def _strip_pattern(language: Optional[str]) -> "re.Pattern":
+    """获取语言对应的字符串/注释匹配正则（按语言缓存编译结果）"""
+    if language is None:
+        # 未知语言：同时识别两类注释，单引号按普通字符串处理
+        parts = [_TRIPLE_QUOTED, _DOUBLE_QUOTED, _SINGLE_QUOTED, _HASH_COMMENT, _C_COMMENT]
+    elif language in _HASH_COMMENT_LANGUAGES:
+        parts = [_TRIPLE_QUOTED, _DOUBLE_QUOTED, _SINGLE_QUOTED, _HASH_COMMENT]
+    elif language in _CHAR_LITERAL_LANGUAGES:
+        parts = [_DOUBLE_QUOTED, _CHAR_LITERAL, _C_COMMENT]
+    elif language in _TEMPLATE_LITERAL_LANGUAGES:
+        parts = [_DOUBLE_QUOTED, _SINGLE_QUOTED, _TEMPLATE_LITERAL, _C_COMMENT]
+    else:
+        parts = [_DOUBLE_QUOTED, _SINGLE_QUOTED, _C_COMMENT]
+    return re.compile('|'.join(parts))
+
+
 class CodeCleaner:
     """代码清洗器，用于过滤和优化代码片段"""
     
@@ -27,113 +86,136 @@ class CodeCleaner:
         self.max_lines = max_lines
         self.min_comment_ratio = min_comment_ratio
     
-    def clean_code_snippet(self, code: str) -> Optional[str]:
+    def clean_code_snippet(
+        self,
+        code: str,
+        language: Optional[str] = None,
+        has_error: Optional[bool] = None
+    ) -> Optional[str]:
         """
         清洗单个代码片段
         
+        只遍历一次代码行，同时统计非空行和注释行。
+        
         Args:
             code: 原始代码
+            language: 编程语言（用于确定注释语法，为None时同时识别#和//注释）
+            has_error: tree-sitter语法树中该片段是否有错误节点；
+                提供时直接据此判断语法，不再做括号扫描
         
         Returns:
             清洗后的代码，如果不符合要求则返回None
         """
-        if not code or not code.strip():
+        if not code:
             return None
         
         # 移除前后空白
         code = code.strip()
+        if not code:
+            return None
         
         # 检查代码行数
         lines = code.split('\n')
-        non_empty_lines = [line for line in lines if line.strip()]
-        
-        if len(non_empty_lines) < self.min_lines:
+        if len(lines) > self.max_lines:
             return None
         
-        if len(lines) > self.max_lines:
+        comment_prefixes = self._comment_prefixes(language)
+        non_empty_count = 0
+        comment_count = 0
+        
+        for line in lines:
+            stripped = line.strip()
+            if not stripped:
+                continue
+            non_empty_count += 1
+            if stripped.startswith(comment_prefixes) or stripped.endswith('*/'):
+                comment_count += 1
+        
+        if non_empty_count < self.min_lines:
             return None
         
         # 检查注释比例
-        comment_count = sum(1 for line in lines if self._is_comment_line(line))
-        comment_ratio = comment_count / len(lines) if lines else 0
-        
-        if comment_ratio > self.min_comment_ratio:
+        if comment_count / len(lines) > self.min_comment_ratio:
             return None
         
-        # 检查代码完整性（简单检查：是否有语法错误标记）
-        if self._has_syntax_errors(code):
+        # 检查代码完整性：优先使用解析器的结果，否则做简单检查
+        if self._has_syntax_errors(code, language, has_error):
             return None
         
         return code
     
-    def _is_comment_line(self, line: str) -> bool:
-        """判断是否为注释行"""
-        stripped = line.strip()
-        # Python注释
-        if stripped.startswith('#'):
-            return True
-        # Java/C++单行注释
-        if stripped.startswith('//'):
-            return True
-        # Java/C++多行注释开始/结束
-        if stripped.startswith('/*') or stripped.endswith('*/'):
-            return True
-        # 空行不算注释
-        if not stripped:
-            return False
-        return False
+    def clean_many(
+        self,
+        codes: List[str],
+        language: Optional[str] = None,
+        has_errors: Optional[List[Optional[bool]]] = None
+    ) -> List[Optional[str]]:
+        """
+        批量清洗代码片段
+        
+        Args:
+            codes: 原始代码列表
+            language: 编程语言
+            has_errors: 与codes对应的语法树错误标记（可选）
+        
+        Returns:
+            清洗结果列表，与输入一一对应，不符合要求的位置为None
+        """
+        clean = self.clean_code_snippet
+        if has_errors is None:
+            return [clean(code, language) for code in codes]
+        return [clean(code, language, has_error) for code, has_error in zip(codes, has_errors)]
+    
+    @staticmethod
+    def _comment_prefixes(language: Optional[str]) -> tuple:
+        """获取语言的注释行前缀"""
+        if language is None:
+            return _HASH_COMMENT_PREFIXES + _C_COMMENT_PREFIXES
+        if language in _HASH_COMMENT_LANGUAGES:
+            return _HASH_COMMENT_PREFIXES
+        return _C_COMMENT_PREFIXES
     
-    def _has_syntax_errors(self, code: str) -> bool:
-        """简单检查是否有明显的语法错误"""
-        # 检查括号是否匹配
-        if not self._check_brackets(code):
+    def _has_syntax_errors(
+        self,
+        code: str,
+        language: Optional[str] = None,
+        has_error: Optional[bool] = None
+    ) -> bool:
+        """检查是否有语法错误或明显的未完成标记"""
+        # 检查是否有明显的错误标记（省略号只对Python和未知语言检查）
+        if _ERROR_PATTERN.search(code):
+            return True
+        if (language is None or language in _ELLIPSIS_LANGUAGES) and _ELLIPSIS_PATTERN.search(code):
             return True
         
-        # 检查是否有明显的错误标记
-        error_patterns = [
-            r'\.\.\.',  # Python省略号（可能表示未完成）
-            r'TODO.*FIXME',  # TODO/FIXME标记
-        ]
-        
-        for pattern in error_patterns:
-            if re.search(pattern, code, re.IGNORECASE):
-                return True
+        # 解析器已经给出结论（语法树中的ERROR/MISSING节点）
+        if has_error is not None:
+            return has_error
         
-        return False
+        # 没有语法树时退回到括号匹配检查
+        return not self._check_brackets(code, language)
     
-    def _check_brackets(self, code: str) -> bool:
-        """检查括号是否匹配"""
-        brackets = {'(': ')', '[': ']', '{': '}'}
-        stack = []
+    def _check_brackets(self, code: str, language: Optional[str] = None) -> bool:
+        """
+        检查括号是否匹配
         
-        in_string = False
-        string_char = None
-        
-        for char in code:
-            # 处理字符串
-            if char in ('"', "'") and (not stack or stack[-1] != '\\'):
-                if not in_string:
-                    in_string = True
-                    string_char = char
-                elif char == string_char:
-                    in_string = False
-                    string_char = None
-                continue
-            
-            if in_string:
-                continue
-            
-            # 处理括号
-            if char in brackets:
+        先用预编译正则去掉字符串和注释，再去掉所有非括号字符，
+        最后只对剩下的括号做栈匹配。
+        """
+        strip_pattern = _strip_pattern(language)
+        brackets = _NON_BRACKET_PATTERN.sub('', strip_pattern.sub('', code))
+        if not brackets:
+            return True
+        
+        stack = []
+        for char in brackets:
+            opening = _BRACKET_PAIRS.get(char)
+            if opening is None:
                 stack.append(char)
-            elif char in brackets.values():
-                if not stack:
-                    return False
-                opening = stack.pop()
-                if brackets[opening] != char:
-                    return False
-        
-        return len(stack) == 0
+            elif not stack or stack.pop() != opening:
+                return False
+        
+        return not stack
     
     def remove_duplicates(self, code_snippets: List[Dict]) -> List[Dict]:
         """
@@ -150,8 +232,8 @@ class CodeCleaner:
         
         for snippet in code_snippets:
             code = snippet.get('code', '')
-            # 使用代码的hash作为唯一标识
-            code_hash = hash(code.strip())
+            # 使用稳定的内容哈希作为唯一标识（内置hash()每个进程的盐不同）
+            code_hash = content_hash(code)
             
             if code_hash not in seen:
                 seen.add(code_hash)
@@ -161,7 +243,10 @@ class CodeCleaner:
     
     def extract_dependencies(self, code: str, language: str) -> List[str]:
         """
-        提取代码依赖
+        提取代码依赖（只看片段文本中的导入语句）
+        
+        函数片段通常不包含文件顶部的导入，有完整文件内容时
+        应使用 CodeParser.parse_file 得到文件级依赖。
         
         Args:
             code: 代码文本
@@ -2,9 +2,10 @@
 代码解析服务 - 使用tree-sitter提取代码片段
 """
 
-import os
-from typing import List, Dict, Optional
-from pathlib import Path
+from collections import OrderedDict
+from typing import Callable, List, Dict, Optional, Tuple
+from app.services.languages import get_language_spec, detect_language, list_languages
+from app.services.code_cleaner import content_hash
 
 try:
     import tree_sitter
@@ -20,49 +21,54 @@ except ImportError:
 class CodeParser:
     """代码解析器，用于提取函数、类等代码片段"""
     
-    def __init__(self):
-        """初始化代码解析器"""
+    def __init__(self, dependency_cache_size: int = 1024):
+        """
+        初始化代码解析器（各语言的解析器在首次使用时创建）
+        
+        Args:
+            dependency_cache_size: 按文件内容缓存的依赖列表数量
+        """
         if not HAS_TREE_SITTER:
             raise ImportError("tree-sitter未安装，请运行: pip install tree-sitter")
         
         self.parsers = {}
-        self._init_parsers()
+        # 语法加载失败的语言，避免重复尝试和重复告警
+        self._failed_languages = set()
+        # (语言, 文件内容哈希) -> 文件级依赖列表
+        self._dependency_cache: "OrderedDict[Tuple[str, str], List[str]]" = OrderedDict()
+        self._dependency_cache_size = dependency_cache_size
     
-    def _init_parsers(self):
-        """初始化各语言的解析器"""
-        # 注意：tree-sitter语言库需要先编译
-        # 这里使用已安装的语言库
+    def get_parser(self, language: str) -> Optional["Parser"]:
+        """
+        获取语言对应的解析器，首次调用时加载语法
+        
+        Args:
+            language: 编程语言
+        
+        Returns:
+            解析器，语言未注册或语法库不可用时返回None
+        """
+        parser = self.parsers.get(language)
+        if parser is not None or language in self._failed_languages:
+            return parser
+        
+        spec = get_language_spec(language)
+        if spec is None:
+            return None
+        
         try:
-            # Python
-            try:
-                from tree_sitter_python import language as python_language_func
-                # tree-sitter 0.25+ API: 需要将language函数的结果包装为Language对象
-                python_lang = Language(python_language_func())
-                parser = Parser(python_lang)
-                self.parsers['python'] = parser
-            except (ImportError, AttributeError, TypeError) as e:
-                print(f"警告: tree-sitter-python初始化失败: {e}")
-            
-            # Java
-            try:
-                from tree_sitter_java import language as java_language_func
-                java_lang = Language(java_language_func())
-                parser = Parser(java_lang)
-                self.parsers['java'] = parser
-            except (ImportError, AttributeError, TypeError) as e:
-                print(f"警告: tree-sitter-java初始化失败: {e}")
-            
-            # C++
-            try:
-                from tree_sitter_cpp import language as cpp_language_func
-                cpp_lang = Language(cpp_language_func())
-                parser = Parser(cpp_lang)
-                self.parsers['cpp'] = parser
-            except (ImportError, AttributeError, TypeError) as e:
-                print(f"警告: tree-sitter-cpp初始化失败: {e}")
-        
-        except Exception as e:
-            print(f"初始化解析器失败: {e}")
+            parser = Parser(spec.get_language())
+        except (ImportError, AttributeError, TypeError) as e:
+            print(f"警告: {spec.module}初始化失败: {e}")
+            self._failed_languages.add(language)
+            return None
+        
+        self.parsers[language] = parser
+        return parser
+    
+    def supported_languages(self) -> List[str]:
+        """已注册的语言列表（语法库按需加载）"""
+        return list_languages()
     
     def detect_language(self, file_path: str) -> Optional[str]:
         """
@@ -74,263 +80,229 @@ class CodeParser:
         Returns:
             语言名称（python, java, cpp等）
         """
-        ext = Path(file_path).suffix.lower()
-        language_map = {
-            '.py': 'python',
-            '.java': 'java',
-            '.cpp': 'cpp',
-            '.cc': 'cpp',
-            '.cxx': 'cpp',
-            '.c': 'cpp',
-            '.h': 'cpp',
-            '.hpp': 'cpp',
-        }
-        return language_map.get(ext)
+        return detect_language(file_path)
     
-    def extract_functions(self, code: str, language: str) -> List[Dict]:
+    def extract_snippets(
+        self,
+        code: str,
+        language: str,
+        snippet_types: Optional[List[str]] = None
+    ) -> List[Dict]:
         """
-        提取函数定义
+        提取代码片段（函数、类等），每个文件只解析一次、遍历一次
         
         Args:
             code: 代码文本
             language: 编程语言
+            snippet_types: 需要的片段类型（如['function']），默认全部
         
         Returns:
-            函数列表，每个函数包含：name, code, start_line, end_line
+            片段列表（按在文件中出现的顺序），每个片段包含：
+            name, type, code, start_line, end_line, has_error
         """
-        if language not in self.parsers:
+        spec = get_language_spec(language)
+        if spec is None:
+            return []
+        
+        node_types = spec.snippet_nodes
+        if snippet_types is not None:
+            node_types = {
+                node_type: rule for node_type, rule in node_types.items()
+                if rule[0] in snippet_types
+            }
+        if not node_types:
             return []
         
-        parser = self.parsers[language]
-        tree = parser.parse(bytes(code, 'utf8'))
+        result = self._parse(code, language, node_types, {})
+        return result[0] if result else []
+    
+    def parse_file(self, code: str, language: str) -> Dict:
+        """
+        解析整个文件：在同一次解析和遍历中提取代码片段和文件级依赖
         
-        functions = []
+        导入语句通常位于文件顶部而不在函数内部，因此依赖按文件计算，
+        再由调用方附加到该文件的每个片段上。
         
-        if language == 'python':
-            functions = self._extract_python_functions(tree, code)
-        elif language == 'java':
-            functions = self._extract_java_functions(tree, code)
-        elif language == 'cpp':
-            functions = self._extract_cpp_functions(tree, code)
+        Args:
+            code: 文件内容
+            language: 编程语言
         
-        return functions
+        Returns:
+            {"snippets": 片段列表（同extract_snippets）, "dependencies": 顶层包名列表（已排序）}
+        """
+        spec = get_language_spec(language)
+        result = self._parse(code, language, spec.snippet_nodes, spec.import_nodes) if spec else None
+        if result is None:
+            return {"snippets": [], "dependencies": []}
+        
+        snippets, dependencies = result
+        self._cache_dependencies(language, content_hash(code), dependencies)
+        return {"snippets": snippets, "dependencies": list(dependencies)}
     
-    def extract_classes(self, code: str, language: str) -> List[Dict]:
+    def extract_dependencies(self, code: str, language: str) -> List[str]:
         """
-        提取类定义
+        提取文件级依赖（按文件内容缓存，已经通过parse_file解析过的文件不会重复解析）
         
         Args:
-            code: 代码文本
+            code: 文件内容
             language: 编程语言
         
         Returns:
-            类列表，每个类包含：name, code, start_line, end_line
+            顶层包名列表（已排序）
         """
-        if language not in self.parsers:
+        key = (language, content_hash(code))
+        cached = self._dependency_cache.get(key)
+        if cached is not None:
+            self._dependency_cache.move_to_end(key)
+            return list(cached)
+        
+        spec = get_language_spec(language)
+        result = self._parse(code, language, {}, spec.import_nodes) if spec else None
+        if result is None:
             return []
         
-        parser = self.parsers[language]
-        tree = parser.parse(bytes(code, 'utf8'))
+        dependencies = result[1]
+        self._cache_dependencies(language, key[1], dependencies)
+        return list(dependencies)
+    
+    def _cache_dependencies(self, language: str, code_hash: str, dependencies: List[str]):
+        """写入依赖缓存，超出容量时淘汰最久未使用的记录"""
+        key = (language, code_hash)
+        self._dependency_cache[key] = dependencies
+        self._dependency_cache.move_to_end(key)
+        while len(self._dependency_cache) > self._dependency_cache_size:
+            self._dependency_cache.popitem(last=False)
+    
+    def _parse(
+        self,
+        code: str,
+        language: str,
+        node_types: Dict[str, tuple],
+        import_nodes: Dict[str, Callable]
+    ) -> Optional[Tuple[List[Dict], List[str]]]:
+        """
+        解析代码并遍历一次语法树，同时收集片段和依赖
         
-        classes = []
+        Args:
+            code: 代码文本
+            language: 编程语言
+            node_types: 片段节点类型 -> 规则
+            import_nodes: 导入节点类型 -> 解析函数
         
-        if language == 'python':
-            classes = self._extract_python_classes(tree, code)
-        elif language == 'java':
-            classes = self._extract_java_classes(tree, code)
-        elif language == 'cpp':
-            classes = self._extract_cpp_classes(tree, code)
+        Returns:
+            (片段列表, 已排序的依赖列表)，语言不可用时返回None
+        """
+        parser = self.get_parser(language)
+        if parser is None:
+            return None
         
-        return classes
-    
-    def _extract_python_functions(self, tree, code: str) -> List[Dict]:
-        """提取Python函数"""
-        functions = []
-        code_lines = code.split('\n')
-        
-        def traverse(node):
-            if node.type == 'function_definition':
-                name_node = None
-                for child in node.children:
-                    if child.type == 'identifier':
-                        name_node = child
-                        break
-                
-                if name_node:
-                    start_line = node.start_point[0]
-                    end_line = node.end_point[0]
-                    func_code = '\n'.join(code_lines[start_line:end_line + 1])
-                    
-                    functions.append({
-                        'name': name_node.text.decode('utf8'),
-                        'code': func_code,
-                        'start_line': start_line + 1,  # 1-based
-                        'end_line': end_line + 1,
-                    })
-            
-            for child in node.children:
-                traverse(child)
+        code_bytes = bytes(code, 'utf8')
+        tree = parser.parse(code_bytes)
         
-        traverse(tree.root_node)
-        return functions
-    
-    def _extract_python_classes(self, tree, code: str) -> List[Dict]:
-        """提取Python类"""
-        classes = []
-        code_lines = code.split('\n')
-        
-        def traverse(node):
-            if node.type == 'class_definition':
-                name_node = None
-                for child in node.children:
-                    if child.type == 'identifier':
-                        name_node = child
-                        break
-                
-                if name_node:
-                    start_line = node.start_point[0]
-                    end_line = node.end_point[0]
-                    class_code = '\n'.join(code_lines[start_line:end_line + 1])
-                    
-                    classes.append({
-                        'name': name_node.text.decode('utf8'),
-                        'code': class_code,
-                        'start_line': start_line + 1,
-                        'end_line': end_line + 1,
-                    })
-            
-            for child in node.children:
-                traverse(child)
+        snippets = []
+        dependencies = set()
         
-        traverse(tree.root_node)
-        return classes
-    
-    def _extract_java_functions(self, tree, code: str) -> List[Dict]:
-        """提取Java方法"""
-        functions = []
-        code_lines = code.split('\n')
-        
-        def traverse(node):
-            if node.type == 'method_declaration':
-                name_node = None
-                for child in node.children:
-                    if child.type == 'identifier':
-                        name_node = child
-                        break
-                
-                if name_node:
-                    start_line = node.start_point[0]
-                    end_line = node.end_point[0]
-                    func_code = '\n'.join(code_lines[start_line:end_line + 1])
-                    
-                    functions.append({
-                        'name': name_node.text.decode('utf8'),
-                        'code': func_code,
-                        'start_line': start_line + 1,
-                        'end_line': end_line + 1,
-                    })
+        # 使用TreeCursor迭代遍历，避免深层嵌套代码触发递归深度限制
+        cursor = tree.walk()
+        while True:
+            node = cursor.node
+            node_type = node.type
+            rule = node_types.get(node_type)
+            if rule:
+                snippet = self._build_snippet(node, rule, code_bytes)
+                if snippet:
+                    snippets.append(snippet)
+            
+            resolve_imports = import_nodes.get(node_type)
+            if resolve_imports:
+                dependencies.update(dep for dep in resolve_imports(node) if dep)
             
-            for child in node.children:
-                traverse(child)
+            if cursor.goto_first_child():
+                continue
+            while not cursor.goto_next_sibling():
+                if not cursor.goto_parent():
+                    return snippets, sorted(dependencies)
+    
+    def _build_snippet(self, node, rule: tuple, code_bytes: bytes) -> Optional[Dict]:
+        """
+        根据定义节点构建代码片段，按字节偏移切片源码
+        
+        Args:
+            node: 函数/类定义节点
+            rule: (片段类型, 名称字段路径, 允许的名称节点类型)
+            code_bytes: UTF-8编码的源码
+        
+        Returns:
+            片段字典，找不到名称时返回None
+        """
+        snippet_type, name_fields, name_types = rule
+        name_node = self._find_name_node(node, name_fields, name_types)
+        if not name_node:
+            return None
+        
+        # 片段从定义所在行的行首开始，到结束行的行尾为止（保留首行缩进）
+        start_byte = node.start_byte - node.start_point[1]
+        end_byte = code_bytes.find(b'\n', node.end_byte)
+        if end_byte == -1:
+            end_byte = len(code_bytes)
         
-        traverse(tree.root_node)
-        return functions
+        return {
+            'name': name_node.text.decode('utf8'),
+            'type': snippet_type,
+            'code': code_bytes[start_byte:end_byte].decode('utf8', errors='replace'),
+            'start_line': node.start_point[0] + 1,  # 1-based
+            'end_line': node.end_point[0] + 1,
+            # 子树中是否有ERROR/MISSING节点，清洗时据此判断语法是否完整
+            'has_error': node.has_error,
+        }
     
-    def _extract_java_classes(self, tree, code: str) -> List[Dict]:
-        """提取Java类"""
-        classes = []
-        code_lines = code.split('\n')
-        
-        def traverse(node):
-            if node.type == 'class_declaration':
-                name_node = None
-                for child in node.children:
-                    if child.type == 'identifier':
-                        name_node = child
-                        break
-                
-                if name_node:
-                    start_line = node.start_point[0]
-                    end_line = node.end_point[0]
-                    class_code = '\n'.join(code_lines[start_line:end_line + 1])
-                    
-                    classes.append({
-                        'name': name_node.text.decode('utf8'),
-                        'code': class_code,
-                        'start_line': start_line + 1,
-                        'end_line': end_line + 1,
-                    })
-            
-            for child in node.children:
-                traverse(child)
+    def extract_functions(self, code: str, language: str) -> List[Dict]:
+        """
+        提取函数定义
+        
+        Args:
+            code: 代码文本
+            language: 编程语言
         
-        traverse(tree.root_node)
-        return classes
+        Returns:
+            函数列表，每个函数包含：name, code, start_line, end_line
+        """
+        return self.extract_snippets(code, language, snippet_types=['function'])
     
-    def _extract_cpp_functions(self, tree, code: str) -> List[Dict]:
-        """提取C++函数"""
-        functions = []
-        code_lines = code.split('\n')
-        
-        def traverse(node):
-            if node.type == 'function_definition':
-                name_node = None
-                for child in node.children:
-                    if child.type == 'function_declarator':
-                        for grandchild in child.children:
-                            if grandchild.type == 'identifier':
-                                name_node = grandchild
-                                break
-                        break
-                
-                if name_node:
-                    start_line = node.start_point[0]
-                    end_line = node.end_point[0]
-                    func_code = '\n'.join(code_lines[start_line:end_line + 1])
-                    
-                    functions.append({
-                        'name': name_node.text.decode('utf8'),
-                        'code': func_code,
-                        'start_line': start_line + 1,
-                        'end_line': end_line + 1,
-                    })
-            
-            for child in node.children:
-                traverse(child)
+    def extract_classes(self, code: str, language: str) -> List[Dict]:
+        """
+        提取类定义
+        
+        Args:
+            code: 代码文本
+            language: 编程语言
         
-        traverse(tree.root_node)
-        return functions
+        Returns:
+            类列表，每个类包含：name, code, start_line, end_line
+        """
+        return self.extract_snippets(code, language, snippet_types=['class'])
     
-    def _extract_cpp_classes(self, tree, code: str) -> List[Dict]:
-        """提取C++类"""
-        classes = []
-        code_lines = code.split('\n')
-        
-        def traverse(node):
-            if node.type == 'class_specifier':
-                name_node = None
-                for child in node.children:
-                    if child.type == 'type_identifier':
-                        name_node = child
-                        break
-                
-                if name_node:
-                    start_line = node.start_point[0]
-                    end_line = node.end_point[0]
-                    class_code = '\n'.join(code_lines[start_line:end_line + 1])
-                    
-                    classes.append({
-                        'name': name_node.text.decode('utf8'),
-                        'code': class_code,
-                        'start_line': start_line + 1,
-                        'end_line': end_line + 1,
-                    })
-            
-            for child in node.children:
-                traverse(child)
+    @staticmethod
+    def _find_name_node(node, name_fields: tuple, name_types: Optional[tuple] = None):
+        """
+        查找定义节点的名称节点
+        
+        Args:
+            node: 函数/类定义节点
+            name_fields: 名称字段路径（如C++函数为('declarator', 'declarator')）
+            name_types: 允许的名称节点类型，为None时不限制
+        
+        Returns:
+            名称节点，找不到时返回None
+        """
+        for field in name_fields:
+            node = node.child_by_field_name(field)
+            if node is None:
+                return None
         
-        traverse(tree.root_node)
-        return classes
+        if name_types and node.type not in name_types:
+            return None
+        return node
 
 
 # 全局实例
@@ -0,0 +1,135 @@
+"""
+采集清单服务 - 记录每个仓库上次采集的提交SHA和文件blob SHA，用于增量采集
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+from app.core.config import settings
+
+
+class CollectManifest:
+    """
+    本地采集清单
+    
+    结构：
+        {
+            "owner/repo": {
+                "default_branch": "main",
+                "url": "https://github.com/owner/repo",
+                "languages": {
+                    "python": {
+                        "commit_sha": "...",
+                        "etag": "...",
+                        "files": {"path/to/file.py": "blob_sha", ...},
+                        "pending": ["path/to/failed.py", ...]
+                    }
+                }
+            }
+        }
+    """
+    
+    def __init__(self, path: Optional[str] = None):
+        """
+        初始化采集清单
+        
+        Args:
+            path: 清单文件路径（默认使用COLLECT_MANIFEST_PATH配置）
+        """
+        self.path = Path(path or settings.COLLECT_MANIFEST_PATH)
+        self._lock = threading.Lock()
+        self._data: Dict[str, Dict] = {}
+        
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._data = json.load(f)
+    
+    def get_repo(self, repo_name: str) -> Dict:
+        """获取仓库级记录（默认分支、URL）"""
+        with self._lock:
+            return dict(self._data.get(repo_name, {}))
+    
+    def get_language_state(self, repo_name: str, language: str) -> Dict:
+        """获取仓库某个语言的上次采集状态"""
+        with self._lock:
+            languages = self._data.get(repo_name, {}).get("languages", {})
+            state = languages.get(language, {})
+            return {
+                "commit_sha": state.get("commit_sha"),
+                "etag": state.get("etag"),
+                "files": dict(state.get("files", {})),
+                "pending": list(state.get("pending", [])),
+            }
+    
+    def update(
+        self,
+        repo_name: str,
+        language: str,
+        commit_sha: str,
+        etag: Optional[str],
+        files: Dict[str, str],
+        default_branch: Optional[str] = None,
+        url: Optional[str] = None,
+        pending: Optional[List[str]] = None
+    ):
+        """
+        更新仓库采集状态
+        
+        Args:
+            repo_name: 仓库全名
+            language: 编程语言
+            commit_sha: 本次采集的提交SHA
+            etag: 分支提交请求返回的ETag
+            files: 文件路径 -> blob SHA
+            default_branch: 默认分支
+            url: 仓库URL
+            pending: 下载失败、需要在下次采集时重试的文件（不在files中记录新的blob SHA）
+        """
+        with self._lock:
+            entry = self._data.setdefault(repo_name, {"languages": {}})
+            if default_branch:
+                entry["default_branch"] = default_branch
+            if url:
+                entry["url"] = url
+            state = {
+                "commit_sha": commit_sha,
+                "etag": etag,
+                "files": files,
+            }
+            if pending:
+                state["pending"] = list(pending)
+            entry.setdefault("languages", {})[language] = state
+    
+    def save(self):
+        """保存清单（先写临时文件再替换，避免中断时损坏）"""
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+    
+    @staticmethod
+    def diff_files(
+        old_files: Dict[str, str],
+        new_files: Dict[str, str]
+    ) -> Dict[str, List[str]]:
+        """
+        比较两次采集的文件blob SHA
+        
+        Args:
+            old_files: 上次的 文件路径 -> blob SHA
+            new_files: 本次的 文件路径 -> blob SHA
+        
+        Returns:
+            {"add": [...], "modify": [...], "delete": [...]}
+        """
+        added = [path for path in new_files if path not in old_files]
+        modified = [
+            path for path, sha in new_files.items()
+            if path in old_files and old_files[path] != sha
+        ]
+        deleted = [path for path in old_files if path not in new_files]
+        return {"add": added, "modify": modified, "delete": deleted}
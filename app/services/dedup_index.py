@@ -0,0 +1,338 @@
+"""
+语料级去重索引 - 持久化的精确哈希 + MinHash/LSH 近似重复检测
+
+每个代码片段记录一个blake2内容哈希和一个MinHash签名（基于token shingle），
+签名按LSH分段后写入SQLite，新片段只需和同一分桶中的候选比较，
+因此可以在整个语料上快速判断是否重复，并且在多次采集之间保持有效。
+"""
+
+import hashlib
+import re
+import sqlite3
+import threading
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.code_cleaner import content_hash
+
+
+# 标识符、数字、单个符号各算一个token，空白不参与比较
+_TOKEN_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*|\d+|[^\sA-Za-z0-9_]')
+
+# 生成置换参数的固定种子（改变后已有索引中的签名将无法比较）
+_PERMUTATION_SEED = 20240521
+
+
+class DedupIndex:
+    """基于SQLite的代码去重索引"""
+    
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        threshold: Optional[float] = None,
+        num_perm: Optional[int] = None,
+        bands: Optional[int] = None,
+        shingle_size: Optional[int] = None
+    ):
+        """
+        初始化去重索引
+        
+        Args:
+            path: SQLite文件路径（默认使用DEDUP_INDEX_PATH配置）
+            threshold: 判定为近似重复的Jaccard相似度阈值（默认使用DEDUP_THRESHOLD配置）
+            num_perm: MinHash置换数量（默认使用DEDUP_NUM_PERM配置）
+            bands: LSH分段数量，需要整除num_perm（默认使用DEDUP_BANDS配置）
+            shingle_size: 每个shingle包含的token数（默认使用DEDUP_SHINGLE_SIZE配置）
+        """
+        self.path = Path(path or settings.DEDUP_INDEX_PATH)
+        self.threshold = threshold if threshold is not None else settings.DEDUP_THRESHOLD
+        self.num_perm = num_perm or settings.DEDUP_NUM_PERM
+        self.bands = bands or settings.DEDUP_BANDS
+        self.shingle_size = shingle_size or settings.DEDUP_SHINGLE_SIZE
+        
+        if self.num_perm % self.bands != 0:
+            raise ValueError(f"num_perm({self.num_perm}) 必须能被 bands({self.bands}) 整除")
+        self.rows = self.num_perm // self.bands
+        
+        # 乘法移位哈希族：h(x) = ((a * x + b) mod 2^64) >> 32，a为奇数
+        rng = np.random.RandomState(_PERMUTATION_SEED)
+        self._perm_a = (
+            rng.randint(0, 2 ** 32, size=self.num_perm, dtype=np.uint64) << np.uint64(32)
+        ) | rng.randint(0, 2 ** 32, size=self.num_perm, dtype=np.uint64) | np.uint64(1)
+        self._perm_b = (
+            rng.randint(0, 2 ** 32, size=self.num_perm, dtype=np.uint64) << np.uint64(32)
+        ) | rng.randint(0, 2 ** 32, size=self.num_perm, dtype=np.uint64)
+        
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._init_schema()
+    
+    def _init_schema(self):
+        """创建表结构，并检查索引参数是否与已有数据一致"""
+        conn = self._conn
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS snippets (
+                id INTEGER PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                snippet_type TEXT NOT NULL,
+                signature BLOB,
+                repo_name TEXT,
+                file_path TEXT,
+                name TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_snippets_hash ON snippets(content_hash, snippet_type);
+            CREATE INDEX IF NOT EXISTS idx_snippets_location ON snippets(repo_name, file_path);
+            CREATE TABLE IF NOT EXISTS bands (
+                band_key INTEGER NOT NULL,
+                snippet_id INTEGER NOT NULL,
+                PRIMARY KEY (band_key, snippet_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_bands_snippet ON bands(snippet_id);
+        """)
+        
+        params = {
+            "num_perm": str(self.num_perm),
+            "bands": str(self.bands),
+            "shingle_size": str(self.shingle_size),
+            "seed": str(_PERMUTATION_SEED),
+        }
+        stored = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        if stored:
+            mismatched = [key for key, value in params.items() if stored.get(key) != value]
+            if mismatched:
+                raise ValueError(
+                    f"去重索引 {self.path} 的参数与当前配置不一致: {', '.join(mismatched)}，"
+                    f"请删除索引文件后重新采集"
+                )
+        else:
+            conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", params.items())
+        conn.commit()
+    
+    def signature(self, code: str) -> Optional[np.ndarray]:
+        """
+        计算代码的MinHash签名
+        
+        Args:
+            code: 代码内容
+        
+        Returns:
+            长度为num_perm的uint32数组，代码中没有token时返回None
+        """
+        tokens = _TOKEN_PATTERN.findall(code)
+        if not tokens:
+            return None
+        
+        k = min(self.shingle_size, len(tokens))
+        shingles = {
+            zlib.crc32(' '.join(tokens[i:i + k]).encode('utf-8'))
+            for i in range(len(tokens) - k + 1)
+        }
+        values = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+        
+        # (num_perm, shingle数) 的哈希矩阵，按行取最小值（uint64乘法按2^64自然溢出）
+        hashed = (np.outer(self._perm_a, values) + self._perm_b[:, None]) >> np.uint64(32)
+        return hashed.min(axis=1).astype(np.uint32)
+    
+    def _band_keys(self, signature: np.ndarray) -> List[int]:
+        """把签名切分成bands段，每段哈希成一个64位整数（包含段号，避免不同段冲突）"""
+        keys = []
+        for band in range(self.bands):
+            chunk = signature[band * self.rows:(band + 1) * self.rows]
+            digest = hashlib.blake2b(
+                band.to_bytes(2, 'little') + chunk.tobytes(), digest_size=8
+            ).digest()
+            keys.append(int.from_bytes(digest, 'little', signed=True))
+        return keys
+    
+    def _find(
+        self,
+        code_hash: str,
+        snippet_type: str,
+        signature: Optional[np.ndarray],
+        band_keys: Optional[List[int]]
+    ) -> Optional[Dict]:
+        """在索引中查找重复片段（调用方需持有锁）"""
+        row = self._conn.execute(
+            "SELECT id, repo_name, file_path, name FROM snippets "
+            "WHERE content_hash = ? AND snippet_type = ? LIMIT 1",
+            (code_hash, snippet_type)
+        ).fetchone()
+        if row:
+            return {
+                "id": row[0], "repo_name": row[1], "file_path": row[2], "name": row[3],
+                "similarity": 1.0, "exact": True,
+            }
+        
+        if signature is None:
+            return None
+        
+        placeholders = ",".join("?" * len(band_keys))
+        candidates = self._conn.execute(
+            f"SELECT id, signature, repo_name, file_path, name FROM snippets "
+            f"WHERE snippet_type = ? AND id IN "
+            f"(SELECT snippet_id FROM bands WHERE band_key IN ({placeholders}))",
+            [snippet_type, *band_keys]
+        ).fetchall()
+        
+        best = None
+        best_similarity = self.threshold
+        for snippet_id, blob, repo_name, file_path, name in candidates:
+            other = np.frombuffer(blob, dtype=np.uint32)
+            # 签名中相同位置取值相等的比例即Jaccard相似度的估计
+            similarity = float(np.count_nonzero(other == signature)) / self.num_perm
+            if similarity >= best_similarity:
+                best_similarity = similarity
+                best = {
+                    "id": snippet_id, "repo_name": repo_name, "file_path": file_path,
+                    "name": name, "similarity": similarity, "exact": False,
+                }
+        return best
+    
+    def _insert(
+        self,
+        code_hash: str,
+        snippet_type: str,
+        signature: Optional[np.ndarray],
+        band_keys: Optional[List[int]],
+        snippet: Dict
+    ):
+        """写入一个片段（调用方需持有锁并负责提交）"""
+        cursor = self._conn.execute(
+            "INSERT INTO snippets (content_hash, snippet_type, signature, repo_name, file_path, name) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                code_hash,
+                snippet_type,
+                signature.tobytes() if signature is not None else None,
+                snippet.get('repo_name'),
+                snippet.get('file_path'),
+                snippet.get('name'),
+            )
+        )
+        if band_keys:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO bands (band_key, snippet_id) VALUES (?, ?)",
+                [(key, cursor.lastrowid) for key in band_keys]
+            )
+    
+    def _fingerprint(self, code: str) -> Tuple[str, Optional[np.ndarray], Optional[List[int]]]:
+        """计算内容哈希、签名和LSH分段键"""
+        signature = self.signature(code)
+        band_keys = self._band_keys(signature) if signature is not None else None
+        return content_hash(code), signature, band_keys
+    
+    def find_duplicate(self, code: str, snippet_type: str = "function") -> Optional[Dict]:
+        """
+        查找与代码重复或近似重复的已索引片段（只查询，不写入）
+        
+        Args:
+            code: 代码内容
+            snippet_type: 片段类型（只和同类型片段比较）
+        
+        Returns:
+            匹配到的片段信息（id, repo_name, file_path, name, similarity, exact），没有时返回None
+        """
+        code_hash, signature, band_keys = self._fingerprint(code)
+        with self._lock:
+            return self._find(code_hash, snippet_type, signature, band_keys)
+    
+    def replace_file(
+        self,
+        repo_name: str,
+        file_path: str,
+        snippets: List[Dict]
+    ) -> List[Dict]:
+        """
+        用文件的最新片段替换索引中该文件的记录，返回不重复的片段
+        
+        先删除该文件原有的记录（重新采集或文件被修改时不会和自己的旧版本比较），
+        再逐个检查新片段：与语料中已有片段重复的丢弃，其余写入索引。
+        丢弃的副本不记录来源，保留的片段所在文件之后被修改或删除时不会自动补回这些副本。
+        
+        Args:
+            repo_name: 仓库全名
+            file_path: 文件路径
+            snippets: 该文件的代码片段列表
+        
+        Returns:
+            未与其他片段重复的代码片段列表
+        """
+        fingerprints = [self._fingerprint(snippet.get('code', '')) for snippet in snippets]
+        
+        unique = []
+        with self._lock:
+            self._delete_file(repo_name, file_path)
+            for snippet, (code_hash, signature, band_keys) in zip(snippets, fingerprints):
+                snippet_type = snippet.get('type', 'function')
+                if self._find(code_hash, snippet_type, signature, band_keys):
+                    continue
+                self._insert(code_hash, snippet_type, signature, band_keys, {
+                    **snippet, 'repo_name': repo_name, 'file_path': file_path,
+                })
+                unique.append(snippet)
+            self._conn.commit()
+        
+        return unique
+    
+    def _delete_file(self, repo_name: str, file_path: str) -> int:
+        """删除一个文件的全部记录（调用方需持有锁并负责提交）"""
+        ids = [
+            row[0] for row in self._conn.execute(
+                "SELECT id FROM snippets WHERE repo_name = ? AND file_path = ?",
+                (repo_name, file_path)
+            )
+        ]
+        if ids:
+            placeholders = ",".join("?" * len(ids))
+            self._conn.execute(f"DELETE FROM bands WHERE snippet_id IN ({placeholders})", ids)
+            self._conn.execute(f"DELETE FROM snippets WHERE id IN ({placeholders})", ids)
+        return len(ids)
+    
+    def remove_file(self, repo_name: str, file_path: str) -> int:
+        """
+        删除一个文件在索引中的全部记录（文件被删除时调用）
+        
+        Args:
+            repo_name: 仓库全名
+            file_path: 文件路径
+        
+        Returns:
+            删除的片段数量
+        """
+        with self._lock:
+            count = self._delete_file(repo_name, file_path)
+            self._conn.commit()
+        return count
+    
+    def count(self) -> int:
+        """索引中的片段数量"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM snippets").fetchone()[0]
+    
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+# 全局实例
+_dedup_index: Optional[DedupIndex] = None
+
+
+def get_dedup_index() -> DedupIndex:
+    """获取去重索引实例（单例模式）"""
+    global _dedup_index
+    if _dedup_index is None:
+        _dedup_index = DedupIndex()
+    return _dedup_index
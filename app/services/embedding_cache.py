@@ -0,0 +1,268 @@
+"""
+嵌入向量缓存 - 按 (模型, 内容哈希) 持久化已编码的向量
+
+向量按模型分别追加写入float32的内存映射文件，SQLite只保存
+(模型, 内容哈希) -> 行号 的索引。重新向量化基本未变化的语料时，
+只有缓存未命中的文本需要送入模型，其余向量直接从磁盘读取。
+"""
+
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.code_cleaner import content_hash
+
+
+# 每次查询/写入索引时IN子句中的哈希数（SQLite的参数数量有上限）
+_QUERY_CHUNK = 500
+
+# 向量文件每次扩容的最小行数，避免频繁重新映射
+_MIN_GROW_ROWS = 4096
+
+
+def embedding_model_key(
+    model_name: Optional[str] = None,
+    backend: Optional[str] = None,
+    quantized: Optional[bool] = None
+) -> str:
+    """
+    生成缓存使用的模型标识：不同模型、不同推理后端编码出的向量不能混用
+    
+    Args:
+        model_name: 嵌入模型名称（默认使用EMBEDDING_MODEL配置）
+        backend: 推理后端 torch 或 onnx（默认使用EMBEDDING_BACKEND配置）
+        quantized: ONNX后端是否使用int8量化模型（默认使用EMBEDDING_ONNX_QUANTIZE配置）
+    
+    Returns:
+        模型标识，例如 "microsoft/codebert-base|torch"
+    """
+    model_name = model_name or settings.EMBEDDING_MODEL
+    backend = (backend or settings.EMBEDDING_BACKEND).lower()
+    if quantized is None:
+        quantized = settings.EMBEDDING_ONNX_QUANTIZE
+    if backend == "onnx" and quantized:
+        backend = "onnx-int8"
+    return f"{model_name}|{backend}"
+
+
+class EmbeddingCache:
+    """基于内存映射文件和SQLite索引的嵌入向量缓存"""
+    
+    def __init__(self, model_key: str, path: Optional[str] = None):
+        """
+        初始化向量缓存
+        
+        Args:
+            model_key: 模型标识（见embedding_model_key）
+            path: 缓存目录（默认使用EMBEDDING_CACHE_DIR配置）
+        """
+        self.model_key = model_key
+        self.path = Path(path or settings.EMBEDDING_CACHE_DIR)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.path / (re.sub(r'[^\w.-]+', '_', model_key) + ".f32")
+        
+        self.dimension: Optional[int] = None
+        self.last_stats: Dict = {}
+        self._mmap: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path / "index.db"), check_same_thread=False)
+        self._init_schema()
+    
+    def _init_schema(self):
+        """创建表结构，读取该模型已记录的向量维度"""
+        conn = self._conn
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS models (
+                model_key TEXT PRIMARY KEY,
+                dimension INTEGER NOT NULL,
+                rows INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                model_key TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                row INTEGER NOT NULL,
+                PRIMARY KEY (model_key, content_hash)
+            ) WITHOUT ROWID;
+        """)
+        conn.commit()
+        
+        stored = conn.execute(
+            "SELECT dimension FROM models WHERE model_key = ?", (self.model_key,)
+        ).fetchone()
+        if stored:
+            self.dimension = stored[0]
+    
+    def _vectors(self, rows: int) -> np.memmap:
+        """返回至少包含rows行的向量文件映射（文件不够大时重新映射）"""
+        if self._mmap is None or self._mmap.shape[0] < rows:
+            self._mmap = None
+            file_rows = self.vectors_path.stat().st_size // (4 * self.dimension)
+            self._mmap = np.memmap(
+                self.vectors_path,
+                dtype=np.float32,
+                mode="r+",
+                shape=(file_rows, self.dimension)
+            )
+        return self._mmap
+    
+    def _lookup_rows(self, hashes: Sequence[str]) -> Dict[str, int]:
+        """查询内容哈希对应的行号（未命中的不在结果中）"""
+        rows = {}
+        for i in range(0, len(hashes), _QUERY_CHUNK):
+            chunk = hashes[i:i + _QUERY_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            rows.update(self._conn.execute(
+                f"SELECT content_hash, row FROM entries "
+                f"WHERE model_key = ? AND content_hash IN ({placeholders})",
+                (self.model_key, *chunk)
+            ).fetchall())
+        return rows
+    
+    def get_many(self, hashes: Sequence[str]) -> Dict[str, np.ndarray]:
+        """
+        批量读取缓存的向量
+        
+        Args:
+            hashes: 内容哈希列表
+        
+        Returns:
+            {内容哈希: 向量}，只包含命中的哈希
+        """
+        if self.dimension is None or not hashes:
+            return {}
+        
+        with self._lock:
+            rows = self._lookup_rows(list(set(hashes)))
+            if not rows:
+                return {}
+            vectors = self._vectors(max(rows.values()) + 1)
+            # 按行号排序读取，尽量顺序访问文件
+            ordered = sorted(rows.items(), key=lambda item: item[1])
+            block = np.array(vectors[[row for _, row in ordered]])
+            return {key: block[i] for i, (key, _) in enumerate(ordered)}
+    
+    def put_many(self, hashes: Sequence[str], vectors: Sequence[np.ndarray]):
+        """
+        批量写入向量（已存在的哈希会被跳过）
+        
+        行号在SQLite写事务中分配，多个进程同时写入同一缓存也不会冲突；
+        先写向量再写索引，中途退出时只会留下未被引用的行。
+        
+        Args:
+            hashes: 内容哈希列表
+            vectors: 与hashes一一对应的向量
+        """
+        if not hashes:
+            return
+        
+        with self._lock:
+            pending = {}
+            for key, vector in zip(hashes, vectors):
+                pending.setdefault(key, vector)
+            existing = self._lookup_rows(list(pending))
+            pending = {key: vector for key, vector in pending.items() if key not in existing}
+            if not pending:
+                return
+            
+            block = np.asarray(list(pending.values()), dtype=np.float32)
+            dimension = block.shape[1]
+            
+            # 分配行号（同时登记模型的向量维度）
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                stored = conn.execute(
+                    "SELECT dimension, rows FROM models WHERE model_key = ?", (self.model_key,)
+                ).fetchone()
+                if stored is None:
+                    stored = (dimension, 0)
+                    conn.execute(
+                        "INSERT INTO models (model_key, dimension, rows) VALUES (?, ?, 0)",
+                        (self.model_key, dimension)
+                    )
+                if stored[0] != dimension:
+                    raise ValueError(
+                        f"向量维度 {dimension} 与缓存中模型 {self.model_key} 的维度 {stored[0]} 不一致"
+                    )
+                start = stored[1]
+                end = start + len(block)
+                conn.execute(
+                    "UPDATE models SET rows = ? WHERE model_key = ?",
+                    (end, self.model_key)
+                )
+                # 文件不够大时按倍数扩容；在写事务中执行，多个进程不会同时改变文件大小
+                file_rows = (
+                    self.vectors_path.stat().st_size // (4 * dimension)
+                    if self.vectors_path.exists() else 0
+                )
+                if file_rows < end:
+                    with open(self.vectors_path, "ab") as f:
+                        f.truncate(max(end, file_rows * 2, _MIN_GROW_ROWS) * 4 * dimension)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            self.dimension = dimension
+            
+            mapped = self._vectors(end)
+            mapped[start:end] = block
+            mapped.flush()
+            
+            conn.executemany(
+                "INSERT OR IGNORE INTO entries (model_key, content_hash, row) VALUES (?, ?, ?)",
+                [(self.model_key, key, start + i) for i, key in enumerate(pending)]
+            )
+            conn.commit()
+    
+    def encode(
+        self,
+        encoder: Any,
+        texts: List[str],
+        **kwargs
+    ) -> List[np.ndarray]:
+        """
+        带缓存的批量编码：只把未命中的文本交给encoder编码
+        
+        Args:
+            encoder: 提供encode_batch的嵌入服务（EmbeddingService或EmbeddingPool）
+            texts: 待编码文本列表
+            **kwargs: 传给encoder.encode_batch的参数
+        
+        Returns:
+            向量列表（与输入顺序一致）
+        """
+        hashes = [content_hash(text) for text in texts]
+        cached = self.get_many(hashes)
+        
+        # 同一批中重复的文本只编码一次
+        missing = {}
+        for key, text in zip(hashes, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            encoded = encoder.encode_batch(list(missing.values()), **kwargs)
+            self.put_many(list(missing), encoded)
+            cached.update(zip(missing, encoded))
+        
+        self.last_stats = {"hits": len(texts) - len(missing), "misses": len(missing)}
+        return [cached[key] for key in hashes]
+    
+    def count(self) -> int:
+        """缓存中当前模型的向量数"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM entries WHERE model_key = ?", (self.model_key,)
+            ).fetchone()[0]
+    
+    def close(self):
+        """关闭索引连接并释放文件映射"""
+        with self._lock:
+            self._mmap = None
+            self._conn.close()
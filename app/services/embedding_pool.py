@@ -0,0 +1,210 @@
+"""
+多进程嵌入服务 - 批量向量化时用多个进程并行编码
+
+torch的算子内多线程在核数较多时扩展性很差：与其让一个进程使用全部核心，
+不如启动多个进程，每个进程持有自己的模型副本并固定较少的线程数。
+"""
+
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from app.core.config import settings
+
+
+def _init_worker(num_threads: int):
+    """
+    工作进程初始化：固定线程数后加载模型（每个进程只加载一次）
+    
+    线程数相关的环境变量必须在导入torch之前设置，
+    因此本模块不在顶层导入嵌入服务。
+    """
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[name] = str(num_threads)
+    # 多个进程同时使用tokenizer的内部线程池会互相争抢CPU
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+        torch.set_num_interop_threads(1)
+    except (ImportError, RuntimeError):
+        pass
+    
+    if settings.EMBEDDING_ONNX_THREADS <= 0:
+        settings.EMBEDDING_ONNX_THREADS = num_threads
+    # 工作进程总是自己加载模型，不连接共享嵌入服务
+    settings.EMBEDDING_MODE = "local"
+    
+    from app.services.embedding_service import get_embedding_service
+    get_embedding_service()
+
+
+def _worker_model_key() -> str:
+    """工作进程实际使用的模型标识（ONNX不可用或不在CPU上时后端会回退到torch）"""
+    from app.services.embedding_service import get_embedding_service
+    return get_embedding_service().model_key
+
+
+def _encode_chunk(
+    texts: List[str],
+    batch_size: int,
+    max_batch_tokens: Optional[int]
+) -> Tuple[np.ndarray, Dict, str]:
+    """在工作进程中编码一批文本，返回 (向量矩阵, 编码统计, 模型标识)"""
+    from app.services.embedding_service import get_embedding_service
+    service = get_embedding_service()
+    vectors = service.encode_batch(
+        texts,
+        batch_size=batch_size,
+        max_batch_tokens=max_batch_tokens,
+        show_progress=False
+    )
+    return np.stack(vectors), service.last_batch_stats, service.model_key
+
+
+class EmbeddingPool:
+    """多进程嵌入服务，可以替代EmbeddingService.encode_batch"""
+    
+    def __init__(
+        self,
+        num_workers: Optional[int] = None,
+        threads_per_worker: Optional[int] = None,
+        chunk_size: Optional[int] = None
+    ):
+        """
+        初始化嵌入进程池
+        
+        Args:
+            num_workers: 工作进程数（默认使用EMBEDDING_POOL_WORKERS配置，<=0 表示CPU核数）
+            threads_per_worker: 每个进程的线程数（默认使用EMBEDDING_POOL_THREADS配置，
+                <=0 表示CPU核数 / 进程数）
+            chunk_size: 每次提交给工作进程的文本数（默认使用EMBEDDING_POOL_CHUNK_SIZE配置）
+        """
+        cpu_count = os.cpu_count() or 1
+        if num_workers is None:
+            num_workers = settings.EMBEDDING_POOL_WORKERS
+        self.num_workers = num_workers if num_workers > 0 else cpu_count
+        
+        if threads_per_worker is None:
+            threads_per_worker = settings.EMBEDDING_POOL_THREADS
+        self.threads_per_worker = (
+            threads_per_worker if threads_per_worker > 0
+            else max(1, cpu_count // self.num_workers)
+        )
+        self.chunk_size = max(1, chunk_size or settings.EMBEDDING_POOL_CHUNK_SIZE)
+        self.last_batch_stats: Dict = {}
+        self._tokenizer = None
+        self._model_key: Optional[str] = None
+        
+        print(f"启动嵌入进程池: {self.num_workers} 个进程，每个进程 {self.threads_per_worker} 个线程")
+        # 使用spawn：父进程中已初始化的torch线程池在fork后可能死锁
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.threads_per_worker,)
+        )
+    
+    @property
+    def model_key(self) -> str:
+        """
+        向量缓存使用的模型标识，由工作进程报告实际使用的后端
+        （首次访问时等待一个工作进程加载模型）
+        """
+        if self._model_key is None:
+            self._model_key = self.executor.submit(_worker_model_key).result()
+        return self._model_key
+    
+    @property
+    def tokenizer(self) -> Any:
+        """嵌入模型的tokenizer（父进程只加载tokenizer，用于长代码分块）"""
+        if self._tokenizer is None:
+            from transformers import AutoTokenizer
+            self._tokenizer = AutoTokenizer.from_pretrained(settings.EMBEDDING_MODEL)
+        return self._tokenizer
+    
+    def encode_batch(
+        self,
+        codes: List[str],
+        batch_size: int = 32,
+        max_batch_tokens: Optional[int] = None,
+        show_progress: bool = True
+    ) -> List[np.ndarray]:
+        """
+        批量编码代码（与EmbeddingService.encode_batch参数和返回值一致）
+        
+        文本先按字符长度从长到短排序再切分，每份交给一个工作进程，
+        长度相近的文本在同一份中分桶，耗时最长的份最先提交；
+        结果按原始下标放回，返回顺序与输入一致。
+        
+        Args:
+            codes: 代码文本列表
+            batch_size: 工作进程内每批最多条数
+            max_batch_tokens: 工作进程内每批的token预算（默认使用EMBEDDING_MAX_BATCH_TOKENS配置）
+            show_progress: 是否显示进度条和吞吐统计
+        
+        Returns:
+            向量列表（与输入顺序一致）
+        """
+        if not codes:
+            return []
+        
+        try:
+            start = time.perf_counter()
+            order = sorted(range(len(codes)), key=lambda i: len(codes[i]), reverse=True)
+            # 输入较少时也要让每个进程都分到文本
+            per_chunk = min(self.chunk_size, -(-len(codes) // self.num_workers))
+            chunks = [order[i:i + per_chunk] for i in range(0, len(order), per_chunk)]
+            
+            results = self.executor.map(
+                _encode_chunk,
+                [[codes[i] for i in chunk] for chunk in chunks],
+                [batch_size] * len(chunks),
+                [max_batch_tokens] * len(chunks)
+            )
+            if show_progress and len(chunks) > 1:
+                from tqdm import tqdm
+                results = tqdm(results, total=len(chunks), desc="编码分片")
+            
+            vectors: List[Optional[np.ndarray]] = [None] * len(codes)
+            stats = {"batches": 0, "tokens": 0, "padded_tokens": 0}
+            for chunk, (chunk_vectors, chunk_stats, model_key) in zip(chunks, results):
+                # 各进程按同一配置加载模型，后端回退时不能与其他后端的向量混用
+                if self._model_key is None:
+                    self._model_key = model_key
+                elif model_key != self._model_key:
+                    raise RuntimeError(f"工作进程使用的模型 {model_key} 与 {self._model_key} 不一致")
+                for i, vector in zip(chunk, chunk_vectors):
+                    vectors[i] = vector
+                for key in stats:
+                    stats[key] += chunk_stats[key]
+            
+            elapsed = time.perf_counter() - start
+            self.last_batch_stats = {
+                "texts": len(codes),
+                **stats,
+                "seconds": elapsed,
+                "tokens_per_second": stats["tokens"] / elapsed if elapsed > 0 else 0.0,
+            }
+            if show_progress:
+                print(
+                    f"  编码 {len(codes)} 条（{len(chunks)} 个分片，{stats['batches']} 批），"
+                    f"{stats['tokens']} tokens，"
+                    f"{self.last_batch_stats['tokens_per_second']:.0f} tokens/秒"
+                )
+            return vectors
+        except Exception as e:
+            raise Exception(f"多进程批量编码失败: {str(e)}")
+    
+    def shutdown(self):
+        """关闭进程池"""
+        self.executor.shutdown(wait=True)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
@@ -0,0 +1,271 @@
+"""
+共享嵌入服务 - 在单独的本地进程中加载嵌入模型，供多个API工作进程共用
+
+每个uvicorn/gunicorn工作进程各自加载CodeBERT会重复占用约500MB内存。
+EMBEDDING_MODE=server 时，模型只在嵌入服务进程中加载一次，
+工作进程通过Unix socket把文本发给它编码和分词，自己不导入torch/transformers。
+同时到达的编码请求会合并成一批。
+"""
+
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Connection, Listener
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.embedding_service import EmbeddingService
+
+# 每次合并编码的最多文本数，避免一个大请求之后排队的查询等待过久
+_MAX_COALESCED_TEXTS = 256
+
+
+def _authkey() -> bytes:
+    """连接认证密钥（未单独配置时使用SECRET_KEY）"""
+    return (settings.EMBEDDING_SERVER_AUTHKEY or settings.SECRET_KEY).encode("utf-8")
+
+
+class EmbeddingServer:
+    """嵌入服务进程：加载一份模型，通过Unix socket处理编码请求"""
+    
+    def __init__(self, socket_path: Optional[str] = None):
+        """
+        初始化嵌入服务（加载模型）
+        
+        Args:
+            socket_path: Unix socket路径（默认使用EMBEDDING_SERVER_SOCKET配置）
+        """
+        self.socket_path = Path(socket_path or settings.EMBEDDING_SERVER_SOCKET)
+        # 直接创建本地服务，不受EMBEDDING_MODE影响
+        self.service = EmbeddingService()
+        self._requests: "queue.Queue[tuple[List[str], Dict, Future]]" = queue.Queue()
+    
+    def info(self) -> Dict:
+        """客户端初始化时需要的模型信息"""
+        return {
+            "model_key": self.service.model_key,
+            "dimension": self.service.dimension,
+            "max_seq_length": self.service.max_seq_length,
+            "backend": self.service.backend,
+        }
+    
+    def serve_forever(self):
+        """监听socket并处理请求（每个连接一个线程，编码在单独的线程中合并执行）"""
+        self.socket_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        # 上次异常退出时残留的socket文件会导致监听失败
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+        
+        listener = Listener(str(self.socket_path), family="AF_UNIX", authkey=_authkey())
+        os.chmod(self.socket_path, 0o600)
+        threading.Thread(target=self._encode_loop, name="encoder", daemon=True).start()
+        print(f"✅ 嵌入服务已启动: {self.socket_path}（{self.service.model_key}）")
+        
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    # 认证失败等错误只影响当前连接
+                    print(f"[!] 接受连接失败: {e}")
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+    
+    def _handle(self, conn: Connection):
+        """处理单个客户端连接上的请求，直到客户端断开"""
+        with conn:
+            while True:
+                try:
+                    method, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+                
+                try:
+                    if method == "info":
+                        result = self.info()
+                    elif method == "tokenize":
+                        result = self.service.tokenizer(kwargs.pop("texts"), **kwargs)["input_ids"]
+                    elif method == "encode_batch":
+                        future: Future = Future()
+                        self._requests.put((kwargs.pop("codes"), kwargs, future))
+                        result = future.result()
+                    else:
+                        raise ValueError(f"未知的请求: {method}")
+                    conn.send(("ok", result))
+                except Exception as e:
+                    conn.send(("error", str(e)))
+    
+    def _encode_loop(self):
+        """
+        编码线程：取出一个请求后，把队列中已经在等待的请求一起编码
+        
+        不额外等待新请求，空闲时单条查询的延迟不变；多个工作进程同时查询时
+        合并成一批，批量编码的吞吐量更高。参数不同的请求不合并。
+        """
+        while True:
+            batch = [self._requests.get()]
+            total = len(batch[0][0])
+            while total < _MAX_COALESCED_TEXTS:
+                try:
+                    request = self._requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request[1] != batch[0][1]:
+                    self._requests.put(request)
+                    break
+                batch.append(request)
+                total += len(request[0])
+            
+            texts = [text for codes, _, _ in batch for text in codes]
+            try:
+                vectors = np.asarray(
+                    self.service.encode_batch(texts, show_progress=False, **batch[0][1]),
+                    dtype=np.float32
+                )
+                stats = self.service.last_batch_stats
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            
+            start = 0
+            for codes, _, future in batch:
+                future.set_result((vectors[start:start + len(codes)], stats))
+                start += len(codes)
+
+
+class _RemoteTokenizer:
+    """把分词请求转发给嵌入服务（只支持返回input_ids，满足长代码分块的需要）"""
+    
+    def __init__(self, client: "RemoteEmbeddingService"):
+        self._client = client
+    
+    def __call__(self, texts: List[str], **kwargs) -> Dict[str, List[List[int]]]:
+        return {"input_ids": self._client._call("tokenize", texts=list(texts), **kwargs)}
+
+
+class RemoteEmbeddingService:
+    """嵌入服务客户端，接口与EmbeddingService一致"""
+    
+    def __init__(self, socket_path: Optional[str] = None, timeout: Optional[float] = None):
+        """
+        初始化客户端并读取模型信息
+        
+        Args:
+            socket_path: Unix socket路径（默认使用EMBEDDING_SERVER_SOCKET配置）
+            timeout: 单次请求的超时秒数（默认使用EMBEDDING_SERVER_TIMEOUT配置）
+        """
+        self.socket_path = str(socket_path or settings.EMBEDDING_SERVER_SOCKET)
+        self.timeout = timeout or settings.EMBEDDING_SERVER_TIMEOUT
+        self.last_batch_stats: Dict = {}
+        self._conn: Optional[Connection] = None
+        self._lock = threading.Lock()
+        # 分词也由嵌入服务完成，导入transformers会连带加载torch
+        self.tokenizer = _RemoteTokenizer(self)
+        
+        info = self._call("info")
+        self.model_key = info["model_key"]
+        self.dimension = info["dimension"]
+        self.max_seq_length = info["max_seq_length"]
+        self.backend = info["backend"]
+        print(f"✅ 已连接到嵌入服务: {self.socket_path}（{self.model_key}）")
+    
+    def _call(self, method: str, **kwargs) -> Any:
+        """发送请求并等待结果；连接断开（如服务重启）时重连一次"""
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._conn is None:
+                        self._conn = Client(self.socket_path, family="AF_UNIX", authkey=_authkey())
+                    self._conn.send((method, kwargs))
+                    if not self._conn.poll(self.timeout):
+                        raise TimeoutError(f"嵌入服务 {self.timeout} 秒内没有响应")
+                    status, result = self._conn.recv()
+                    break
+                except (EOFError, OSError) as e:
+                    self._close_connection()
+                    if attempt == 1 or isinstance(e, TimeoutError):
+                        raise ConnectionError(f"无法连接嵌入服务 {self.socket_path}: {e}")
+        
+        if status != "ok":
+            raise Exception(f"嵌入服务返回错误: {result}")
+        return result
+    
+    def _close_connection(self):
+        """关闭当前连接（下次请求时重新连接）"""
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except OSError:
+                pass
+            self._conn = None
+    
+    def encode_code(self, code: str) -> np.ndarray:
+        """
+        将代码文本编码为向量
+        
+        Args:
+            code: 代码文本
+        
+        Returns:
+            向量（numpy数组）
+        """
+        return self.encode_batch([code], show_progress=False)[0]
+    
+    def encode_batch(
+        self,
+        codes: List[str],
+        batch_size: int = 32,
+        max_batch_tokens: Optional[int] = None,
+        show_progress: bool = True
+    ) -> List[np.ndarray]:
+        """
+        批量编码代码（由嵌入服务进程按token长度分桶编码）
+        
+        Args:
+            codes: 代码文本列表
+            batch_size: 每批最多条数
+            max_batch_tokens: 每批的token预算（默认使用服务进程的EMBEDDING_MAX_BATCH_TOKENS配置）
+            show_progress: 是否显示吞吐统计
+        
+        Returns:
+            向量列表（与输入顺序一致）
+        """
+        if not codes:
+            return []
+        
+        vectors, stats = self._call(
+            "encode_batch",
+            codes=list(codes),
+            batch_size=batch_size,
+            max_batch_tokens=max_batch_tokens
+        )
+        self.last_batch_stats = stats
+        if show_progress:
+            print(f"  编码 {len(codes)} 条（嵌入服务），{stats['tokens_per_second']:.0f} tokens/秒")
+        return list(vectors)
+    
+    def token_lengths(self, codes: List[str]) -> List[int]:
+        """计算每段文本编码后的token数（含特殊token，按模型最大长度截断）"""
+        encoded = self.tokenizer(
+            codes,
+            add_special_tokens=True,
+            truncation=True,
+            max_length=self.max_seq_length
+        )["input_ids"]
+        return [len(ids) for ids in encoded]
+    
+    def get_dimension(self) -> int:
+        """获取向量维度"""
+        return self.dimension
+    
+    def close(self):
+        """关闭连接"""
+        with self._lock:
+            self._close_connection()
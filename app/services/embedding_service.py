@@ -3,16 +3,12 @@
 """
 
 import os
+import threading
+import time
 from typing import List, Optional
 import numpy as np
 from app.core.config import settings
-
-try:
-    from sentence_transformers import SentenceTransformer
-    HAS_SENTENCE_TRANSFORMERS = True
-except ImportError:
-    HAS_SENTENCE_TRANSFORMERS = False
-    SentenceTransformer = None
+from app.services.embedding_cache import embedding_model_key
 
 
 class EmbeddingService:
@@ -20,7 +16,10 @@ class EmbeddingService:
     
     def __init__(self):
         """初始化嵌入服务"""
-        if not HAS_SENTENCE_TRANSFORMERS:
+        # 延迟导入：sentence-transformers会连带加载torch，只在创建服务时导入
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
             raise ImportError("sentence-transformers未安装，请运行: pip install sentence-transformers")
         
         model_name = settings.EMBEDDING_MODEL
@@ -39,9 +38,38 @@ class EmbeddingService:
         try:
             self.model = SentenceTransformer(model_name, device=device)
             self.dimension = self.model.get_sentence_embedding_dimension()
+            # 模型的tokenizer，用于按token数切分长代码和分桶批处理
+            self.tokenizer = self.model.tokenizer
+            self.max_seq_length = self.model.max_seq_length
             print(f"✅ 模型加载成功，向量维度: {self.dimension}")
         except Exception as e:
             raise Exception(f"加载嵌入模型失败: {str(e)}")
+        
+        # 推理后端：torch（默认）或 onnx（CPU上用ONNX Runtime，可选int8量化）
+        self.backend = "torch"
+        self.onnx_encoder = None
+        backend = settings.EMBEDDING_BACKEND.lower()
+        if backend == "onnx":
+            if device != "cpu":
+                print("[!] ONNX后端只用于CPU推理，继续使用torch后端")
+            else:
+                try:
+                    from app.services.onnx_encoder import OnnxEncoder
+                    self.onnx_encoder = OnnxEncoder(
+                        self.model,
+                        model_name,
+                        settings.EMBEDDING_ONNX_DIR,
+                        quantize=settings.EMBEDDING_ONNX_QUANTIZE,
+                        num_threads=settings.EMBEDDING_ONNX_THREADS
+                    )
+                    self.backend = "onnx"
+                except ImportError as e:
+                    print(f"[!] {e}，继续使用torch后端")
+        elif backend != "torch":
+            raise ValueError(f"不支持的嵌入后端: {settings.EMBEDDING_BACKEND}（可选 torch、onnx）")
+        
+        # 向量缓存使用的模型标识（按实际使用的后端区分）
+        self.model_key = embedding_model_key(model_name, self.backend)
     
     def encode_code(self, code: str) -> np.ndarray:
         """
@@ -54,34 +82,136 @@ class EmbeddingService:
             向量（numpy数组）
         """
         try:
-            # 使用模型编码
-            vector = self.model.encode(code, convert_to_numpy=True)
-            return vector
+            # 使用当前后端编码
+            return self._encode_texts([code])[0]
         except Exception as e:
             raise Exception(f"编码代码失败: {str(e)}")
     
-    def encode_batch(self, codes: List[str], batch_size: int = 32) -> List[np.ndarray]:
+    def encode_batch(
+        self,
+        codes: List[str],
+        batch_size: int = 32,
+        max_batch_tokens: Optional[int] = None,
+        show_progress: bool = True
+    ) -> List[np.ndarray]:
         """
         批量编码代码
         
+        按token长度从长到短排序后分批，每批的条数由token预算决定
+        （条数 × 批内最长长度 <= max_batch_tokens），短片段的批次更大，
+        长片段不会拖着短片段一起填充；编码完成后恢复原始顺序。
+        
         Args:
             codes: 代码文本列表
-            batch_size: 批处理大小
+            batch_size: 每批最多条数
+            max_batch_tokens: 每批的token预算（含填充，默认使用EMBEDDING_MAX_BATCH_TOKENS配置）
+            show_progress: 是否显示进度条和吞吐统计
         
         Returns:
-            向量列表
+            向量列表（与输入顺序一致）
         """
+        if not codes:
+            return []
+        
         try:
-            vectors = self.model.encode(
-                codes,
-                batch_size=batch_size,
-                convert_to_numpy=True,
-                show_progress_bar=True
-            )
-            return [vector for vector in vectors]
+            start = time.perf_counter()
+            lengths = self.token_lengths(codes)
+            batches = self._plan_batches(lengths, batch_size, max_batch_tokens)
+            
+            vectors: List[Optional[np.ndarray]] = [None] * len(codes)
+            iterator = batches
+            if show_progress and len(batches) > 1:
+                from tqdm import tqdm
+                iterator = tqdm(batches, desc="编码批次")
+            for indices in iterator:
+                batch_vectors = self._encode_texts([codes[i] for i in indices])
+                for i, vector in zip(indices, batch_vectors):
+                    vectors[i] = vector
+            
+            elapsed = time.perf_counter() - start
+            tokens = sum(lengths)
+            padded = sum(len(indices) * lengths[indices[0]] for indices in batches)
+            self.last_batch_stats = {
+                "texts": len(codes),
+                "batches": len(batches),
+                "tokens": tokens,
+                "padded_tokens": padded,
+                "seconds": elapsed,
+                "tokens_per_second": tokens / elapsed if elapsed > 0 else 0.0,
+            }
+            if show_progress:
+                print(
+                    f"  编码 {len(codes)} 条（{len(batches)} 批），{tokens} tokens，"
+                    f"{self.last_batch_stats['tokens_per_second']:.0f} tokens/秒，"
+                    f"填充占比 {1 - tokens / padded:.1%}"
+                )
+            return vectors
         except Exception as e:
             raise Exception(f"批量编码失败: {str(e)}")
     
+    def token_lengths(self, codes: List[str]) -> List[int]:
+        """
+        计算每段文本编码后的token数（含特殊token，超过模型最大长度的按截断后计算）
+        
+        Args:
+            codes: 代码文本列表
+        
+        Returns:
+            token数列表
+        """
+        encoded = self.tokenizer(
+            codes,
+            add_special_tokens=True,
+            truncation=True,
+            max_length=self.max_seq_length
+        )["input_ids"]
+        return [len(ids) for ids in encoded]
+    
+    @staticmethod
+    def _plan_batches(
+        lengths: List[int],
+        batch_size: int,
+        max_batch_tokens: Optional[int] = None
+    ) -> List[List[int]]:
+        """
+        按token长度分批
+        
+        Args:
+            lengths: 每条文本的token数
+            batch_size: 每批最多条数
+            max_batch_tokens: 每批的token预算（含填充）
+        
+        Returns:
+            批次列表，每批是原始下标列表；批内第一条最长
+        """
+        max_batch_tokens = max_batch_tokens or settings.EMBEDDING_MAX_BATCH_TOKENS
+        # 从长到短：最耗内存的批次最先执行，出问题时尽早暴露
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+        
+        batches = []
+        current: List[int] = []
+        for i in order:
+            # 排序后批内第一条最长，填充后的开销 = 条数 × 第一条的长度
+            longest = lengths[current[0]] if current else lengths[i]
+            if current and (len(current) >= batch_size or (len(current) + 1) * longest > max_batch_tokens):
+                batches.append(current)
+                current = []
+            current.append(i)
+        if current:
+            batches.append(current)
+        return batches
+    
+    def _encode_texts(self, texts: List[str]) -> np.ndarray:
+        """用当前后端编码一批文本（调用方负责分批）"""
+        if self.onnx_encoder is not None:
+            return self.onnx_encoder.encode(texts)
+        return self.model.encode(
+            texts,
+            batch_size=len(texts),
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+    
     def get_dimension(self) -> int:
         """获取向量维度"""
         return self.dimension
@@ -89,12 +219,24 @@ class EmbeddingService:
 
 # 全局实例
 _embedding_service: Optional[EmbeddingService] = None
+_embedding_service_lock = threading.Lock()
 
 
 def get_embedding_service() -> EmbeddingService:
-    """获取嵌入服务实例（单例模式）"""
+    """
+    获取嵌入服务实例（单例模式，线程安全）
+    
+    EMBEDDING_MODE=server 时返回共享嵌入服务的客户端（接口与EmbeddingService一致）
+    """
     global _embedding_service
     if _embedding_service is None:
-        _embedding_service = EmbeddingService()
+        # 后台预热线程和请求可能同时首次调用，加锁避免重复加载模型
+        with _embedding_service_lock:
+            if _embedding_service is None:
+                if settings.EMBEDDING_MODE.lower() == "server":
+                    from app.services.embedding_server import RemoteEmbeddingService
+                    _embedding_service = RemoteEmbeddingService()
+                else:
+                    _embedding_service = EmbeddingService()
     return _embedding_service
 
@@ -0,0 +1,182 @@
+"""
+复用说明缓存 - 按 (代码内容, 语言, 模型, 依赖库, 可选的查询) 持久化LLM生成的说明
+
+热门代码片段的说明会被反复生成，每次都要几秒并产生API费用。说明保存在
+SQLite（WAL模式）中，多个API工作进程共用同一个数据库文件；超过有效期的
+说明视为未命中并在下次生成后覆盖，条目数超过上限时淘汰最久未使用的说明。
+"""
+
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from app.core.config import settings
+from app.services.code_cleaner import content_hash
+
+
+def normalize_query(query: str) -> str:
+    """规范化查询：忽略大小写和多余空白，措辞相同的查询共用缓存"""
+    return re.sub(r'\s+', ' ', (query or "").strip().lower())
+
+
+def explanation_cache_key(
+    code: str,
+    language: str,
+    model: str,
+    dependencies: Optional[List[str]] = None,
+    query: Optional[str] = None
+) -> str:
+    """
+    生成说明的缓存键
+    
+    Args:
+        code: 代码片段
+        language: 编程语言
+        model: 生成说明的模型（含提供商）
+        dependencies: 依赖库列表（会写入提示词，顺序无关）
+        query: 用户查询（为None时不区分查询）
+    
+    Returns:
+        缓存键（十六进制哈希）
+    """
+    parts = [
+        content_hash(code),
+        (language or "").lower(),
+        model,
+        ",".join(sorted(set(dependencies or []))),
+        normalize_query(query) if query is not None else "",
+    ]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class ExplanationCache:
+    """基于SQLite的复用说明缓存（可在多个进程间共享）"""
+    
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        ttl: Optional[float] = None,
+        max_entries: Optional[int] = None
+    ):
+        """
+        初始化说明缓存
+        
+        Args:
+            path: 数据库文件路径（默认使用EXPLANATION_CACHE_PATH配置）
+            ttl: 说明的有效期秒数，过期后重新生成（默认使用EXPLANATION_CACHE_TTL配置）
+            max_entries: 最多保存的说明数（默认使用EXPLANATION_CACHE_MAX_ENTRIES配置）
+        """
+        self.path = Path(path or settings.EXPLANATION_CACHE_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl if ttl is not None else settings.EXPLANATION_CACHE_TTL
+        self.max_entries = max_entries if max_entries is not None else settings.EXPLANATION_CACHE_MAX_ENTRIES
+        
+        self._lock = threading.Lock()
+        # 其他进程写入时最多等待5秒
+        self._conn = sqlite3.connect(str(self.path), timeout=5.0, check_same_thread=False)
+        self._init_schema()
+    
+    def _init_schema(self):
+        """创建表结构"""
+        conn = self._conn
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS explanations (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                explanation TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_explanations_accessed ON explanations (accessed_at);
+        """)
+        conn.commit()
+    
+    def get(self, key: str) -> Optional[str]:
+        """
+        读取缓存的说明
+        
+        Args:
+            key: 缓存键（见explanation_cache_key）
+        
+        Returns:
+            说明文本，未命中或已过期时返回None
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT explanation, created_at FROM explanations WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                return None
+            self._conn.execute(
+                "UPDATE explanations SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            return row[0]
+    
+    def put(self, key: str, model: str, explanation: str):
+        """
+        写入说明（覆盖已有的条目），超过条目上限时淘汰最久未使用的说明
+        
+        Args:
+            key: 缓存键
+            model: 生成说明的模型
+            explanation: 说明文本
+        """
+        if not explanation:
+            return
+        
+        now = time.time()
+        with self._lock:
+            conn = self._conn
+            conn.execute(
+                "INSERT OR REPLACE INTO explanations (key, model, explanation, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model, explanation, now, now)
+            )
+            conn.execute("DELETE FROM explanations WHERE created_at < ?", (now - self.ttl,))
+            excess = conn.execute("SELECT COUNT(*) FROM explanations").fetchone()[0] - self.max_entries
+            if excess > 0:
+                conn.execute(
+                    "DELETE FROM explanations WHERE key IN "
+                    "(SELECT key FROM explanations ORDER BY accessed_at LIMIT ?)",
+                    (excess,)
+                )
+            conn.commit()
+    
+    def count(self) -> int:
+        """缓存中的说明数"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM explanations").fetchone()[0]
+    
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM explanations")
+            self._conn.commit()
+    
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+# 全局实例
+_explanation_cache: Optional[ExplanationCache] = None
+_explanation_cache_lock = threading.Lock()
+
+
+def get_explanation_cache() -> ExplanationCache:
+    """获取说明缓存实例（单例模式）"""
+    global _explanation_cache
+    if _explanation_cache is None:
+        with _explanation_cache_lock:
+            if _explanation_cache is None:
+                _explanation_cache = ExplanationCache()
+    return _explanation_cache
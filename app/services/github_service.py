@@ -4,13 +4,56 @@ GitHub API服务 - 用于采集开源代码
 
 import os
 import time
-from typing import List, Dict, Optional
+import threading
+from typing import List, Dict, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
 from github import Github
 from github.Repository import Repository
 from github.ContentFile import ContentFile
 from app.core.config import settings
 
 
+class RateLimiter:
+    """线程安全的令牌桶限速器，多个下载线程共享同一个实例"""
+    
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        """
+        初始化限速器
+        
+        Args:
+            rate: 每秒允许的请求数（<=0 表示不限速）
+            burst: 令牌桶容量（默认等于rate，至少为1）
+        """
+        self.rate = rate
+        self.capacity = max(1, burst if burst is not None else int(rate))
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """获取一个令牌，令牌不足时阻塞等待"""
+        if self.rate <= 0:
+            return
+        
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity,
+                    self._tokens + (now - self._last) * self.rate
+                )
+                self._last = now
+                
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                
+                wait_time = (1 - self._tokens) / self.rate
+            
+            time.sleep(wait_time)
+
+
 class GitHubService:
     """GitHub API服务类"""
     
@@ -20,8 +63,21 @@ class GitHubService:
         if not token:
             raise ValueError("未配置GITHUB_TOKEN，请在.env文件中设置")
         
-        self.github = Github(token)
+        # 连接池大小需覆盖并发下载线程数
+        self.github = Github(token, pool_size=max(10, settings.COLLECT_DOWNLOAD_WORKERS))
         self.rate_limit = settings.GITHUB_RATE_LIMIT
+        # 所有线程共享的请求限速器
+        self.limiter = RateLimiter(settings.GITHUB_REQUESTS_PER_SECOND)
+        
+        # 增量采集使用的REST会话（PyGithub不支持条件请求）
+        self.api_url = "https://api.github.com"
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {token}",
+            "Accept": "application/vnd.github+json",
+        })
+        adapter = HTTPAdapter(pool_maxsize=max(10, settings.COLLECT_DOWNLOAD_WORKERS))
+        self.session.mount("https://", adapter)
     
     def search_repositories(
         self,
@@ -88,6 +144,7 @@ class GitHubService:
             文件列表
         """
         try:
+            self.limiter.acquire()
             contents = repo.get_contents(path)
             files = []
             
@@ -137,6 +194,7 @@ class GitHubService:
                 print(f"文件过大，跳过: {content_file.path} ({content_file.size} bytes)")
                 return None
             
+            self.limiter.acquire()
             content = content_file.decoded_content.decode('utf-8')
             return content
         
@@ -178,6 +236,109 @@ class GitHubService:
             "license": license_name,
         }
     
+    def get_head_commit(
+        self,
+        repo_full_name: str,
+        branch: str,
+        etag: Optional[str] = None
+    ) -> Optional[Dict]:
+        """
+        获取分支最新提交（条件请求）
+        
+        Args:
+            repo_full_name: 仓库全名（owner/repo）
+            branch: 分支名称
+            etag: 上次请求返回的ETag，用于If-None-Match
+        
+        Returns:
+            {"sha": 提交SHA, "etag": 新的ETag}；分支未变化（304）时返回None
+        """
+        headers = {"If-None-Match": etag} if etag else {}
+        self.limiter.acquire()
+        response = self.session.get(
+            f"{self.api_url}/repos/{repo_full_name}/commits/{branch}",
+            headers=headers,
+            timeout=30
+        )
+        
+        # 304不计入GitHub速率限制
+        if response.status_code == 304:
+            return None
+        
+        response.raise_for_status()
+        return {
+            "sha": response.json()["sha"],
+            "etag": response.headers.get("ETag"),
+        }
+    
+    def get_repository_tree(
+        self,
+        repo_full_name: str,
+        commit_sha: str,
+        file_extensions: Optional[List[str]] = None
+    ) -> Dict[str, Tuple[str, int]]:
+        """
+        一次请求获取提交对应的完整文件树
+        
+        Args:
+            repo_full_name: 仓库全名（owner/repo）
+            commit_sha: 提交SHA
+            file_extensions: 文件扩展名过滤（如['.py', '.java']）
+        
+        Returns:
+            文件路径 -> (blob SHA, 文件大小)
+        """
+        self.limiter.acquire()
+        response = self.session.get(
+            f"{self.api_url}/repos/{repo_full_name}/git/trees/{commit_sha}",
+            params={"recursive": "1"},
+            timeout=60
+        )
+        response.raise_for_status()
+        data = response.json()
+        
+        if data.get("truncated"):
+            print(f"警告: {repo_full_name} 文件树过大，GitHub返回的结果被截断")
+        
+        files = {}
+        for item in data.get("tree", []):
+            if item.get("type") != "blob":
+                continue
+            path = item["path"]
+            if file_extensions and not any(path.endswith(ext) for ext in file_extensions):
+                continue
+            files[path] = (item["sha"], item.get("size", 0))
+        
+        return files
+    
+    def get_blob_content(self, repo_full_name: str, blob_sha: str) -> Optional[str]:
+        """
+        按blob SHA获取文件内容（blob不可变，无需条件请求）
+        
+        Args:
+            repo_full_name: 仓库全名（owner/repo）
+            blob_sha: 文件blob SHA
+        
+        Returns:
+            文件内容（文本）
+        """
+        try:
+            self.limiter.acquire()
+            response = self.session.get(
+                f"{self.api_url}/repos/{repo_full_name}/git/blobs/{blob_sha}",
+                headers={"Accept": "application/vnd.github.raw"},
+                timeout=60
+            )
+            response.raise_for_status()
+            return response.content.decode('utf-8')
+        
+        except UnicodeDecodeError:
+            print(f"无法解码文件: {repo_full_name}@{blob_sha}")
+            return None
+        except Exception as e:
+            print(f"获取文件内容失败 {repo_full_name}@{blob_sha}: {str(e)}")
+            return None
+    
     def _check_rate_limit(self):
         """检查并等待速率限制"""
         rate_limit = self.github.get_rate_limit()
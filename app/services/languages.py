@@ -0,0 +1,373 @@
+"""
+语言注册表 - 描述各编程语言的tree-sitter语法、文件扩展名和片段节点
+
+新增语言只需在 LANGUAGE_SPECS 中添加一条 LanguageSpec（导入语句解析函数可选），
+语法库在第一次使用时才会导入。
+"""
+
+import importlib
+import re
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    from tree_sitter import Language
+except ImportError:
+    Language = None
+
+
+class LanguageSpec:
+    """单个编程语言的描述"""
+    
+    def __init__(
+        self,
+        name: str,
+        module: str,
+        extensions: Sequence[str],
+        snippet_nodes: Dict[str, Tuple],
+        language_func: str = "language",
+        import_nodes: Optional[Dict[str, Callable]] = None
+    ):
+        """
+        初始化语言描述
+        
+        Args:
+            name: 语言名称（如python）
+            module: tree-sitter语法包的模块名（如tree_sitter_python）
+            extensions: 文件扩展名列表
+            snippet_nodes: 需要提取的定义节点，节点类型 -> 规则元组：
+                (片段类型[, 名称字段路径[, 允许的名称节点类型]])
+                名称字段路径默认为('name',)，即取节点的name字段；
+                允许的名称节点类型为None时不限制
+            language_func: 语法包中返回语言指针的函数名
+            import_nodes: 导入语句节点类型 -> 解析函数，解析函数接收节点，
+                返回归一化后的顶层包名列表（相对导入/项目内文件返回空列表）
+        """
+        self.name = name
+        self.module = module
+        self.extensions = list(extensions)
+        self.language_func = language_func
+        self.import_nodes = dict(import_nodes or {})
+        self.snippet_nodes = {
+            node_type: self._normalize_rule(rule)
+            for node_type, rule in snippet_nodes.items()
+        }
+        
+        self._language = None
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _normalize_rule(rule: Tuple) -> Tuple[str, Tuple[str, ...], Optional[Tuple[str, ...]]]:
+        """补全规则元组的默认值"""
+        snippet_type = rule[0]
+        name_fields = tuple(rule[1]) if len(rule) > 1 else ('name',)
+        name_types = tuple(rule[2]) if len(rule) > 2 and rule[2] else None
+        return snippet_type, name_fields, name_types
+    
+    @property
+    def snippet_types(self) -> List[str]:
+        """该语言支持的片段类型"""
+        return sorted({rule[0] for rule in self.snippet_nodes.values()})
+    
+    def get_language(self):
+        """获取tree-sitter语言对象（首次调用时才导入语法包）"""
+        if self._language is None:
+            with self._lock:
+                if self._language is None:
+                    if Language is None:
+                        raise ImportError("tree-sitter未安装，请运行: pip install tree-sitter")
+                    module = importlib.import_module(self.module)
+                    # tree-sitter 0.25+ API: 需要将language函数的结果包装为Language对象
+                    self._language = Language(getattr(module, self.language_func)())
+        return self._language
+
+
+# ---------------------------------------------------------------------------
+# 导入语句解析：从语法树节点得到顶层包名
+# ---------------------------------------------------------------------------
+
+_IDENTIFIER_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+
+def _node_text(node) -> str:
+    """节点对应的源码文本"""
+    return node.text.decode('utf8', errors='replace')
+
+
+def _string_value(node) -> str:
+    """字符串字面量节点的内容（去掉引号）"""
+    return _node_text(node).strip('\'"`')
+
+
+def _python_imports(node) -> List[str]:
+    """import a.b / import a as b / from a.b import c -> a（相对导入忽略）"""
+    if node.type == 'import_from_statement':
+        modules = [node.child_by_field_name('module_name')]
+    else:
+        modules = node.children_by_field_name('name')
+    
+    packages = []
+    for module in modules:
+        if module is None:
+            continue
+        if module.type == 'aliased_import':
+            module = module.child_by_field_name('name')
+        if module is not None and module.type == 'dotted_name':
+            packages.append(_node_text(module).split('.')[0])
+    return packages
+
+
+def _java_imports(node) -> List[str]:
+    """import org.example.pkg.Class -> org.example.pkg（包名最多保留3段）"""
+    for child in node.named_children:
+        if child.type in ('scoped_identifier', 'identifier'):
+            segments = []
+            for segment in _node_text(child).split('.'):
+                # 类名（首字母大写）之后的部分不属于包名
+                if not segment or segment[0].isupper():
+                    break
+                segments.append(segment)
+            return ['.'.join(segments[:3])] if segments else []
+    return []
+
+
+def _cpp_includes(node) -> List[str]:
+    """#include <boost/asio.hpp> -> boost（引号形式的项目内头文件忽略）"""
+    path = node.child_by_field_name('path')
+    if path is None or path.type != 'system_lib_string':
+        return []
+    header = _node_text(path).strip('<>').strip()
+    return [header.split('/')[0].split('.')[0]] if header else []
+
+
+def _go_imports(node) -> List[str]:
+    """github.com/owner/repo/pkg -> github.com/owner/repo；标准库 net/http -> net"""
+    path = node.child_by_field_name('path')
+    if path is None:
+        return []
+    segments = _string_value(path).split('/')
+    if not segments[0]:
+        return []
+    if '.' in segments[0]:
+        return ['/'.join(segments[:3])]
+    return [segments[0]]
+
+
+def _rust_uses(node) -> List[str]:
+    """use serde::{...} / extern crate rand -> crate名（crate/self/super 忽略）"""
+    if node.type == 'extern_crate_declaration':
+        target = node.child_by_field_name('name')
+    else:
+        target = node.child_by_field_name('argument')
+    if target is None:
+        return []
+    
+    match = _IDENTIFIER_PATTERN.match(_node_text(target).lstrip(':'))
+    if not match or match.group(0) in ('crate', 'self', 'super'):
+        return []
+    return [match.group(0)]
+
+
+def _js_module(specifier: str) -> List[str]:
+    """npm模块名：@scope/pkg/sub -> @scope/pkg，pkg/sub -> pkg（相对路径忽略）"""
+    if not specifier or specifier.startswith(('.', '/')):
+        return []
+    if specifier.startswith('node:'):
+        specifier = specifier[len('node:'):]
+    segments = specifier.split('/')
+    if specifier.startswith('@'):
+        return ['/'.join(segments[:2])]
+    return [segments[0]]
+
+
+def _js_imports(node) -> List[str]:
+    """import ... from 'x' / export ... from 'x' / require('x') / import('x')"""
+    if node.type == 'call_expression':
+        function = node.child_by_field_name('function')
+        if function is None or _node_text(function) not in ('require', 'import'):
+            return []
+        arguments = node.child_by_field_name('arguments')
+        if arguments is None or not arguments.named_children:
+            return []
+        source = arguments.named_children[0]
+        return _js_module(_string_value(source)) if source.type == 'string' else []
+    
+    source = node.child_by_field_name('source')
+    if source is None:
+        # TypeScript: import x = require('x')
+        for child in node.named_children:
+            if child.type == 'import_require_clause':
+                source = child.child_by_field_name('source')
+    return _js_module(_string_value(source)) if source is not None else []
+
+
+def _csharp_usings(node) -> List[str]:
+    """using System.Collections.Generic -> System.Collections（最多保留2段）"""
+    targets = [
+        child for child in node.named_children
+        if child.type in ('qualified_name', 'identifier')
+    ]
+    if not targets:
+        return []
+    # 别名形式 using J = Newtonsoft.Json 中最后一个才是命名空间
+    return ['.'.join(_node_text(targets[-1]).split('.')[:2])]
+
+
+# 已注册的语言
+LANGUAGE_SPECS: Dict[str, LanguageSpec] = {
+    spec.name: spec for spec in [
+        LanguageSpec(
+            name='python',
+            module='tree_sitter_python',
+            extensions=['.py'],
+            snippet_nodes={
+                'function_definition': ('function',),
+                'class_definition': ('class',),
+            },
+            import_nodes={
+                'import_statement': _python_imports,
+                'import_from_statement': _python_imports,
+            },
+        ),
+        LanguageSpec(
+            name='java',
+            module='tree_sitter_java',
+            extensions=['.java'],
+            snippet_nodes={
+                'method_declaration': ('function',),
+                'class_declaration': ('class',),
+            },
+            import_nodes={
+                'import_declaration': _java_imports,
+            },
+        ),
+        LanguageSpec(
+            name='cpp',
+            module='tree_sitter_cpp',
+            extensions=['.cpp', '.cc', '.cxx', '.c', '.h', '.hpp'],
+            snippet_nodes={
+                'function_definition': ('function', ('declarator', 'declarator'), ('identifier',)),
+                'class_specifier': ('class', ('name',), ('type_identifier',)),
+            },
+            import_nodes={
+                'preproc_include': _cpp_includes,
+            },
+        ),
+        LanguageSpec(
+            name='go',
+            module='tree_sitter_go',
+            extensions=['.go'],
+            snippet_nodes={
+                'function_declaration': ('function',),
+                'method_declaration': ('function',),
+                'type_spec': ('class',),
+            },
+            import_nodes={
+                'import_spec': _go_imports,
+            },
+        ),
+        LanguageSpec(
+            name='rust',
+            module='tree_sitter_rust',
+            extensions=['.rs'],
+            snippet_nodes={
+                'function_item': ('function',),
+                'struct_item': ('class',),
+                'enum_item': ('class',),
+                'trait_item': ('class',),
+            },
+            import_nodes={
+                'use_declaration': _rust_uses,
+                'extern_crate_declaration': _rust_uses,
+            },
+        ),
+        LanguageSpec(
+            name='javascript',
+            module='tree_sitter_javascript',
+            extensions=['.js', '.jsx', '.mjs', '.cjs'],
+            snippet_nodes={
+                'function_declaration': ('function',),
+                'generator_function_declaration': ('function',),
+                'method_definition': ('function',),
+                'class_declaration': ('class',),
+            },
+            import_nodes={
+                'import_statement': _js_imports,
+                'export_statement': _js_imports,
+                'call_expression': _js_imports,
+            },
+        ),
+        LanguageSpec(
+            name='typescript',
+            module='tree_sitter_typescript',
+            extensions=['.ts'],
+            language_func='language_typescript',
+            snippet_nodes={
+                'function_declaration': ('function',),
+                'generator_function_declaration': ('function',),
+                'method_definition': ('function',),
+                'class_declaration': ('class',),
+                'abstract_class_declaration': ('class',),
+                'interface_declaration': ('class',),
+            },
+            import_nodes={
+                'import_statement': _js_imports,
+                'export_statement': _js_imports,
+                'call_expression': _js_imports,
+            },
+        ),
+        LanguageSpec(
+            name='tsx',
+            module='tree_sitter_typescript',
+            extensions=['.tsx'],
+            language_func='language_tsx',
+            snippet_nodes={
+                'function_declaration': ('function',),
+                'method_definition': ('function',),
+                'class_declaration': ('class',),
+                'interface_declaration': ('class',),
+            },
+            import_nodes={
+                'import_statement': _js_imports,
+                'export_statement': _js_imports,
+                'call_expression': _js_imports,
+            },
+        ),
+        LanguageSpec(
+            name='csharp',
+            module='tree_sitter_c_sharp',
+            extensions=['.cs'],
+            snippet_nodes={
+                'method_declaration': ('function',),
+                'constructor_declaration': ('function',),
+                'class_declaration': ('class',),
+                'struct_declaration': ('class',),
+                'interface_declaration': ('class',),
+            },
+            import_nodes={
+                'using_directive': _csharp_usings,
+            },
+        ),
+    ]
+}
+
+# 扩展名 -> 语言名称
+EXTENSION_MAP: Dict[str, str] = {
+    ext: spec.name for spec in LANGUAGE_SPECS.values() for ext in spec.extensions
+}
+
+
+def get_language_spec(language: str) -> Optional[LanguageSpec]:
+    """根据语言名称获取语言描述"""
+    return LANGUAGE_SPECS.get(language)
+
+
+def detect_language(file_path: str) -> Optional[str]:
+    """根据文件扩展名检测编程语言"""
+    return EXTENSION_MAP.get(Path(file_path).suffix.lower())
+
+
+def list_languages() -> List[str]:
+    """已注册的语言名称列表"""
+    return list(LANGUAGE_SPECS.keys())
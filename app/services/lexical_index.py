@@ -0,0 +1,681 @@
+"""
+词法索引 - 基于BM25的倒排索引，补充向量检索对精确标识符的召回
+
+CodeBERT向量对 "parse_args"、"HttpClient" 这类精确标识符的召回不稳定。
+片段名称、标识符（完整形式以及按camelCase/snake_case拆分的子词）写入倒排索引，
+检索时与向量检索的结果按RRF（倒数排名融合）合并。
+
+索引分两层：SQLite保存每个片段的词频，采集时增量写入和删除；build() 把它编译成
+只读的numpy数组快照（词项哈希、倒排表、文档长度），API进程以内存映射方式加载，
+启动时不需要重建索引。快照更新后，各进程在下次检索时自动切换到新快照。
+
+每次写入都带有递增的版本号，删除的片段记录为墓碑。检索时从SQLite读取快照之后
+写入和删除的片段（增量）与快照合并，API写入只更新SQLite、立即可见；快照由API
+进程的后台线程在写入停止后重新编译，多个进程通过SQLite中的租约保证同一时间只有
+一个进程在编译。
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+
+# 标识符（不含纯数字）
+_IDENTIFIER_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+# 标识符拆分为子词：XMLParser -> XML Parser，parseArgs -> parse Args，parse_args -> parse args
+_SUBWORD_PATTERN = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+')
+
+# 快照中的数组文件
+_SNAPSHOT_ARRAYS = (
+    "term_hashes", "term_offsets", "post_docs", "post_tfs",
+    "doc_lengths", "doc_ids", "doc_languages", "doc_repos",
+)
+
+# 编译租约的有效期（秒），持有租约的进程异常退出后其他进程可以在过期后接管
+_BUILD_LEASE_SECONDS = 30 * 60
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    把代码或查询切分为词项：每个标识符保留完整形式（小写），
+    由多个部分组成时再加入各个子词
+    
+    Args:
+        text: 代码或查询文本
+    
+    Returns:
+        词项列表（可重复，用于统计词频）
+    """
+    terms = []
+    for identifier in _IDENTIFIER_PATTERN.findall(text or ""):
+        if len(identifier) > 1:
+            terms.append(identifier.lower())
+        parts = _SUBWORD_PATTERN.findall(identifier)
+        if len(parts) > 1:
+            terms.extend(part.lower() for part in parts if len(part) > 1)
+    return terms
+
+
+def _term_hash(term: str) -> int:
+    """词项的64位哈希（快照中按哈希查找词项）"""
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[str]],
+    k: Optional[int] = None
+) -> List[Tuple[str, float]]:
+    """
+    倒数排名融合：每个排序列表中排在第r位（从1开始）的条目得分 1 / (k + r)，累加后排序
+    
+    Args:
+        rankings: 多个按相关度排序的ID列表
+        k: 平滑常数，越大排名靠后的条目影响越大（默认使用SEARCH_RRF_K配置）
+    
+    Returns:
+        [(ID, 融合得分)]，按得分降序；得分相同时保持首次出现的顺序
+    """
+    k = k or settings.SEARCH_RRF_K
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class LexicalIndex:
+    """BM25倒排索引：SQLite保存片段词频，检索使用内存映射的只读快照"""
+    
+    def __init__(self, path: Optional[str] = None):
+        """
+        初始化词法索引
+        
+        Args:
+            path: 索引目录（默认使用LEXICAL_INDEX_DIR配置）
+        """
+        self.path = Path(path or settings.LEXICAL_INDEX_DIR)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.k1 = settings.LEXICAL_BM25_K1
+        self.b = settings.LEXICAL_BM25_B
+        self.name_weight = settings.LEXICAL_NAME_WEIGHT
+        
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path / "docs.db"), timeout=5.0, check_same_thread=False)
+        self._init_schema()
+        
+        self._snapshot: Optional[Dict] = None
+        self._snapshot_name: Optional[str] = None
+        self._checked_at = 0.0
+        self._delta: Optional[Dict] = None
+        
+        self._owner = uuid.uuid4().hex
+        self._builder: Optional[threading.Thread] = None
+        self._stop_builder = threading.Event()
+    
+    def _init_schema(self):
+        """创建表结构"""
+        conn = self._conn
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (
+                code_id TEXT PRIMARY KEY,
+                repo_name TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                language TEXT NOT NULL,
+                length REAL NOT NULL,
+                terms TEXT NOT NULL,
+                version INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_docs_file ON docs (repo_name, file_path);
+            CREATE TABLE IF NOT EXISTS deleted (
+                code_id TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS build_lease (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+            INSERT OR IGNORE INTO build_lease (id, owner, expires_at) VALUES (0, '', 0);
+        """)
+        # 兼容旧版本的索引库（docs表没有version列）
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(docs)")}
+        if "version" not in columns:
+            conn.execute("ALTER TABLE docs ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_docs_version ON docs (version)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_deleted_version ON deleted (version)")
+        conn.commit()
+    
+    # ===== 写入（采集时使用） =====
+    
+    def _document_terms(self, snippet: Dict) -> Dict[str, float]:
+        """统计片段的词频，名称中的词项按LEXICAL_NAME_WEIGHT加权"""
+        counts = Counter(tokenize(snippet.get("code", "")))
+        for term in tokenize(snippet.get("name", "")):
+            counts[term] += self.name_weight
+        return dict(counts)
+    
+    def _bump_version(self) -> int:
+        """
+        数据变化前递增版本号并记录写入时间（build据此判断是否需要重新编译快照，
+        检索据此读取快照之后的增量）；在写事务中调用，回滚时版本号一并恢复
+        
+        Returns:
+            本次写入的版本号
+        """
+        self._conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('updated_at', ?)", (int(time.time()),)
+        )
+        return self._conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+    
+    def _mark_deleted(self, code_ids: Sequence[str], version: int):
+        """记录删除的片段（检索时从旧快照的结果中去掉）"""
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO deleted (code_id, version) VALUES (?, ?)",
+            [(code_id, version) for code_id in code_ids]
+        )
+    
+    def add_snippets(self, snippets: Iterable[Dict]) -> int:
+        """
+        写入（或覆盖）代码片段
+        
+        Args:
+            snippets: 片段列表，需要包含code_id，可包含name、code、language、repo_name、file_path
+        
+        Returns:
+            写入的片段数
+        """
+        rows = []
+        for snippet in snippets:
+            if not snippet.get("code_id"):
+                continue
+            terms = self._document_terms(snippet)
+            rows.append((
+                snippet["code_id"],
+                snippet.get("repo_name") or "",
+                snippet.get("file_path") or "",
+                snippet.get("language") or "",
+                float(sum(terms.values())),
+                json.dumps(terms, ensure_ascii=False),
+            ))
+        if not rows:
+            return 0
+        
+        with self._lock:
+            version = self._bump_version()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO docs (code_id, repo_name, file_path, language, length, terms, version) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [row + (version,) for row in rows]
+            )
+            self._conn.commit()
+        return len(rows)
+    
+    def remove_file(self, repo_name: str, file_path: str) -> int:
+        """
+        删除某个文件的全部片段
+        
+        Returns:
+            删除的片段数
+        """
+        with self._lock:
+            version = self._bump_version()
+            code_ids = [row[0] for row in self._conn.execute(
+                "SELECT code_id FROM docs WHERE repo_name = ? AND file_path = ?", (repo_name, file_path)
+            )]
+            if not code_ids:
+                self._conn.rollback()
+                return 0
+            self._conn.execute("DELETE FROM docs WHERE repo_name = ? AND file_path = ?", (repo_name, file_path))
+            self._mark_deleted(code_ids, version)
+            self._conn.commit()
+        return len(code_ids)
+    
+    def remove_code_ids(self, code_ids: Sequence[str]) -> int:
+        """
+        按code_id删除片段
+        
+        Returns:
+            删除的片段数
+        """
+        if not code_ids:
+            return 0
+        with self._lock:
+            version = self._bump_version()
+            deleted = [
+                code_id for code_id in code_ids
+                if self._conn.execute("DELETE FROM docs WHERE code_id = ?", (code_id,)).rowcount
+            ]
+            if not deleted:
+                self._conn.rollback()
+                return 0
+            self._mark_deleted(deleted, version)
+            self._conn.commit()
+        return len(deleted)
+    
+    def clear(self):
+        """删除全部片段（重建索引前调用；检索仍使用旧快照，直到重建后编译出新快照）"""
+        with self._lock:
+            self._bump_version()
+            self._conn.execute("DELETE FROM docs")
+            self._conn.execute("DELETE FROM deleted")
+            self._conn.commit()
+    
+    def count(self) -> int:
+        """索引中的片段数"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+    
+    # ===== 编译快照 =====
+    
+    def _current_name(self) -> Optional[str]:
+        """当前快照的目录名"""
+        try:
+            return (self.path / "CURRENT").read_text(encoding="utf-8").strip() or None
+        except FileNotFoundError:
+            return None
+    
+    @staticmethod
+    def _snapshot_version(name: Optional[str]) -> Optional[int]:
+        """快照目录名（snapshot-{版本号}-{随机后缀}）中的版本号"""
+        if not name:
+            return None
+        return int(name.split("-")[1])
+    
+    def _acquire_build_lease(self) -> bool:
+        """尝试获取编译租约（租约已过期或由本实例持有时成功）"""
+        now = time.time()
+        with self._lock:
+            acquired = self._conn.execute(
+                "UPDATE build_lease SET owner = ?, expires_at = ? "
+                "WHERE id = 0 AND (expires_at < ? OR owner = ?)",
+                (self._owner, now + _BUILD_LEASE_SECONDS, now, self._owner)
+            ).rowcount == 1
+            self._conn.commit()
+        return acquired
+    
+    def _release_build_lease(self):
+        """释放编译租约"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE build_lease SET expires_at = 0 WHERE id = 0 AND owner = ?", (self._owner,)
+            )
+            self._conn.commit()
+    
+    def build(self, force: bool = False, wait: bool = True) -> bool:
+        """
+        把SQLite中的片段编译成新的只读快照并切换过去
+        
+        Args:
+            force: 数据没有变化时也重新编译
+            wait: 其他进程正在编译时等待其完成（False时直接返回）
+        
+        Returns:
+            是否生成了新快照
+        """
+        with self._build_lock:
+            while not self._acquire_build_lease():
+                if not wait:
+                    return False
+                time.sleep(0.5)
+            try:
+                return self._build(force)
+            finally:
+                self._release_build_lease()
+    
+    def _build(self, force: bool) -> bool:
+        """编译快照（调用方持有_build_lock和编译租约）"""
+        previous = self._current_name()
+        with self._lock:
+            # 版本号和片段在同一个读事务中读取，编译结果与版本号一致
+            self._conn.execute("BEGIN")
+            try:
+                version = self._conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+                if not force and self._snapshot_version(previous) == version:
+                    return False
+                rows = self._conn.execute(
+                    "SELECT code_id, repo_name, language, length, terms FROM docs ORDER BY code_id"
+                ).fetchall()
+            finally:
+                self._conn.commit()
+        
+        start = time.perf_counter()
+        languages = sorted({row[2] for row in rows})
+        repos = sorted({row[1] for row in rows})
+        language_codes = {language: i for i, language in enumerate(languages)}
+        repo_codes = {repo: i for i, repo in enumerate(repos)}
+        
+        # 展开为 (词项哈希, 文档序号, 词频)，再按哈希排序得到每个词项连续的倒排表
+        hash_cache: Dict[str, int] = {}
+        term_hashes, post_docs, post_tfs = [], [], []
+        for doc, (_, _, _, _, terms) in enumerate(rows):
+            for term, tf in json.loads(terms).items():
+                term_hash = hash_cache.get(term)
+                if term_hash is None:
+                    term_hash = hash_cache[term] = _term_hash(term)
+                term_hashes.append(term_hash)
+                post_docs.append(doc)
+                post_tfs.append(tf)
+        
+        hashes = np.array(term_hashes, dtype=np.uint64)
+        order = np.argsort(hashes, kind="stable")
+        hashes = hashes[order]
+        unique_hashes, starts = np.unique(hashes, return_index=True)
+        lengths = np.array([row[3] for row in rows], dtype=np.float32)
+        arrays = {
+            "term_hashes": unique_hashes,
+            "term_offsets": np.append(starts, len(hashes)).astype(np.int64),
+            "post_docs": np.array(post_docs, dtype=np.int32)[order],
+            "post_tfs": np.array(post_tfs, dtype=np.float32)[order],
+            "doc_lengths": lengths,
+            "doc_ids": np.array([row[0].encode("utf-8") for row in rows], dtype=bytes),
+            "doc_languages": np.array([language_codes[row[2]] for row in rows], dtype=np.int32),
+            "doc_repos": np.array([repo_codes[row[1]] for row in rows], dtype=np.int32),
+        }
+        meta = {
+            "version": version,
+            "built_at": time.time(),
+            "num_docs": len(rows),
+            "avg_length": float(lengths.mean()) if len(rows) else 0.0,
+            "languages": languages,
+            "repos": repos,
+        }
+        
+        # 先写临时目录再改名，最后替换CURRENT，读取方不会看到写了一半的快照。
+        # 每次编译使用新的目录名，不会覆盖其他进程正在加载的快照；临时目录以"."开头，
+        # 不会被下面清理旧快照时匹配到（持有租约时不会有其他进程在写临时目录）
+        suffix = uuid.uuid4().hex[:8]
+        name = f"snapshot-{version}-{suffix}"
+        for stale in self.path.glob(".staging-*"):
+            shutil.rmtree(stale, ignore_errors=True)
+        staging = self.path / f".staging-{suffix}"
+        staging.mkdir()
+        for key, array in arrays.items():
+            np.save(staging / f"{key}.npy", array)
+        with open(staging / "meta.json", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(staging, self.path / name)
+        
+        current_tmp = self.path / f".CURRENT-{suffix}"
+        current_tmp.write_text(name, encoding="utf-8")
+        os.replace(current_tmp, self.path / "CURRENT")
+        
+        # 删除更早的快照，保留上一个快照给刚读到旧CURRENT、还没加载完的进程
+        # （已经映射旧文件的进程不受影响）
+        for old in self.path.glob("snapshot-*"):
+            if old.name not in (name, previous) and old.is_dir():
+                shutil.rmtree(old, ignore_errors=True)
+        # 上一个快照之前的删除记录已经反映在保留的快照中
+        previous_version = self._snapshot_version(previous)
+        if previous_version is not None:
+            with self._lock:
+                self._conn.execute(
+                    "DELETE FROM deleted WHERE version <= ?", (min(previous_version, version),)
+                )
+                self._conn.commit()
+        
+        print(f"✅ 词法索引快照已更新: {len(rows)} 个片段，{len(unique_hashes)} 个词项，"
+              f"耗时 {time.perf_counter() - start:.2f} 秒")
+        return True
+    
+    def _build_due(self) -> bool:
+        """
+        是否需要在后台编译快照：有快照之后的写入，并且写入已经停止LEXICAL_INDEX_BUILD_DELAY秒，
+        或距上次编译已超过LEXICAL_INDEX_BUILD_MAX_WAIT秒（持续写入时）
+        """
+        self._maybe_reload()
+        with self._lock:
+            values = dict(self._conn.execute("SELECT key, value FROM meta"))
+        snapshot = self._snapshot
+        meta = snapshot["meta"] if snapshot is not None else {}
+        if meta.get("version", 0) >= values["version"]:
+            return False
+        now = time.time()
+        return (
+            now - values.get("updated_at", 0) >= settings.LEXICAL_INDEX_BUILD_DELAY
+            or now - meta.get("built_at", 0) >= settings.LEXICAL_INDEX_BUILD_MAX_WAIT
+        )
+    
+    def _background_build(self):
+        """后台编译线程：定期检查是否需要编译快照（其他进程正在编译时跳过）"""
+        while not self._stop_builder.wait(settings.LEXICAL_INDEX_RELOAD_INTERVAL):
+            try:
+                if self._build_due():
+                    self.build(wait=False)
+            except Exception as e:
+                print(f"[!] 后台编译词法索引快照失败: {e}")
+    
+    def start_background_build(self):
+        """启动后台编译线程（API进程调用，写入接口只更新SQLite）"""
+        with self._build_lock:
+            if self._builder is not None:
+                return
+            self._stop_builder.clear()
+            self._builder = threading.Thread(
+                target=self._background_build, name="lexical-index-build", daemon=True
+            )
+            self._builder.start()
+    
+    def stop_background_build(self):
+        """停止后台编译线程（正在编译时等待本次编译完成）"""
+        builder = self._builder
+        if builder is None:
+            return
+        self._stop_builder.set()
+        builder.join()
+        self._builder = None
+    
+    # ===== 检索 =====
+    
+    def _maybe_reload(self):
+        """检查CURRENT是否指向新快照（最多每LEXICAL_INDEX_RELOAD_INTERVAL秒检查一次）"""
+        now = time.monotonic()
+        if self._snapshot_name is not None and now - self._checked_at < settings.LEXICAL_INDEX_RELOAD_INTERVAL:
+            return
+        self._checked_at = now
+        
+        name = self._current_name()
+        if name is None or name == self._snapshot_name:
+            return
+        directory = self.path / name
+        try:
+            with open(directory / "meta.json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            arrays = {}
+            if meta["num_docs"]:
+                arrays = {
+                    key: np.load(directory / f"{key}.npy", mmap_mode="r")
+                    for key in _SNAPSHOT_ARRAYS
+                }
+        except FileNotFoundError:
+            # 快照刚被更新的快照替换，下次检查时加载最新的
+            self._checked_at = 0.0
+            return
+        self._snapshot = {"name": name, "meta": meta, **arrays}
+        self._snapshot_name = name
+    
+    def _load_delta(self, snapshot: Optional[Dict]) -> Dict:
+        """
+        读取快照之后写入和删除的片段（数据版本号变化后才重新读取）
+        
+        Returns:
+            {"docs": [(code_id, repo_name, language, length, 词频)],
+             "hidden": 快照中已被覆盖或删除的文档序号}；
+            增量超过LEXICAL_INDEX_MAX_DELTA（批量采集中，等待编译）时只检索快照
+        """
+        base = snapshot["meta"]["version"] if snapshot is not None else 0
+        snapshot_name = snapshot["name"] if snapshot is not None else None
+        with self._lock:
+            version = self._conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+            delta = self._delta
+            if delta is not None and delta["key"] == (snapshot_name, version):
+                return delta
+            
+            docs, removed = [], []
+            pending = self._conn.execute(
+                "SELECT COUNT(*) FROM docs WHERE version > ?", (base,)
+            ).fetchone()[0]
+            if pending <= settings.LEXICAL_INDEX_MAX_DELTA:
+                docs = [
+                    (code_id, repo_name, language, length, json.loads(terms))
+                    for code_id, repo_name, language, length, terms in self._conn.execute(
+                        "SELECT code_id, repo_name, language, length, terms FROM docs WHERE version > ?",
+                        (base,)
+                    )
+                ]
+                removed = [row[0] for row in self._conn.execute(
+                    "SELECT code_id FROM deleted WHERE version > ?", (base,)
+                )]
+        
+        hidden = np.zeros(0, dtype=np.int64)
+        if snapshot is not None and snapshot["meta"]["num_docs"] and (docs or removed):
+            # doc_ids按code_id排序，二分查找被覆盖或删除的片段
+            doc_ids = snapshot["doc_ids"]
+            wanted = np.array([code_id.encode("utf-8") for code_id in [doc[0] for doc in docs] + removed])
+            positions = np.minimum(np.searchsorted(doc_ids, wanted), len(doc_ids) - 1)
+            hidden = positions[doc_ids[positions] == wanted]
+        
+        delta = {"key": (snapshot_name, version), "docs": docs, "hidden": hidden}
+        self._delta = delta
+        return delta
+    
+    @staticmethod
+    def _postings(snapshot: Dict, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """快照中词项的倒排表 (文档序号, 词频)，词项不存在时返回None"""
+        term_hashes = snapshot["term_hashes"]
+        term_hash = np.uint64(_term_hash(term))
+        position = int(np.searchsorted(term_hashes, term_hash))
+        if position >= len(term_hashes) or term_hashes[position] != term_hash:
+            return None
+        offsets = snapshot["term_offsets"]
+        start, end = int(offsets[position]), int(offsets[position + 1])
+        return snapshot["post_docs"][start:end], snapshot["post_tfs"][start:end]
+    
+    def search(
+        self,
+        query: str,
+        top_k: int = 10,
+        language: Optional[str] = None,
+        repo_name: Optional[str] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        BM25检索（快照与未编译的增量合并打分）
+        
+        Args:
+            query: 查询文本
+            top_k: 返回数量
+            language: 按语言过滤
+            repo_name: 按仓库过滤
+        
+        Returns:
+            [(code_id, BM25得分)]，按得分降序；索引为空或查询中没有标识符时返回空列表
+        """
+        self._maybe_reload()
+        snapshot = self._snapshot
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        delta = self._load_delta(snapshot)
+        delta_docs = delta["docs"]
+        meta = snapshot["meta"] if snapshot is not None else {"num_docs": 0, "avg_length": 0.0}
+        snapshot_docs = meta["num_docs"]
+        num_docs = snapshot_docs + len(delta_docs)
+        if not num_docs:
+            return []
+        
+        # 文档数和平均长度包含增量中的片段（被覆盖的旧版本仍计入，编译后消除）
+        total_length = meta["avg_length"] * snapshot_docs + sum(doc[3] for doc in delta_docs)
+        avg_length = total_length / num_docs or 1.0
+        scores = np.zeros(snapshot_docs, dtype=np.float32)
+        delta_scores = [0.0] * len(delta_docs)
+        
+        for term in terms:
+            postings = self._postings(snapshot, term) if snapshot_docs else None
+            delta_hits = [(i, doc[4][term]) for i, doc in enumerate(delta_docs) if term in doc[4]]
+            df = (len(postings[0]) if postings is not None else 0) + len(delta_hits)
+            if not df:
+                continue
+            idf = np.log(1.0 + (num_docs - df + 0.5) / (df + 0.5))
+            if postings is not None:
+                docs, tfs = postings
+                norm = self.k1 * (1.0 - self.b + self.b * snapshot["doc_lengths"][docs] / avg_length)
+                # 同一词项的倒排表中每个文档只出现一次
+                scores[docs] += idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+            for i, tf in delta_hits:
+                norm = self.k1 * (1.0 - self.b + self.b * delta_docs[i][3] / avg_length)
+                delta_scores[i] += float(idf * tf * (self.k1 + 1.0) / (tf + norm))
+        
+        results = []
+        if snapshot_docs:
+            if language:
+                if language in meta["languages"]:
+                    scores[snapshot["doc_languages"] != meta["languages"].index(language)] = 0.0
+                else:
+                    scores[:] = 0.0
+            if repo_name:
+                if repo_name in meta["repos"]:
+                    scores[snapshot["doc_repos"] != meta["repos"].index(repo_name)] = 0.0
+                else:
+                    scores[:] = 0.0
+            scores[delta["hidden"]] = 0.0
+            
+            candidates = np.flatnonzero(scores > 0)
+            if len(candidates) > top_k:
+                candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+            candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+            doc_ids = snapshot["doc_ids"]
+            results = [(doc_ids[i].decode("utf-8"), float(scores[i])) for i in candidates]
+        
+        results.extend(
+            (doc[0], score) for doc, score in zip(delta_docs, delta_scores)
+            if score > 0
+            and (not language or doc[2] == language)
+            and (not repo_name or doc[1] == repo_name)
+        )
+        results.sort(key=lambda item: item[1], reverse=True)
+        return results[:top_k]
+    
+    def close(self):
+        """停止后台编译线程，关闭数据库连接并释放快照映射"""
+        self.stop_background_build()
+        with self._lock:
+            self._snapshot = None
+            self._snapshot_name = None
+            self._delta = None
+            self._conn.close()
+
+# 全局实例
+_lexical_index: Optional[LexicalIndex] = None
+_lexical_index_lock = threading.Lock()
+
+
+def get_lexical_index() -> LexicalIndex:
+    """获取词法索引实例（单例模式）"""
+    global _lexical_index
+    if _lexical_index is None:
+        with _lexical_index_lock:
+            if _lexical_index is None:
+                _lexical_index = LexicalIndex()
+    return _lexical_index
@@ -1,15 +1,15 @@
 """
 大模型服务 - 支持DeepSeek和OpenAI
+
+使用异步客户端，生成说明时不阻塞事件循环；信号量限制同时进行的请求数，
+多条结果的说明可以并发生成。
 """
 
+import asyncio
 import os
-from typing import Optional
+from typing import AsyncIterator, List, Optional
 from app.core.config import settings
-
-try:
-    import openai
-except ImportError:
-    openai = None
+from app.services.explanation_cache import explanation_cache_key, get_explanation_cache
 
 
 class LLMService:
@@ -17,7 +17,10 @@ class LLMService:
     
     def __init__(self):
         """初始化LLM服务"""
-        if openai is None:
+        # 延迟导入：openai库导入较慢，只在创建服务时导入
+        try:
+            import openai
+        except ImportError:
             raise ImportError("openai库未安装，请运行: pip install openai")
         
         # 确定使用的提供商
@@ -29,22 +32,73 @@ class LLMService:
         if not self.api_key:
             raise ValueError("未配置LLM_API_KEY或OPENAI_API_KEY")
         
+        self.timeout = settings.LLM_TIMEOUT
+        # 限制并发请求数，避免一次检索占满API的速率限制
+        self._semaphore = asyncio.Semaphore(max(1, settings.LLM_MAX_CONCURRENCY))
+        
         # 配置客户端
         if self.provider == "deepseek":
             # DeepSeek使用OpenAI兼容的API格式
             base_url = settings.LLM_BASE_URL or "https://api.deepseek.com"
-            self.client = openai.OpenAI(
-                api_key=self.api_key,
-                base_url=base_url
-            )
             # 默认使用deepseek-chat模型
             if not settings.LLM_MODEL:
                 self.model = "deepseek-chat"
         else:
-            # OpenAI使用默认配置
-            self.client = openai.OpenAI(api_key=self.api_key)
+            # OpenAI默认使用官方地址（也可以指向兼容的代理或本地服务）
+            base_url = settings.LLM_BASE_URL or None
             if not settings.LLM_MODEL:
                 self.model = "gpt-3.5-turbo"
+        
+        # 超时由_complete中的wait_for控制（不含排队等待的时间），客户端不再重试
+        self.client = openai.AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=base_url,
+            timeout=self.timeout,
+            max_retries=0
+        )
+        
+        # 说明缓存（多个工作进程共用），不可用时直接调用API
+        self.cache = None
+        if settings.EXPLANATION_CACHE_ENABLED:
+            try:
+                self.cache = get_explanation_cache()
+            except Exception as e:
+                print(f"[!] 说明缓存不可用: {e}")
+    
+    def _cache_key(
+        self,
+        code_snippet: str,
+        language: str,
+        dependencies: list,
+        user_query: str
+    ) -> str:
+        """说明的缓存键（EXPLANATION_CACHE_BY_QUERY为False时不同查询共用说明）"""
+        return explanation_cache_key(
+            code_snippet,
+            language,
+            f"{self.provider}/{self.model}",
+            dependencies,
+            user_query if settings.EXPLANATION_CACHE_BY_QUERY else None
+        )
+    
+    async def _cache_get(self, key: str) -> Optional[str]:
+        """读取缓存的说明（在线程中执行，不阻塞事件循环；出错时视为未命中）"""
+        if self.cache is None:
+            return None
+        try:
+            return await asyncio.to_thread(self.cache.get, key)
+        except Exception as e:
+            print(f"[!] 读取说明缓存失败: {e}")
+            return None
+    
+    async def _cache_put(self, key: str, explanation: str):
+        """写入说明缓存（出错时只打印警告）"""
+        if self.cache is None:
+            return
+        try:
+            await asyncio.to_thread(self.cache.put, key, f"{self.provider}/{self.model}", explanation)
+        except Exception as e:
+            print(f"[!] 写入说明缓存失败: {e}")
     
     async def generate_code_reuse_instruction(
         self,
@@ -54,7 +108,7 @@ class LLMService:
         user_query: str = ""
     ) -> str:
         """
-        生成代码复用说明
+        生成代码复用说明（优先使用缓存；超过LLM_TIMEOUT秒未完成时抛出异常）
         
         Args:
             code_snippet: 代码片段
@@ -65,6 +119,11 @@ class LLMService:
         Returns:
             生成的复用说明文本
         """
+        cache_key = self._cache_key(code_snippet, language, dependencies or [], user_query)
+        cached = await self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+        
         # 构建提示词
         prompt = self._build_prompt(
             code_snippet=code_snippet,
@@ -75,28 +134,154 @@ class LLMService:
         
         try:
             # 调用API生成说明
-            response = self.client.chat.completions.create(
+            response = await self._complete(prompt)
+            content = response.choices[0].message.content.strip()
+            # 格式化文本内容
+            explanation = self._format_explanation(content)
+        
+        except asyncio.TimeoutError:
+            raise Exception(f"生成复用说明失败: 超过 {self.timeout:g} 秒未完成")
+        except Exception as e:
+            raise Exception(f"生成复用说明失败: {str(e)}")
+        
+        await self._cache_put(cache_key, explanation)
+        return explanation
+    
+    async def generate_code_reuse_instructions(
+        self,
+        items: List[dict],
+        user_query: str = ""
+    ) -> List[Optional[str]]:
+        """
+        并发生成多条代码的复用说明（并发数受LLM_MAX_CONCURRENCY限制）
+        
+        Args:
+            items: 代码列表，每项包含 code_snippet、language、dependencies
+            user_query: 用户查询
+        
+        Returns:
+            复用说明列表（与输入顺序一致），单条失败或超时时对应位置为None
+        """
+        results = await asyncio.gather(
+            *(
+                self.generate_code_reuse_instruction(
+                    code_snippet=item.get("code_snippet") or "",
+                    language=item.get("language") or "python",
+                    dependencies=item.get("dependencies") or [],
+                    user_query=user_query
+                )
+                for item in items
+            ),
+            return_exceptions=True
+        )
+        explanations = []
+        for result in results:
+            if isinstance(result, BaseException):
+                print(f"[!] {result}")
+                explanations.append(None)
+            else:
+                explanations.append(result)
+        return explanations
+    
+    async def _complete(self, prompt: str):
+        """在并发限制内调用对话补全接口（超过LLM_TIMEOUT秒时抛出asyncio.TimeoutError）"""
+        async with self._semaphore:
+            request = self.client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "你是一个专业的代码助手，擅长解释代码的使用方法和注意事项。请使用清晰、结构化的 Markdown 格式输出，确保内容易于阅读和理解。"
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
+                messages=self._build_messages(prompt),
                 max_tokens=self.max_tokens,
                 temperature=0.7
             )
+            return await asyncio.wait_for(request, timeout=self.timeout)
+    
+    async def stream_code_reuse_instruction(
+        self,
+        code_snippet: str,
+        language: str,
+        dependencies: list = None,
+        user_query: str = ""
+    ) -> AsyncIterator[str]:
+        """
+        流式生成代码复用说明，逐段返回模型输出的文本
+        
+        缓存命中时一次返回完整说明；并发数同样受LLM_MAX_CONCURRENCY限制，
+        建立连接或两段输出之间超过LLM_TIMEOUT秒时抛出异常。
+        
+        Args:
+            code_snippet: 代码片段
+            language: 编程语言
+            dependencies: 依赖库列表
+            user_query: 用户查询
+        
+        Yields:
+            新生成的文本片段（拼接后经_format_explanation格式化即为完整说明）
+        """
+        cache_key = self._cache_key(code_snippet, language, dependencies or [], user_query)
+        cached = await self._cache_get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+        
+        prompt = self._build_prompt(
+            code_snippet=code_snippet,
+            language=language,
+            dependencies=dependencies or [],
+            user_query=user_query
+        )
+        
+        parts = []
+        async with self._semaphore:
+            try:
+                stream = await asyncio.wait_for(
+                    self.client.chat.completions.create(
+                        model=self.model,
+                        messages=self._build_messages(prompt),
+                        max_tokens=self.max_tokens,
+                        temperature=0.7,
+                        stream=True
+                    ),
+                    timeout=self.timeout
+                )
+            except asyncio.TimeoutError:
+                raise Exception(f"生成复用说明失败: 超过 {self.timeout:g} 秒未完成")
+            except Exception as e:
+                raise Exception(f"生成复用说明失败: {str(e)}")
             
-            content = response.choices[0].message.content.strip()
-            # 格式化文本内容
-            return self._format_explanation(content)
+            try:
+                chunks = stream.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout=self.timeout)
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        raise Exception(f"生成复用说明失败: 超过 {self.timeout:g} 秒没有新的输出")
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+            finally:
+                # 提前结束（如客户端断开）时关闭上游连接
+                await stream.response.aclose()
         
-        except Exception as e:
-            raise Exception(f"生成复用说明失败: {str(e)}")
+        # 只缓存完整生成的说明
+        await self._cache_put(cache_key, self._format_explanation("".join(parts).strip()))
+    
+    def _build_messages(self, prompt: str) -> List[dict]:
+        """构建对话消息"""
+        return [
+            {
+                "role": "system",
+                "content": "你是一个专业的代码助手，擅长解释代码的使用方法和注意事项。请使用清晰、结构化的 Markdown 格式输出，确保内容易于阅读和理解。"
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+    
+    async def close(self):
+        """关闭客户端连接"""
+        await self.client.close()
     
     def _format_explanation(self, text: str) -> str:
         """
@@ -208,3 +393,11 @@ def get_llm_service() -> LLMService:
         _llm_service = LLMService()
     return _llm_service
 
+
+async def close_llm_service():
+    """关闭LLM服务的客户端（应用退出时调用）"""
+    global _llm_service
+    if _llm_service is not None:
+        await _llm_service.close()
+        _llm_service = None
+
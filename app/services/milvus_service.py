@@ -2,17 +2,15 @@
 Milvus矢量数据库服务
 """
 
-from typing import List, Dict, Optional
+import threading
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional
 import numpy as np
-from pymilvus import (
-    connections,
-    Collection,
-    FieldSchema,
-    CollectionSchema,
-    DataType,
-    utility,
-)
 from app.core.config import settings
+from app.services.chunker import aggregate_chunk_hits
+
+# pymilvus导入较慢（grpc、protobuf等），只在连接时导入
+if TYPE_CHECKING:
+    from pymilvus import Collection
 
 
 class MilvusService:
@@ -30,9 +28,25 @@ class MilvusService:
         
         # 获取或创建集合
         self.collection = self._get_or_create_collection()
+        
+        # 旧集合没有parent_code_id字段，不能存储长代码的分块
+        self.supports_chunks = any(
+            field.name == "parent_code_id" for field in self.collection.schema.fields
+        )
+        if not self.supports_chunks:
+            print(f"[!] 集合 {self.collection_name} 没有parent_code_id字段，长代码将不分块（超出部分被截断）")
+    
+    @property
+    def output_fields(self) -> List[str]:
+        """检索和查询返回的字段"""
+        fields = ["code_id", "code", "name", "type", "language", "file_path", "repo_name", "repo_url"]
+        if self.supports_chunks:
+            fields.append("parent_code_id")
+        return fields
     
     def _connect(self):
         """连接到Milvus服务器"""
+        from pymilvus import connections
         try:
             connections.connect(
                 alias="default",
@@ -43,8 +57,10 @@ class MilvusService:
         except Exception as e:
             raise Exception(f"连接Milvus失败: {str(e)}")
     
-    def _get_or_create_collection(self) -> Collection:
+    def _get_or_create_collection(self) -> "Collection":
         """获取或创建集合"""
+        from pymilvus import Collection, CollectionSchema, DataType, FieldSchema, utility
+        
         # 检查集合是否存在
         if utility.has_collection(self.collection_name):
             print(f"集合 {self.collection_name} 已存在")
@@ -60,6 +76,8 @@ class MilvusService:
         fields = [
             FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
             FieldSchema(name="code_id", dtype=DataType.VARCHAR, max_length=255),
+            # 分块记录所属的片段code_id（未分块的片段等于自身code_id）
+            FieldSchema(name="parent_code_id", dtype=DataType.VARCHAR, max_length=255),
             FieldSchema(name="code", dtype=DataType.VARCHAR, max_length=65535),
             FieldSchema(name="name", dtype=DataType.VARCHAR, max_length=255),
             FieldSchema(name="type", dtype=DataType.VARCHAR, max_length=50),
@@ -119,8 +137,9 @@ class MilvusService:
             raise ValueError("代码片段数量与向量数量不匹配")
         
         # 准备数据
+        code_ids = [snippet.get("code_id", f"snippet_{i}") for i, snippet in enumerate(code_snippets)]
         data = {
-            "code_id": [snippet.get("code_id", f"snippet_{i}") for i, snippet in enumerate(code_snippets)],
+            "code_id": code_ids,
             "code": [snippet.get("code", "") for snippet in code_snippets],
             "name": [snippet.get("name", "") for snippet in code_snippets],
             "type": [snippet.get("type", "") for snippet in code_snippets],
@@ -130,6 +149,11 @@ class MilvusService:
             "repo_url": [snippet.get("repo_url", "") for snippet in code_snippets],
             "vector": [vector.tolist() for vector in vectors],
         }
+        if self.supports_chunks:
+            data["parent_code_id"] = [
+                snippet.get("parent_code_id") or code_id
+                for snippet, code_id in zip(code_snippets, code_ids)
+            ]
         
         # 插入数据
         try:
@@ -170,7 +194,7 @@ class MilvusService:
                 param=search_params,
                 limit=top_k,
                 expr=filter_expr,
-                output_fields=["code_id", "code", "name", "type", "language", "file_path", "repo_name", "repo_url"]
+                output_fields=self.output_fields
             )
             
             # 格式化结果
@@ -188,6 +212,7 @@ class MilvusService:
                         "file_path": hit.entity.get("file_path"),
                         "repo_name": hit.entity.get("repo_name"),
                         "repo_url": hit.entity.get("repo_url"),
+                        "parent_code_id": hit.entity.get("parent_code_id") if self.supports_chunks else None,
                     })
             
             return search_results
@@ -195,6 +220,45 @@ class MilvusService:
         except Exception as e:
             raise Exception(f"搜索失败: {str(e)}")
     
+    def search_snippets(
+        self,
+        query_vector: np.ndarray,
+        top_k: int = 10,
+        filter_expr: Optional[str] = None,
+        aggregation: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        搜索相似代码片段，并把长代码的分块命中聚合回原片段
+        
+        Args:
+            query_vector: 查询向量
+            top_k: 返回前k个片段
+            filter_expr: 过滤表达式
+            aggregation: 分块命中的聚合方式 max 或 sum（默认使用CHUNK_AGGREGATION配置）
+        
+        Returns:
+            搜索结果列表（每个片段一条），在search结果之外包含 similarity 和 matched_chunks
+        """
+        # 同一片段的多个分块可能同时命中，多取一些结果以便聚合后仍有top_k个片段
+        search_k = top_k * max(1, settings.CHUNK_SEARCH_OVERFETCH) if self.supports_chunks else top_k
+        hits = self.search(query_vector, top_k=search_k, filter_expr=filter_expr)
+        results = aggregate_chunk_hits(hits, aggregation)[:top_k]
+        
+        # 只命中了后续分块的片段，需要取回第一条记录中的完整代码
+        missing = [r["parent_code_id"] for r in results if r.get("code_id") != r["parent_code_id"]]
+        if missing:
+            parents = self.get_by_code_ids(missing)
+            for result in results:
+                parent = parents.get(result["parent_code_id"])
+                if parent and result.get("code_id") != result["parent_code_id"]:
+                    result.update({key: value for key, value in parent.items() if key != "id"})
+        
+        # 对外统一使用片段的code_id（Neo4j中的节点也以它为键）
+        for result in results:
+            result["code_id"] = result["parent_code_id"]
+        
+        return results
+    
     def get_collection_stats(self) -> Dict:
         """获取集合统计信息"""
         try:
@@ -240,7 +304,7 @@ class MilvusService:
         try:
             results = self.collection.query(
                 expr=f"code_id == '{code_id}'",
-                output_fields=["code_id", "code", "name", "type", "language", "file_path", "repo_name", "repo_url"],
+                output_fields=self.output_fields,
                 limit=1
             )
             
@@ -262,6 +326,64 @@ class MilvusService:
             print(f"根据code_id查询失败: {str(e)}")
             return None
     
+    def get_by_code_ids(self, code_ids: List[str]) -> Dict[str, Dict]:
+        """
+        批量根据code_id获取代码片段（一次查询）
+        
+        Args:
+            code_ids: 代码片段ID列表
+        
+        Returns:
+            code_id -> 代码片段信息，不存在的ID不出现在结果中
+        """
+        code_ids = list(dict.fromkeys(code_id for code_id in code_ids if code_id))
+        if not code_ids:
+            return {}
+        
+        quoted = ", ".join("'" + code_id.replace("'", "\\'") + "'" for code_id in code_ids)
+        try:
+            results = self.collection.query(
+                expr=f"code_id in [{quoted}]",
+                output_fields=self.output_fields
+            )
+            return {
+                result.get("code_id"): {
+                    "id": result.get("id"),
+                    **{field: result.get(field) for field in self.output_fields},
+                }
+                for result in results
+            }
+        except Exception as e:
+            print(f"根据code_id批量查询失败: {str(e)}")
+            return {}
+    
+    def iter_snippets(self, batch_size: int = 1000) -> Iterator[List[Dict]]:
+        """
+        分批遍历集合中的全部代码片段（长代码只返回保存完整代码的第一条记录）
+        
+        Args:
+            batch_size: 每批读取的记录数
+        
+        Yields:
+            代码片段列表
+        """
+        iterator = self.collection.query_iterator(
+            batch_size=batch_size,
+            expr="id >= 0",
+            output_fields=self.output_fields
+        )
+        try:
+            while True:
+                batch = iterator.next()
+                if not batch:
+                    break
+                yield [
+                    row for row in batch
+                    if not self.supports_chunks or row.get("code_id") == row.get("parent_code_id")
+                ]
+        finally:
+            iterator.close()
+    
     def delete_by_code_id(self, code_id: str) -> bool:
         """
         根据code_id删除代码片段
@@ -273,33 +395,78 @@ class MilvusService:
             是否成功删除
         """
         try:
-            # 先查询获取id
+            # 先查询获取id（包括该片段的全部分块）
+            expr = f"code_id == '{code_id}'"
+            if self.supports_chunks:
+                expr = f"{expr} || parent_code_id == '{code_id}'"
             results = self.collection.query(
-                expr=f"code_id == '{code_id}'",
-                output_fields=["id"],
-                limit=1
+                expr=expr,
+                output_fields=["id"]
             )
             
             if results and len(results) > 0:
-                entity_id = results[0].get("id")
+                entity_ids = [result.get("id") for result in results]
                 # 删除
-                self.collection.delete(expr=f"id == {entity_id}")
+                self.collection.delete(expr=f"id in {entity_ids}")
                 self.collection.flush()
                 return True
             return False
         except Exception as e:
             print(f"删除代码片段失败: {str(e)}")
             return False
+    
+    def delete_by_file(self, repo_name: str, file_path: str, batch_size: int = 1000) -> int:
+        """
+        删除某个仓库文件的全部代码片段（用于增量采集的修改/删除事件）
+        
+        Args:
+            repo_name: 仓库名称
+            file_path: 文件路径
+            batch_size: 每批查询和删除的记录数
+        
+        Returns:
+            删除的记录数量（长代码的每个分块计为一条）
+        
+        Raises:
+            删除失败时抛出异常（调用方不应继续写入该文件的新片段，否则新旧片段会同时存在）
+        """
+        repo_name = repo_name.replace("'", "\\'")
+        file_path = file_path.replace("'", "\\'")
+        # 分页查询id再按批删除：一次query受Milvus结果窗口限制，id列表过长时表达式也过大，
+        # 两种情况都会遗漏记录，之后写入的新片段会与旧片段同时存在
+        iterator = self.collection.query_iterator(
+            batch_size=batch_size,
+            expr=f"repo_name == '{repo_name}' && file_path == '{file_path}'",
+            output_fields=["id"]
+        )
+        entity_ids = []
+        try:
+            while True:
+                batch = iterator.next()
+                if not batch:
+                    break
+                entity_ids.extend(row.get("id") for row in batch)
+        finally:
+            iterator.close()
+        
+        # 遍历结束后再删除，避免删除影响迭代器的分页
+        for start in range(0, len(entity_ids), batch_size):
+            self.collection.delete(expr=f"id in {entity_ids[start:start + batch_size]}")
+        return len(entity_ids)
 
 
 # 全局实例
 _milvus_service: Optional[MilvusService] = None
+_milvus_service_lock = threading.Lock()
 
 
 def get_milvus_service() -> MilvusService:
-    """获取Milvus服务实例（单例模式）"""
+    """获取Milvus服务实例（单例模式，线程安全）"""
     global _milvus_service
     if _milvus_service is None:
-        _milvus_service = MilvusService()
+        # 后台预热线程和请求可能同时首次调用，加锁避免重复连接和加载集合
+        with _milvus_service_lock:
+            if _milvus_service is None:
+                _milvus_service = MilvusService()
     return _milvus_service
 
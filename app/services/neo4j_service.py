@@ -2,11 +2,20 @@
 Neo4j知识图谱服务
 """
 
+import threading
 from typing import List, Dict, Optional
-from neo4j import GraphDatabase
 from app.core.config import settings
 
 
+def neo4j_driver_options() -> Dict:
+    """驱动的连接池配置（同步和异步驱动共用）"""
+    return {
+        "max_connection_pool_size": settings.NEO4J_MAX_CONNECTION_POOL_SIZE,
+        "connection_acquisition_timeout": settings.NEO4J_CONNECTION_ACQUISITION_TIMEOUT,
+        "max_connection_lifetime": settings.NEO4J_MAX_CONNECTION_LIFETIME,
+    }
+
+
 class Neo4jService:
     """Neo4j知识图谱服务"""
     
@@ -19,10 +28,12 @@ class Neo4jService:
         if not self.password:
             raise ValueError("未配置NEO4J_PASSWORD，请在.env文件中设置")
         
-        # 创建驱动
+        # 创建驱动（延迟导入neo4j驱动，只在创建服务时导入）
+        from neo4j import GraphDatabase
         self.driver = GraphDatabase.driver(
             self.uri,
-            auth=(self.user, self.password)
+            auth=(self.user, self.password),
+            **neo4j_driver_options()
         )
         
         # 验证连接
@@ -163,6 +174,26 @@ class Neo4jService:
             
             return True
     
+    def delete_by_file(self, repo_name: str, file_path: str) -> int:
+        """
+        删除某个仓库文件的全部代码片段节点及其关系
+        
+        Args:
+            repo_name: 仓库名称
+            file_path: 文件路径
+        
+        Returns:
+            删除的节点数量
+        """
+        with self.driver.session() as session:
+            query = """
+            MATCH (c:CodeSnippet {repo_name: $repo_name, file_path: $file_path})
+            DETACH DELETE c
+            RETURN count(c) as count
+            """
+            result = session.run(query, repo_name=repo_name, file_path=file_path)
+            return result.single()["count"]
+    
     def get_code_snippet_info(self, code_id: str) -> Optional[Dict]:
         """
         获取代码片段信息及其关联
@@ -287,12 +318,16 @@ class Neo4jService:
 
 # 全局实例
 _neo4j_service: Optional[Neo4jService] = None
+_neo4j_service_lock = threading.Lock()
 
 
 def get_neo4j_service() -> Neo4jService:
-    """获取Neo4j服务实例（单例模式）"""
+    """获取Neo4j服务实例（单例模式，线程安全）"""
     global _neo4j_service
     if _neo4j_service is None:
-        _neo4j_service = Neo4jService()
+        # 后台预热线程和请求可能同时首次调用，加锁避免创建多个驱动
+        with _neo4j_service_lock:
+            if _neo4j_service is None:
+                _neo4j_service = Neo4jService()
     return _neo4j_service
 
@@ -0,0 +1,245 @@
+"""
+ONNX Runtime 嵌入后端 - 在CPU上用ONNX Runtime（可选int8动态量化）运行嵌入模型
+
+首次使用时把SentenceTransformer中的Transformer模块导出为ONNX文件，
+之后直接加载导出结果；池化和归一化用numpy实现，与SentenceTransformer保持一致。
+多个进程同时启动时只有一个进程导出（锁文件互斥），导出结果先写临时文件再原子替换，
+其他进程不会加载到写了一半的文件。
+"""
+
+import inspect
+import os
+import re
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator, List
+
+import numpy as np
+
+
+# 等待其他进程导出时的轮询间隔（秒）
+_LOCK_POLL_INTERVAL = 0.5
+# 持有锁的进程异常退出后，超过该时间（秒）的锁文件视为失效
+_LOCK_STALE_SECONDS = 30 * 60
+
+
+@contextmanager
+def _exclusive_lock(lock_path: Path) -> Iterator[None]:
+    """用O_EXCL创建锁文件实现跨进程互斥（不依赖fcntl，Windows上同样可用）"""
+    while True:
+        try:
+            fd = os.open(str(lock_path), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - lock_path.stat().st_mtime > _LOCK_STALE_SECONDS:
+                    print(f"[!] 删除失效的锁文件: {lock_path}")
+                    lock_path.unlink()
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(_LOCK_POLL_INTERVAL)
+    try:
+        os.write(fd, str(os.getpid()).encode("ascii"))
+        os.close(fd)
+        yield
+    finally:
+        try:
+            lock_path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _build_once(target: Path, build: Callable[[Path], None]):
+    """
+    生成文件（已存在时跳过）
+    
+    持有锁的进程写到同目录的临时文件后用os.replace原子替换；等待锁的进程拿到锁时
+    文件已经生成，直接返回。中断的导出只留下临时文件，不会被当作完整的模型。
+    
+    Args:
+        target: 目标文件路径
+        build: 生成函数，参数为要写入的临时文件路径
+    """
+    if target.exists():
+        return
+    target.parent.mkdir(parents=True, exist_ok=True)
+    with _exclusive_lock(target.with_name(target.name + ".lock")):
+        if target.exists():
+            return
+        tmp_path = target.with_name(f"{target.stem}.tmp-{os.getpid()}{target.suffix}")
+        try:
+            build(tmp_path)
+            os.replace(tmp_path, target)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+
+class OnnxEncoder:
+    """用ONNX Runtime执行SentenceTransformer模型的编码"""
+    
+    def __init__(
+        self,
+        model: Any,
+        model_name: str,
+        onnx_dir: str,
+        quantize: bool = False,
+        num_threads: int = 0
+    ):
+        """
+        初始化ONNX编码器（ONNX文件不存在时先导出）
+        
+        Args:
+            model: 已加载的SentenceTransformer模型（提供导出源、tokenizer和池化配置）
+            model_name: 模型名称（用于区分导出目录）
+            onnx_dir: ONNX文件保存目录
+            quantize: 是否使用int8动态量化的模型
+            num_threads: ONNX Runtime算子内线程数（0 表示使用默认值）
+        """
+        # 延迟导入：只在使用ONNX后端时加载onnxruntime
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("onnxruntime未安装，请运行: pip install onnx onnxruntime")
+        
+        self.tokenizer = model.tokenizer
+        self.max_seq_length = model.max_seq_length
+        self.pooling_mode = self._pooling_mode(model)
+        self.normalize = any(type(module).__name__ == "Normalize" for module in model)
+        
+        model_dir = Path(onnx_dir) / re.sub(r'[^\w.-]+', '_', model_name)
+        model_path = model_dir / "model.onnx"
+        _build_once(model_path, lambda path: self.export(model, path))
+        
+        if quantize:
+            quantized_path = model_dir / "model.int8.onnx"
+            _build_once(quantized_path, lambda path: self.quantize(model_path, path))
+            model_path = quantized_path
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            str(model_path),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {node.name for node in self.session.get_inputs()}
+        self.model_path = model_path
+        print(f"✅ ONNX Runtime模型已加载: {model_path}（池化: {self.pooling_mode}）")
+    
+    @staticmethod
+    def _pooling_mode(model: Any) -> str:
+        """读取SentenceTransformer的池化方式（cls / max / mean）"""
+        for module in model:
+            if type(module).__name__ == "Pooling":
+                if getattr(module, "pooling_mode_cls_token", False):
+                    return "cls"
+                if getattr(module, "pooling_mode_max_tokens", False):
+                    return "max"
+                return "mean"
+        return "mean"
+    
+    @staticmethod
+    def export(model: Any, model_path: Path, opset: int = 14):
+        """
+        把SentenceTransformer的Transformer模块导出为ONNX
+        
+        Args:
+            model: SentenceTransformer模型
+            model_path: 导出文件路径
+            opset: ONNX算子集版本
+        """
+        import torch
+        
+        print(f"导出ONNX模型: {model_path}")
+        model_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        class HiddenStates(torch.nn.Module):
+            """只输出last_hidden_state，避免导出HuggingFace的ModelOutput结构"""
+            
+            def __init__(self, transformer):
+                super().__init__()
+                self.transformer = transformer
+            
+            def forward(self, input_ids, attention_mask):
+                return self.transformer(input_ids=input_ids, attention_mask=attention_mask)[0]
+        
+        transformer = HiddenStates(model[0].auto_model).eval()
+        dummy = model.tokenizer(["def hello(): return 'world'"], return_tensors="pt")
+        inputs = ("input_ids", "attention_mask")
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in inputs}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+        
+        # 新版torch默认使用dynamo导出器（依赖onnxscript），这里固定使用TorchScript导出器
+        options = {}
+        if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+            options["dynamo"] = False
+        
+        with torch.no_grad():
+            torch.onnx.export(
+                transformer,
+                (dummy["input_ids"], dummy["attention_mask"]),
+                str(model_path),
+                input_names=list(inputs),
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=opset,
+                do_constant_folding=True,
+                **options
+            )
+    
+    @staticmethod
+    def quantize(model_path: Path, quantized_path: Path):
+        """
+        对ONNX模型做int8动态量化（权重离线量化，激活值运行时量化）
+        
+        Args:
+            model_path: fp32 ONNX文件路径
+            quantized_path: 量化后的文件路径
+        """
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        
+        print(f"量化ONNX模型: {quantized_path}")
+        quantize_dynamic(str(model_path), str(quantized_path), weight_type=QuantType.QInt8)
+    
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        编码一批文本
+        
+        Args:
+            texts: 文本列表
+        
+        Returns:
+            (条数, 维度) 的float32矩阵
+        """
+        encoded = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_tensors="np"
+        )
+        feeds = {
+            name: encoded[name].astype(np.int64)
+            for name in ("input_ids", "attention_mask", "token_type_ids")
+            if name in self.input_names and name in encoded
+        }
+        hidden = self.session.run(["last_hidden_state"], feeds)[0]
+        mask = encoded["attention_mask"].astype(np.float32)[:, :, None]
+        
+        if self.pooling_mode == "cls":
+            embeddings = hidden[:, 0]
+        elif self.pooling_mode == "max":
+            embeddings = np.where(mask > 0, hidden, -1e9).max(axis=1)
+        else:
+            embeddings = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        
+        if self.normalize:
+            embeddings = embeddings / np.clip(
+                np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None
+            )
+        return embeddings.astype(np.float32)
@@ -0,0 +1,197 @@
+"""
+并行解析服务 - 使用进程池解析和清洗代码文件
+"""
+
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from app.core.config import settings
+from app.services.code_parser import get_code_parser
+from app.services.code_cleaner import get_code_cleaner
+
+
+def _init_worker():
+    """工作进程初始化：每个进程只创建一次解析器和清洗器"""
+    get_code_parser()
+    get_code_cleaner()
+
+
+def process_file(
+    file_path: str,
+    content: str,
+    language: Optional[str] = None
+) -> List[Dict]:
+    """
+    解析并清洗单个文件
+    
+    Args:
+        file_path: 文件路径
+        content: 文件内容
+        language: 编程语言（为None时根据扩展名检测）
+    
+    Returns:
+        代码片段列表，每个片段包含：name, type, code, start_line, end_line,
+        file_path, language, dependencies
+    """
+    code_parser = get_code_parser()
+    code_cleaner = get_code_cleaner()
+    
+    language = language or code_parser.detect_language(file_path)
+    if not language:
+        return []
+    
+    snippets = []
+    
+    # 解析代码（一次解析同时得到函数、类和文件级导入）
+    parsed = code_parser.parse_file(content, language)
+    for item in parsed['snippets']:
+        # 清洗代码（直接使用语法树的错误标记判断语法完整性）
+        has_error = item.pop('has_error', None)
+        cleaned = code_cleaner.clean_code_snippet(item['code'], language, has_error)
+        if cleaned:
+            item['code'] = cleaned
+            item['file_path'] = file_path
+            item['language'] = language
+            # 导入语句通常在文件顶部，片段使用所在文件的依赖
+            item['dependencies'] = list(parsed['dependencies'])
+            snippets.append(item)
+    
+    return snippets
+
+
+def _process_chunk(
+    files: List[Tuple[str, str, Optional[str]]]
+) -> List[Tuple[str, List[Dict]]]:
+    """在工作进程中处理一批文件（一批文件只需一次进程间通信）"""
+    results = []
+    for file_path, content, language in files:
+        try:
+            results.append((file_path, process_file(file_path, content, language)))
+        except Exception as e:
+            print(f"解析文件失败 {file_path}: {e}")
+            results.append((file_path, []))
+    return results
+
+
+class ParsePool:
+    """多进程解析服务，每个工作进程持有自己的tree-sitter解析器"""
+    
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        chunk_size: Optional[int] = None
+    ):
+        """
+        初始化解析进程池
+        
+        Args:
+            max_workers: 工作进程数（默认使用PARSE_POOL_WORKERS配置，<=0 表示CPU核数）
+            chunk_size: 每次提交给工作进程的文件数（默认使用PARSE_CHUNK_SIZE配置）
+        """
+        if max_workers is None:
+            max_workers = settings.PARSE_POOL_WORKERS
+        self.max_workers = max_workers if max_workers > 0 else (os.cpu_count() or 1)
+        self.chunk_size = max(1, chunk_size or settings.PARSE_CHUNK_SIZE)
+        # 同时在途的批次数上限，避免输入过快时积压大量文件内容
+        self.max_in_flight = self.max_workers * 2
+        
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            initializer=_init_worker
+        )
+    
+    def parse_files(
+        self,
+        files: Iterable[Sequence],
+        language: Optional[str] = None
+    ) -> Iterator[Tuple[str, List[Dict]]]:
+        """
+        流式解析文件：按批提交，哪一批先完成就先返回哪一批的结果
+        
+        输入可以是生成器（例如边下载边解析），函数会逐步消费。
+        
+        Args:
+            files: (file_path, content) 或 (file_path, content, language) 序列
+            language: 默认编程语言（为None时根据扩展名检测）
+        
+        Returns:
+            (file_path, 代码片段列表) 迭代器，顺序不保证与输入一致
+        """
+        pending = set()
+        chunk = []
+        
+        for item in files:
+            file_path, content = item[0], item[1]
+            file_language = item[2] if len(item) > 2 else language
+            chunk.append((file_path, content, file_language))
+            
+            if len(chunk) >= self.chunk_size:
+                pending.add(self.executor.submit(_process_chunk, chunk))
+                chunk = []
+                
+                if len(pending) >= self.max_in_flight:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from future.result()
+        
+        if chunk:
+            pending.add(self.executor.submit(_process_chunk, chunk))
+        
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+    
+    async def parse_files_async(
+        self,
+        files: Sequence[Sequence],
+        language: Optional[str] = None
+    ) -> List[Tuple[str, List[Dict]]]:
+        """
+        异步解析文件（供API使用，不阻塞事件循环）
+        
+        Args:
+            files: (file_path, content) 或 (file_path, content, language) 列表
+            language: 默认编程语言（为None时根据扩展名检测）
+        
+        Returns:
+            (file_path, 代码片段列表) 列表，顺序与输入一致
+        """
+        loop = asyncio.get_running_loop()
+        items = [
+            (item[0], item[1], item[2] if len(item) > 2 else language)
+            for item in files
+        ]
+        chunks = [
+            items[i:i + self.chunk_size]
+            for i in range(0, len(items), self.chunk_size)
+        ]
+        
+        results = await asyncio.gather(*[
+            loop.run_in_executor(self.executor, _process_chunk, chunk)
+            for chunk in chunks
+        ])
+        return [result for chunk_results in results for result in chunk_results]
+    
+    def shutdown(self):
+        """关闭进程池"""
+        self.executor.shutdown(wait=True)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+
+# 全局实例
+_parse_pool: Optional[ParsePool] = None
+
+
+def get_parse_pool() -> ParsePool:
+    """获取解析进程池实例（单例模式）"""
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ParsePool()
+    return _parse_pool
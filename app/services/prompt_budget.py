@@ -0,0 +1,186 @@
+"""
+提示词预算 - 把送给LLM的代码控制在token预算内
+
+按字符数截断会切断标识符和语法结构，也会丢掉后半部分的函数签名。超出预算时
+用tree-sitter找到函数体，按从大到小的顺序把函数体替换为省略标记（保留签名和
+Python的docstring，嵌套函数优先于外层函数），直到代码放进预算；解析不可用或
+仍然超出时按整行截断。
+"""
+
+import textwrap
+from typing import Any, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.chunker import CodeChunker
+from app.services.languages import get_language_spec
+
+
+class PromptBudgeter:
+    """按token预算裁剪代码：先省略函数体，再按行截断"""
+    
+    def __init__(self, max_tokens: Optional[int] = None, tokenizer: Any = None):
+        """
+        初始化预算器
+        
+        Args:
+            max_tokens: 代码的token预算（默认使用LLM_CODE_MAX_TOKENS配置）
+            tokenizer: 用于计数的tokenizer（为None时按正则估算，与分块器一致）
+        """
+        self.max_tokens = max_tokens or settings.LLM_CODE_MAX_TOKENS
+        self._counter = CodeChunker(tokenizer=tokenizer)
+    
+    def count_tokens(self, code: str) -> int:
+        """统计代码的token数"""
+        return self._counter.count_tokens([code])[0]
+    
+    def trim_code(self, code: str, language: Optional[str] = None) -> str:
+        """
+        把代码裁剪到token预算内（未超出时原样返回）
+        
+        Args:
+            code: 代码文本
+            language: 编程语言（用于解析函数体）
+        
+        Returns:
+            裁剪后的代码
+        """
+        if not code or self.count_tokens(code) <= self.max_tokens:
+            return code
+        
+        # Python方法片段带有首行缩进，去掉后才能正确解析
+        if (language or "").lower() == "python":
+            code = textwrap.dedent(code)
+        
+        bodies = self._function_bodies(code, language)
+        elided: List[Tuple[int, int, str]] = []
+        for start, end, placeholder in bodies:
+            # 外层函数体已经省略时，其中的嵌套函数不用再处理
+            if any(s <= start and end <= e for s, e, _ in elided):
+                continue
+            elided = [(s, e, p) for s, e, p in elided if not (start <= s and e <= end)]
+            elided.append((start, end, placeholder))
+            trimmed = self._apply(code, elided)
+            if self.count_tokens(trimmed) <= self.max_tokens:
+                return trimmed
+        
+        if elided:
+            code = self._apply(code, elided)
+        return self._truncate_lines(code)
+    
+    def _function_bodies(self, code: str, language: Optional[str]) -> List[Tuple[int, int, str]]:
+        """
+        找出可省略的函数体
+        
+        Returns:
+            [(起始字符偏移, 结束字符偏移, 替换文本)]，嵌套函数在前，同层按大小降序
+        """
+        spec = get_language_spec((language or "").lower())
+        if spec is None:
+            return []
+        try:
+            from app.services.code_parser import get_code_parser
+            parser = get_code_parser().get_parser(spec.name)
+        except ImportError:
+            return []
+        if parser is None:
+            return []
+        
+        function_nodes = {
+            node_type for node_type, rule in spec.snippet_nodes.items() if rule[0] == "function"
+        }
+        code_bytes = code.encode("utf-8")
+        tree = parser.parse(code_bytes)
+        
+        # 字节偏移转字符偏移
+        def char_offset(byte_offset: int) -> int:
+            return len(code_bytes[:byte_offset].decode("utf-8", errors="replace"))
+        
+        bodies = []
+        stack = [(tree.root_node, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if node.type in function_nodes:
+                body = node.child_by_field_name("body")
+                if body is not None:
+                    span = self._elided_span(body, code_bytes)
+                    if span:
+                        start, end, placeholder = span
+                        bodies.append((depth, end - start, char_offset(start), char_offset(end), placeholder))
+                depth += 1
+            stack.extend((child, depth) for child in node.children)
+        
+        # 嵌套深的优先，同一深度先省略大的函数体
+        bodies.sort(key=lambda item: (-item[0], -item[1]))
+        return [(start, end, placeholder) for _, _, start, end, placeholder in bodies]
+    
+    @staticmethod
+    def _elided_span(body: Any, code_bytes: bytes) -> Optional[Tuple[int, int, str]]:
+        """
+        计算函数体中要替换的字节范围和替换文本
+        
+        花括号语言整体替换为 { ... }；Python保留docstring，其余语句替换为 ...
+        """
+        text = code_bytes[body.start_byte:body.end_byte].decode("utf-8", errors="replace")
+        if text.startswith("{"):
+            return body.start_byte, body.end_byte, "{ ... }"
+        
+        statements = body.named_children
+        if not statements:
+            return None
+        first = statements[0]
+        has_docstring = (
+            first.type == "expression_statement"
+            and first.named_children
+            and first.named_children[0].type == "string"
+        )
+        if has_docstring:
+            if len(statements) == 1:
+                return None
+            start = first.end_byte
+        else:
+            start = body.start_byte
+        # 函数体第一行的缩进
+        line_start = code_bytes.rfind(b"\n", 0, statements[0].start_byte) + 1
+        indent = code_bytes[line_start:statements[0].start_byte].decode("utf-8", errors="replace")
+        placeholder = f"\n{indent}..." if has_docstring else "..."
+        return start, body.end_byte, placeholder
+    
+    @staticmethod
+    def _apply(code: str, elided: List[Tuple[int, int, str]]) -> str:
+        """按字符偏移把各函数体替换为省略标记"""
+        parts = []
+        position = 0
+        for start, end, placeholder in sorted(elided):
+            parts.append(code[position:start])
+            parts.append(placeholder)
+            position = end
+        parts.append(code[position:])
+        return "".join(parts)
+    
+    def _truncate_lines(self, code: str) -> str:
+        """按整行截断到预算内，并标注省略的行数"""
+        lines = code.splitlines()
+        counts = self._counter.count_tokens(lines)
+        kept = []
+        total = 0
+        for line, tokens in zip(lines, counts):
+            if total + tokens > self.max_tokens:
+                break
+            kept.append(line)
+            total += tokens
+        omitted = len(lines) - len(kept)
+        if omitted:
+            kept.append(f"... （省略 {omitted} 行）")
+        return "\n".join(kept)
+
+
+# 全局实例
+_prompt_budgeter: Optional[PromptBudgeter] = None
+
+
+def get_prompt_budgeter() -> PromptBudgeter:
+    """获取提示词预算器实例（单例模式）"""
+    global _prompt_budgeter
+    if _prompt_budgeter is None:
+        _prompt_budgeter = PromptBudgeter()
+    return _prompt_budgeter
@@ -0,0 +1,337 @@
+"""
+重排序 - 对检索候选重新打分
+
+向量检索（以及与BM25的融合）只衡量查询和代码的整体相似度。重排序在前N个候选上
+加入轻量特征：名称和代码标识符与查询的词项匹配、查询中提到的语言、仓库规模
+（知识图谱中的片段数）和图中的关联度（相似代码和依赖库数量）；配置了交叉编码器
+模型时，再把查询和代码成对打分，与特征得分加权合并。
+
+交叉编码器受延迟预算约束：候选按检索排名分批打分，预计超出RERANK_BUDGET_MS时
+剩余候选只用特征得分；第一批在预算内没有完成时（如冷启动），请求不再等待，只用特征
+得分，模型在后台打完这一批后写入缓存。同时重排序的请求数达到RERANK_MAX_CONCURRENCY
+（负载高）时，未缓存的候选都只用特征得分。模型得分按 (查询, code_id, 代码内容) 缓存在
+CacheService中。
+"""
+
+import asyncio
+import hashlib
+import math
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.cache_service import get_cache_service
+from app.services.code_cleaner import content_hash
+from app.services.explanation_cache import normalize_query
+from app.services.lexical_index import tokenize
+
+
+# 特征权重（检索得分保持主导，其余特征主要调整得分相近的候选的顺序）
+FEATURE_WEIGHTS = {
+    "retrieval": 1.0,
+    "name_match": 0.5,
+    "identifier_match": 0.25,
+    "language_match": 0.1,
+    "repo_popularity": 0.1,
+    "graph_degree": 0.1,
+}
+
+# 仓库片段数的缓存键（CacheService）
+_REPO_COUNTS_CACHE_KEY = "rerank:repo_counts"
+
+
+def _log_ratio(value: float, maximum: float) -> float:
+    """按对数缩放到 [0, 1]，避免少数大仓库、高关联度的片段压过其他候选"""
+    if maximum <= 0:
+        return 0.0
+    return math.log1p(value) / math.log1p(maximum)
+
+
+class Reranker:
+    """候选重排序：特征打分，可选交叉编码器"""
+    
+    def __init__(self, model_name: Optional[str] = None):
+        """
+        初始化重排序器（交叉编码器在首次使用或预热时加载）
+        
+        Args:
+            model_name: 交叉编码器模型名称（默认使用RERANK_MODEL配置，为空时只用特征打分）
+        """
+        self.model_name = model_name if model_name is not None else settings.RERANK_MODEL
+        self._model: Any = None
+        self._model_error: Optional[str] = None
+        self._load_lock = threading.Lock()
+        self._loader: Optional[threading.Thread] = None
+        self._semaphore = asyncio.Semaphore(max(1, settings.RERANK_MAX_CONCURRENCY))
+        # 超出预算后仍在后台打分的任务（保持引用，避免任务被回收）
+        self._background: set = set()
+    
+    # ===== 交叉编码器 =====
+    
+    def load_model(self) -> Any:
+        """
+        加载交叉编码器（已加载时直接返回）
+        
+        Returns:
+            CrossEncoder实例，未配置模型时返回None
+        
+        Raises:
+            加载失败时抛出异常，并记录错误（之后的请求只用特征打分，不再尝试加载）
+        """
+        if not self.model_name:
+            return None
+        with self._load_lock:
+            if self._model is None:
+                start = time.perf_counter()
+                try:
+                    # 延迟导入sentence_transformers，只在配置了模型时导入
+                    from sentence_transformers import CrossEncoder
+                    
+                    self._model = CrossEncoder(
+                        self.model_name,
+                        max_length=512,
+                        device=settings.EMBEDDING_DEVICE
+                    )
+                except Exception as e:
+                    self._model_error = str(e)
+                    raise
+                print(f"✅ 重排序模型已加载: {self.model_name}（{time.perf_counter() - start:.1f} 秒）")
+        return self._model
+    
+    def _load_in_background(self):
+        """在后台线程中加载模型，失败后不再重试（只用特征打分）"""
+        try:
+            self.load_model()
+        except Exception as e:
+            print(f"[!] 加载重排序模型失败，只使用特征打分: {e}")
+    
+    def _available_model(self) -> Any:
+        """返回已加载的模型；尚未加载时在后台开始加载并返回None（本次请求不等待）"""
+        if self._model is not None or not self.model_name or self._model_error:
+            return self._model
+        with self._load_lock:
+            if self._loader is None:
+                self._loader = threading.Thread(target=self._load_in_background, daemon=True)
+                self._loader.start()
+        return None
+    
+    def _cache_key(self, query: str, item: Dict) -> str:
+        """模型得分的缓存键：代码内容变化（同一code_id更新）后重新打分"""
+        parts = [
+            self.model_name,
+            normalize_query(query),
+            item.get("code_id") or "",
+            content_hash(item.get("code") or ""),
+        ]
+        return "rerank:" + hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def _model_text(item: Dict) -> str:
+        """交叉编码器的文档侧文本：名称 + 代码（超出max_length的部分由模型截断）"""
+        name = item.get("name") or ""
+        code = item.get("code") or ""
+        return f"{name}\n{code}" if name else code
+    
+    @staticmethod
+    def _predict_until(model: Any, pairs: List[Tuple[str, str]], deadline: float) -> List[float]:
+        """
+        分批打分，预计下一批会超过截止时间时停止
+        
+        Returns:
+            已打分的前若干个候选的得分（0~1）
+        """
+        batch_size = max(1, settings.RERANK_BATCH_SIZE)
+        scores: List[float] = []
+        last_batch_seconds = 0.0
+        for start in range(0, len(pairs), batch_size):
+            if time.monotonic() + last_batch_seconds > deadline:
+                break
+            batch_start = time.monotonic()
+            batch = pairs[start:start + batch_size]
+            # 单输出的CrossEncoder默认经过Sigmoid，得分在0~1之间
+            predicted = model.predict(batch, batch_size=batch_size, show_progress_bar=False)
+            scores.extend(float(score) for score in np.asarray(predicted).reshape(len(batch), -1)[:, -1])
+            last_batch_seconds = time.monotonic() - batch_start
+        return scores
+    
+    async def _model_scores(self, query: str, items: List[Dict], deadline: float) -> Dict[int, float]:
+        """
+        交叉编码器得分（先查缓存，未命中的候选在预算内按排名顺序打分）
+        
+        Returns:
+            {候选下标: 得分}，没有得分的候选不在结果中
+        """
+        model = self._available_model()
+        if model is None:
+            return {}
+        
+        cache_service = get_cache_service()
+        keys = [self._cache_key(query, item) for item in items]
+        scores: Dict[int, float] = {}
+        pending = []
+        for index, key in enumerate(keys):
+            cached = cache_service.get(key)
+            if cached is not None:
+                scores[index] = cached
+            else:
+                pending.append(index)
+        
+        # 负载高时不排队等待模型，未缓存的候选只用特征得分
+        if not pending or self._semaphore.locked():
+            return scores
+        
+        task = asyncio.ensure_future(self._score_pending(model, query, items, keys, pending, deadline))
+        try:
+            # _predict_until在批次之间检查截止时间，但正在进行的一批（冷启动时可能远超预算）
+            # 无法中断：请求最多等到截止时间，之后这一批在后台完成并写入缓存
+            predicted = await asyncio.wait_for(
+                asyncio.shield(task), timeout=max(0.0, deadline - time.monotonic())
+            )
+        except asyncio.TimeoutError:
+            self._background.add(task)
+            task.add_done_callback(self._finish_background)
+            return scores
+        scores.update(predicted)
+        return scores
+    
+    async def _score_pending(
+        self,
+        model: Any,
+        query: str,
+        items: List[Dict],
+        keys: List[str],
+        pending: List[int],
+        deadline: float
+    ) -> Dict[int, float]:
+        """在工作线程中给未缓存的候选打分并写入缓存（打分期间占用并发名额）"""
+        async with self._semaphore:
+            pairs = [(query, self._model_text(items[index])) for index in pending]
+            predicted = await asyncio.to_thread(self._predict_until, model, pairs, deadline)
+        cache_service = get_cache_service()
+        scores = {}
+        for index, score in zip(pending, predicted):
+            scores[index] = score
+            cache_service.set(keys[index], score, ttl=settings.RERANK_CACHE_TTL)
+        return scores
+    
+    def _finish_background(self, task: "asyncio.Future"):
+        """后台打分任务结束：释放引用，记录失败"""
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"[!] 后台重排序打分失败: {task.exception()}")
+    
+    # ===== 特征 =====
+    
+    async def _repo_counts(self, deadline: float) -> Dict[str, int]:
+        """各仓库在知识图谱中的片段数（缓存5分钟，查询失败或超出预算时返回空字典）"""
+        cache_service = get_cache_service()
+        counts = cache_service.get(_REPO_COUNTS_CACHE_KEY)
+        if counts is not None:
+            return counts
+        
+        async def fetch() -> Dict[str, int]:
+            from app.services.async_neo4j_service import get_async_neo4j_service
+            
+            neo4j_service = await get_async_neo4j_service()
+            return await neo4j_service.get_repo_distribution(limit=settings.RERANK_POPULAR_REPOS)
+        
+        try:
+            counts = await asyncio.wait_for(fetch(), timeout=max(0.0, deadline - time.monotonic()))
+        except Exception:
+            return {}
+        cache_service.set(_REPO_COUNTS_CACHE_KEY, counts, ttl=300)
+        return counts
+    
+    @staticmethod
+    def _features(
+        query_terms: set,
+        item: Dict,
+        repo_counts: Dict[str, int],
+        max_repo_count: int,
+        max_degree: int
+    ) -> Dict[str, float]:
+        """计算单个候选的特征（均在 0~1 之间）"""
+        name_terms = set(tokenize(item.get("name") or ""))
+        code_terms = set(tokenize(item.get("code") or ""))
+        language = (item.get("language") or "").lower()
+        degree = len(item.get("related_codes") or []) + len(item.get("dependencies") or [])
+        return {
+            "retrieval": min(1.0, max(0.0, float(item.get("score") or 0.0))),
+            "name_match": len(query_terms & name_terms) / len(query_terms) if query_terms else 0.0,
+            "identifier_match": len(query_terms & code_terms) / len(query_terms) if query_terms else 0.0,
+            "language_match": 1.0 if language and language in query_terms else 0.0,
+            "repo_popularity": _log_ratio(repo_counts.get(item.get("repo_name") or "", 0), max_repo_count),
+            "graph_degree": _log_ratio(degree, max_degree),
+        }
+    
+    async def rerank(
+        self,
+        query: str,
+        items: List[Dict],
+        budget_ms: Optional[float] = None
+    ) -> List[Dict]:
+        """
+        对候选重新打分并排序
+        
+        Args:
+            query: 用户查询
+            items: 候选列表（按检索排名，包含score、name、code、language、repo_name、
+                   dependencies、related_codes等字段），score会被替换为重排序得分
+            budget_ms: 延迟预算毫秒数（默认使用RERANK_BUDGET_MS配置）
+        
+        Returns:
+            按重排序得分降序排列的候选（得分相同时保持原排名）
+        """
+        if len(items) < 2:
+            return items
+        
+        budget_ms = budget_ms if budget_ms is not None else settings.RERANK_BUDGET_MS
+        deadline = time.monotonic() + budget_ms / 1000.0
+        repo_counts, model_scores = await asyncio.gather(
+            self._repo_counts(deadline),
+            self._model_scores(query, items, deadline)
+        )
+        
+        query_terms = set(tokenize(query)) | set(normalize_query(query).split())
+        max_repo_count = max(repo_counts.values(), default=0)
+        max_degree = max(
+            (len(item.get("related_codes") or []) + len(item.get("dependencies") or []) for item in items),
+            default=0
+        )
+        total_weight = sum(FEATURE_WEIGHTS.values())
+        model_weight = min(1.0, max(0.0, settings.RERANK_MODEL_WEIGHT))
+        
+        scored = []
+        for index, item in enumerate(items):
+            features = self._features(query_terms, item, repo_counts, max_repo_count, max_degree)
+            score = sum(FEATURE_WEIGHTS[name] * value for name, value in features.items()) / total_weight
+            if index in model_scores:
+                score = model_weight * model_scores[index] + (1.0 - model_weight) * score
+            scored.append((score, index, item))
+        
+        # 预算内只给排名靠前的候选打了模型得分时，两种得分尺度不同：
+        # 有模型得分的候选排在前面，其余候选按特征得分排在后面（得分不高于前面的候选）
+        scored.sort(key=lambda entry: (entry[1] not in model_scores, -entry[0], entry[1]))
+        floor = min((score for score, index, _ in scored if index in model_scores), default=None)
+        reranked = []
+        for score, index, item in scored:
+            if floor is not None and index not in model_scores:
+                score = min(score, floor)
+            item["score"] = score
+            reranked.append(item)
+        return reranked
+
+
+# 全局实例
+_reranker: Optional[Reranker] = None
+
+
+def get_reranker() -> Reranker:
+    """获取重排序器实例（单例模式）"""
+    global _reranker
+    if _reranker is None:
+        _reranker = Reranker()
+    return _reranker
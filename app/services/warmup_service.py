@@ -0,0 +1,164 @@
+"""
+预热服务 - 启动时在后台初始化并预热各个服务
+
+嵌入模型加载、Milvus集合加载和Neo4j连接都比较耗时。应用启动后在后台线程中
+依次完成这些初始化（并做一次真实的编码和检索），/ready 在全部完成前返回503，
+负载均衡只会把请求转发给已经预热好的进程。
+"""
+
+import asyncio
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.embedding_service import get_embedding_service
+from app.services.milvus_service import get_milvus_service
+from app.services.async_neo4j_service import get_async_neo4j_service
+
+
+def _warm_embedding():
+    """加载嵌入模型并编码一次，触发模型和tokenizer的首次初始化"""
+    get_embedding_service().encode_code("def warmup():\n    return 'ready'")
+
+
+def _warm_milvus():
+    """连接Milvus、加载集合，并执行一次检索"""
+    milvus_service = get_milvus_service()
+    milvus_service.search(np.zeros(milvus_service.dimension, dtype=np.float32), top_k=1)
+
+
+async def _warm_neo4j():
+    """创建API使用的异步Neo4j驱动并执行一次读查询，建立连接池中的连接"""
+    neo4j_service = await get_async_neo4j_service()
+    await neo4j_service.get_statistics()
+
+
+def _warm_reranker():
+    """加载重排序使用的交叉编码器（未配置模型时不需要预热）"""
+    from app.services.reranker import get_reranker
+    get_reranker().load_model()
+
+
+class WarmupService:
+    """在后台线程中依次预热各个服务，失败的步骤按间隔重试"""
+    
+    def __init__(
+        self,
+        steps: Optional[Dict[str, Callable]] = None,
+        retry_interval: Optional[float] = None,
+        optional: Optional[Iterable[str]] = None
+    ):
+        """
+        初始化预热服务
+        
+        Args:
+            steps: {名称: 预热函数}（默认预热嵌入模型、Milvus和Neo4j；
+                   协程函数会提交到start传入的事件循环中执行）
+            retry_interval: 失败步骤的重试间隔秒数（默认使用WARMUP_RETRY_INTERVAL配置）
+            optional: 可选步骤的名称；可选步骤只执行一次，失败时标记为degraded（服务降级运行），
+                      不重试，也不影响 /ready
+        """
+        self.steps = steps or {
+            "embedding": _warm_embedding,
+            "milvus": _warm_milvus,
+            "neo4j": _warm_neo4j,
+        }
+        self.optional = set(optional or ())
+        # 交叉编码器加载失败时重排序只用特征打分，不应让 /ready 一直返回503
+        if steps is None and settings.RERANK_MODEL:
+            self.steps["reranker"] = _warm_reranker
+            self.optional.add("reranker")
+        self.retry_interval = (
+            retry_interval if retry_interval is not None else settings.WARMUP_RETRY_INTERVAL
+        )
+        self.status: Dict[str, Dict] = {
+            name: {"status": "pending", "seconds": None, "error": None}
+            for name in self.steps
+        }
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    @property
+    def ready(self) -> bool:
+        """是否所有服务都已预热完成（可选步骤失败后降级运行也算完成）"""
+        with self._lock:
+            return all(step["status"] in ("ready", "degraded") for step in self.status.values())
+    
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        启动后台预热线程（重复调用不会启动多个线程）
+        
+        Args:
+            loop: 应用的事件循环；异步服务（如异步Neo4j驱动）只能在创建它的事件循环中使用，
+                  所以异步预热步骤要在这个循环中执行
+        """
+        if self._thread is not None:
+            return
+        self._loop = loop
+        self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """停止重试（正在执行的步骤不会被打断）"""
+        self._stop.set()
+    
+    def _run(self):
+        """依次执行未完成的步骤，直到全部成功或被停止"""
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            for name, step in self.steps.items():
+                if self.status[name]["status"] in ("ready", "degraded") or self._stop.is_set():
+                    continue
+                self._run_step(name, step)
+            
+            if self.ready:
+                print(f"✅ 服务预热完成，耗时 {time.perf_counter() - start:.1f} 秒")
+                return
+            self._stop.wait(self.retry_interval)
+    
+    def _run_step(self, name: str, step: Callable):
+        """执行单个预热步骤并记录耗时和错误"""
+        with self._lock:
+            self.status[name]["status"] = "running"
+        step_start = time.perf_counter()
+        try:
+            if asyncio.iscoroutinefunction(step):
+                if self._loop is None:
+                    raise RuntimeError("异步预热步骤需要在start中传入事件循环")
+                asyncio.run_coroutine_threadsafe(step(), self._loop).result()
+            else:
+                step()
+            result = {"status": "ready", "error": None}
+        except Exception as e:
+            if name in self.optional:
+                print(f"[!] 预热 {name} 失败: {e}，降级运行")
+                result = {"status": "degraded", "error": str(e)}
+            else:
+                print(f"[!] 预热 {name} 失败: {e}，{self.retry_interval:.0f} 秒后重试")
+                result = {"status": "failed", "error": str(e)}
+        
+        with self._lock:
+            self.status[name].update(result)
+            self.status[name]["seconds"] = round(time.perf_counter() - step_start, 3)
+    
+    def snapshot(self) -> Dict[str, Dict]:
+        """返回各步骤当前状态的副本"""
+        with self._lock:
+            return {name: dict(step) for name, step in self.status.items()}
+
+
+# 全局实例
+_warmup_service: Optional[WarmupService] = None
+
+
+def get_warmup_service() -> WarmupService:
+    """获取预热服务实例（单例模式）"""
+    global _warmup_service
+    if _warmup_service is None:
+        _warmup_service = WarmupService()
+    return _warmup_service
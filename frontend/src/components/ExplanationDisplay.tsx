@@ -1,5 +1,5 @@
 import { useState } from 'react'
-import { Card, Button, Collapse } from 'antd'
+import { Card, Button, Collapse, Spin } from 'antd'
 import { DownOutlined, UpOutlined, FileTextOutlined } from '@ant-design/icons'
 import ReactMarkdown from 'react-markdown'
 import remarkGfm from 'remark-gfm'
@@ -9,9 +9,11 @@ import './ExplanationDisplay.css'
 
 interface ExplanationDisplayProps {
   explanation: string
+  // 说明是否仍在生成（流式检索时逐段追加）
+  streaming?: boolean
 }
 
-const ExplanationDisplay = ({ explanation }: ExplanationDisplayProps) => {
+const ExplanationDisplay = ({ explanation, streaming = false }: ExplanationDisplayProps) => {
   const [expanded, setExpanded] = useState(true)
 
   return (
@@ -20,6 +22,7 @@ const ExplanationDisplay = ({ explanation }: ExplanationDisplayProps) => {
       title={
         <span>
           <FileTextOutlined /> 复用说明
+          {streaming && <Spin size="small" style={{ marginLeft: 8 }} />}
         </span>
       }
       extra={
@@ -59,6 +62,9 @@ const ExplanationDisplay = ({ explanation }: ExplanationDisplayProps) => {
           >
             {explanation}
           </ReactMarkdown>
+          {streaming && !explanation && (
+            <div className="explanation-pending">正在生成...</div>
+          )}
         </div>
       )}
     </Card>
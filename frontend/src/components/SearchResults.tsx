@@ -101,9 +101,12 @@ const SearchResults = ({ results }: SearchResultsProps) => {
                 )}
 
                 {/* 复用说明 */}
-                {item.explanation && (
+                {(item.explanation || item.explanation_streaming) && (
                   <div style={{ marginTop: '16px' }}>
-                    <ExplanationDisplay explanation={item.explanation} />
+                    <ExplanationDisplay
+                      explanation={item.explanation || ''}
+                      streaming={item.explanation_streaming}
+                    />
                   </div>
                 )}
 
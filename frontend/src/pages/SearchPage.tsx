@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import { Card, Input, Button, Select, Space, Spin, message, Checkbox, Tabs } from 'antd'
 import { SearchOutlined, ReloadOutlined, BarChartOutlined, SettingOutlined } from '@ant-design/icons'
 import { useTranslation } from 'react-i18next'
@@ -26,10 +26,13 @@ const SearchPage = () => {
   const [results, setResults] = useState<SearchResultItem[]>([])
   const [availableDependencies, setAvailableDependencies] = useState<string[]>([])
   const [availableRepos, setAvailableRepos] = useState<string[]>([])
+  // 正在进行的流式说明生成，新的搜索或重置时取消
+  const streamRef = useRef<AbortController | null>(null)
 
   // 加载可用筛选选项
   useEffect(() => {
     loadFilterOptions()
+    return () => streamRef.current?.abort()
   }, [])
 
   const loadFilterOptions = async () => {
@@ -48,22 +51,65 @@ const SearchPage = () => {
       return
     }
 
+    streamRef.current?.abort()
+    streamRef.current = null
+
+    const params = {
+      query: query.trim(),
+      top_k: topK,
+      language: language || undefined,
+      dependency: dependency || undefined,
+      repo_name: repoName || undefined,
+      explain,
+      explain_top_n: explainTopN,
+    }
+
+    let controller: AbortController | null = null
     setLoading(true)
     try {
-      const response = await api.searchCode({
-        query: query.trim(),
-        top_k: topK,
-        language: language || undefined,
-        dependency: dependency || undefined,
-        repo_name: repoName || undefined,
-        explain,
-        explain_top_n: explainTopN,
-      })
-      setResults(response.results)
-      if (response.results.length === 0) {
-        message.info(t('search.noResults'))
+      if (explain) {
+        // 需要复用说明时使用流式检索：先显示结果，说明逐段显示
+        controller = new AbortController()
+        streamRef.current = controller
+        await api.searchCodeStream(
+          params,
+          {
+            onResults: (response) => {
+              setResults(response.results.map((item, index) => ({
+                ...item,
+                explanation_streaming: index < explainTopN,
+              })))
+              setLoading(false)
+              if (response.results.length === 0) {
+                message.info(t('search.noResults'))
+              }
+            },
+            onExplanationDelta: (index, delta) => {
+              setResults((prev) => prev.map((item, i) => (
+                i === index ? { ...item, explanation: (item.explanation || '') + delta } : item
+              )))
+            },
+            onExplanationDone: (index, explanation) => {
+              setResults((prev) => prev.map((item, i) => (
+                i === index
+                  ? { ...item, explanation: explanation || undefined, explanation_streaming: false }
+                  : item
+              )))
+            },
+          },
+          controller.signal
+        )
+      } else {
+        const response = await api.searchCode(params)
+        setResults(response.results)
+        if (response.results.length === 0) {
+          message.info(t('search.noResults'))
+        }
       }
     } catch (error: any) {
+      if (error?.name === 'AbortError') {
+        return
+      }
       console.error('Search error:', error)
       const errorMessage = error?.response?.data?.detail || error?.message || t('search.searchFailed')
       message.error({
@@ -71,11 +117,16 @@ const SearchPage = () => {
         duration: 5,
       })
     } finally {
-      setLoading(false)
+      // 被新的搜索取消时，不改变新搜索的加载状态
+      if (!controller || streamRef.current === controller) {
+        setLoading(false)
+      }
     }
   }
 
   const handleReset = () => {
+    streamRef.current?.abort()
+    streamRef.current = null
     setQuery('')
     setLanguage(undefined)
     setDependency(undefined)
@@ -81,6 +81,8 @@ export interface SearchResultItem {
   dependencies?: string[]
   related_codes?: string[]
   explanation?: string
+  // 流式检索时说明是否仍在生成（仅前端使用）
+  explanation_streaming?: boolean
 }
 
 export interface SearchResponse {
@@ -89,6 +91,16 @@ export interface SearchResponse {
   results: SearchResultItem[]
 }
 
+// 流式检索的事件回调
+export interface SearchStreamHandlers {
+  // 检索结果（不含说明）
+  onResults: (response: SearchResponse) => void
+  // 第 index 条结果的说明新生成了一段文本
+  onExplanationDelta?: (index: number, delta: string) => void
+  // 第 index 条结果的说明生成结束（失败时 explanation 为 null）
+  onExplanationDone?: (index: number, explanation: string | null, error: string | null) => void
+}
+
 export interface StatisticsResponse {
   total_code_snippets: number
   total_libraries: number
@@ -124,6 +136,73 @@ export const api = {
     return response.data
   },
 
+  // 流式搜索代码：检索结果先返回，复用说明通过 Server-Sent Events 逐段推送
+  // （EventSource 只支持 GET，这里用 fetch 读取响应流并解析事件）
+  searchCodeStream: async (
+    params: SearchRequest,
+    handlers: SearchStreamHandlers,
+    signal?: AbortSignal
+  ): Promise<void> => {
+    const response = await fetch(`${API_BASE_URL}/search/stream`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        Accept: 'text/event-stream',
+      },
+      body: JSON.stringify(params),
+      signal,
+    })
+    if (!response.ok || !response.body) {
+      let message = '请求失败'
+      try {
+        const data = await response.json()
+        message = data?.detail || data?.message || message
+      } catch {
+        // 响应不是JSON，使用默认错误信息
+      }
+      throw new Error(message)
+    }
+
+    const dispatch = (event: string, data: any) => {
+      if (event === 'results') {
+        handlers.onResults(data as SearchResponse)
+      } else if (event === 'explanation') {
+        handlers.onExplanationDelta?.(data.index, data.delta)
+      } else if (event === 'explanation_done') {
+        handlers.onExplanationDone?.(data.index, data.explanation, data.error)
+      }
+    }
+
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+    for (;;) {
+      const { done, value } = await reader.read()
+      if (done) break
+      buffer += decoder.decode(value, { stream: true })
+
+      // 事件之间以空行分隔
+      let boundary = buffer.indexOf('\n\n')
+      while (boundary >= 0) {
+        const block = buffer.slice(0, boundary)
+        buffer = buffer.slice(boundary + 2)
+        let event = 'message'
+        const dataLines: string[] = []
+        for (const line of block.split('\n')) {
+          if (line.startsWith('event:')) {
+            event = line.slice(6).trim()
+          } else if (line.startsWith('data:')) {
+            dataLines.push(line.slice(5).trimStart())
+          }
+        }
+        if (dataLines.length > 0) {
+          dispatch(event, JSON.parse(dataLines.join('\n')))
+        }
+        boundary = buffer.indexOf('\n\n')
+      }
+    }
+  },
+
   // 健康检查
   healthCheck: async (): Promise<{ status: string }> => {
     const response = await apiClient.get<{ status: string }>('/health')
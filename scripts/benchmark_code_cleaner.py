@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+代码清洗器性能基准
+对一批代码片段重复执行清洗，输出吞吐量，并与旧版逐字符实现对比
+"""
+
+import re
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.services.code_cleaner import CodeCleaner
+from app.services.languages import detect_language
+
+
+def legacy_clean(code: str, min_lines: int = 5, max_lines: int = 200, max_comment_ratio: float = 0.5) -> Optional[str]:
+    """旧版清洗实现（多次遍历 + 逐字符括号检查 + 未编译正则），仅用于对比"""
+    if not code or not code.strip():
+        return None
+    code = code.strip()
+    lines = code.split('\n')
+    non_empty_lines = [line for line in lines if line.strip()]
+    if len(non_empty_lines) < min_lines or len(lines) > max_lines:
+        return None
+    
+    def is_comment(line: str) -> bool:
+        stripped = line.strip()
+        return (stripped.startswith('#') or stripped.startswith('//')
+                or stripped.startswith('/*') or stripped.endswith('*/'))
+    
+    comment_count = sum(1 for line in lines if is_comment(line))
+    if comment_count / len(lines) > max_comment_ratio:
+        return None
+    
+    brackets = {'(': ')', '[': ']', '{': '}'}
+    stack = []
+    in_string = False
+    string_char = None
+    for char in code:
+        if char in ('"', "'") and (not stack or stack[-1] != '\\'):
+            if not in_string:
+                in_string, string_char = True, char
+            elif char == string_char:
+                in_string, string_char = False, None
+            continue
+        if in_string:
+            continue
+        if char in brackets:
+            stack.append(char)
+        elif char in brackets.values():
+            if not stack or brackets[stack.pop()] != char:
+                return None
+    if stack:
+        return None
+    
+    for pattern in (r'\.\.\.', r'TODO.*FIXME'):
+        if re.search(pattern, code, re.IGNORECASE):
+            return None
+    return code
+
+
+def load_snippets(paths: List[str]) -> List[Tuple[str, str, Optional[bool]]]:
+    """从源码文件中提取代码片段，返回 (language, code, has_error) 列表"""
+    try:
+        from app.services.code_parser import CodeParser
+        parser = CodeParser()
+    except ImportError:
+        parser = None
+    
+    snippets = []
+    for path in paths:
+        root = Path(path)
+        files = [root] if root.is_file() else sorted(p for p in root.rglob('*') if p.is_file())
+        for file in files:
+            language = detect_language(str(file))
+            if not language:
+                continue
+            content = file.read_text(encoding='utf-8', errors='replace')
+            if parser:
+                items = parser.extract_snippets(content, language)
+                snippets.extend((language, item['code'], item['has_error']) for item in items)
+            else:
+                # 没有tree-sitter时按固定行数切分
+                lines = content.split('\n')
+                snippets.extend(
+                    (language, '\n'.join(lines[i:i + 40]), None)
+                    for i in range(0, len(lines), 40)
+                )
+    return snippets
+
+
+def main():
+    """主函数"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='代码清洗器性能基准')
+    parser.add_argument('paths', nargs='*',
+                       default=[str(project_root / 'app'), str(project_root / 'scripts')],
+                       help='源码文件或目录（默认：项目自身代码）')
+    parser.add_argument('--repeat', '-r', type=int, default=20,
+                       help='重复次数（默认：20）')
+    args = parser.parse_args()
+    
+    snippets = load_snippets(args.paths)
+    if not snippets:
+        print("没有找到可用的代码片段")
+        sys.exit(1)
+    
+    total_bytes = sum(len(code.encode('utf-8')) for _, code, _ in snippets)
+    print(f"片段数量: {len(snippets)}，总大小: {total_bytes / 1024:.1f} KB，重复 {args.repeat} 次")
+    
+    cleaner = CodeCleaner()
+    by_language = {}
+    for language, code, has_error in snippets:
+        codes, has_errors = by_language.setdefault(language, ([], []))
+        codes.append(code)
+        has_errors.append(has_error)
+    
+    # 有语法树时使用解析器的错误标记，没有时退回括号扫描
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for language, (codes, has_errors) in by_language.items():
+            cleaner.clean_many(codes, language, has_errors)
+    new_elapsed = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for _, code, _ in snippets:
+            legacy_clean(code)
+    legacy_elapsed = time.perf_counter() - start
+    
+    count = len(snippets) * args.repeat
+    size_mb = total_bytes * args.repeat / 1024 / 1024
+    print("=" * 60)
+    print(f"{'实现':<10}{'耗时(s)':>10}{'片段/秒':>14}{'MB/秒':>10}")
+    print(f"{'clean_many':<10}{new_elapsed:>10.3f}{count / new_elapsed:>14.0f}{size_mb / new_elapsed:>10.2f}")
+    print(f"{'旧版':<10}{legacy_elapsed:>10.3f}{count / legacy_elapsed:>14.0f}{size_mb / legacy_elapsed:>10.2f}")
+    print(f"加速比: {legacy_elapsed / new_elapsed:.2f}x")
+    
+    # 结果差异来自语法判断的修正（旧版会误判转义引号、字符字面量、注释中的括号等）
+    kept_new = sum(
+        1 for language, (codes, has_errors) in by_language.items()
+        for result in cleaner.clean_many(codes, language, has_errors) if result
+    )
+    kept_legacy = sum(1 for _, code, _ in snippets if legacy_clean(code))
+    print(f"通过清洗的片段: clean_many {kept_new} 个，旧版 {kept_legacy} 个")
+
+
+if __name__ == '__main__':
+    main()
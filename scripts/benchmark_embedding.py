@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+嵌入编码性能基准
+对比按输入顺序编码（旧版encode_batch）与按token长度分桶编码的吞吐量，
+指定 --workers 时再对比多进程编码
+"""
+
+import sys
+import json
+import time
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.services.embedding_service import get_embedding_service
+from app.services.embedding_pool import EmbeddingPool
+
+
+def load_texts(json_files: List[str], limit: int) -> List[str]:
+    """从采集结果JSON中读取待编码文本（与vectorize_code.py相同的拼接方式）"""
+    texts = []
+    for json_file in json_files:
+        with open(json_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        # 兼容增量采集的变更事件文件
+        if isinstance(data, dict):
+            data = [snippet for event in data.get("events", []) for snippet in event.get("snippets", [])]
+        for snippet in data:
+            texts.append(f"{snippet.get('name', '')} {snippet.get('type', '')} {snippet.get('code', '')}")
+    return texts[:limit] if limit > 0 else texts
+
+
+def main():
+    """主函数"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='嵌入编码性能基准')
+    parser.add_argument('json_files', nargs='+', help='代码片段JSON文件（collect_code.py的输出）')
+    parser.add_argument('--limit', type=int, default=1000,
+                       help='最多使用的片段数（默认：1000，0 表示全部）')
+    parser.add_argument('--batch-size', '-b', type=int, default=32,
+                       help='每批最多条数（默认：32）')
+    parser.add_argument('--max-batch-tokens', type=int, default=None,
+                       help='每批的token预算（默认使用EMBEDDING_MAX_BATCH_TOKENS配置）')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='多进程编码的进程数（默认：1，不测试多进程）')
+    parser.add_argument('--threads', type=int, default=0,
+                       help='每个进程的线程数（默认：CPU核数 / 进程数）')
+    args = parser.parse_args()
+    
+    texts = load_texts(args.json_files, args.limit)
+    if not texts:
+        print("没有找到可用的代码片段")
+        sys.exit(1)
+    
+    service = get_embedding_service()
+    tokens = sum(service.token_lengths(texts))
+    print(f"片段数量: {len(texts)}，总token数: {tokens}")
+    
+    # 预热，避免首批编码的初始化开销计入结果
+    service.model.encode(texts[:args.batch_size], batch_size=args.batch_size, show_progress_bar=False)
+    
+    # 旧版：按输入顺序、固定批大小编码
+    start = time.perf_counter()
+    baseline = service.model.encode(
+        texts,
+        batch_size=args.batch_size,
+        convert_to_numpy=True,
+        show_progress_bar=False
+    )
+    baseline_elapsed = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    bucketed = service.encode_batch(
+        texts,
+        batch_size=args.batch_size,
+        max_batch_tokens=args.max_batch_tokens,
+        show_progress=False
+    )
+    bucketed_elapsed = time.perf_counter() - start
+    stats = service.last_batch_stats
+    
+    pooled_elapsed = None
+    if args.workers > 1:
+        with EmbeddingPool(args.workers, args.threads) as pool:
+            # 预热：等所有进程加载完模型
+            pool.encode_batch(texts[:args.workers * 2], show_progress=False)
+            start = time.perf_counter()
+            pooled = pool.encode_batch(
+                texts,
+                batch_size=args.batch_size,
+                max_batch_tokens=args.max_batch_tokens,
+                show_progress=False
+            )
+            pooled_elapsed = time.perf_counter() - start
+    
+    print("=" * 60)
+    print(f"{'实现':<12}{'耗时(s)':>10}{'tokens/秒':>14}{'批数':>8}")
+    print(f"{'输入顺序':<12}{baseline_elapsed:>10.2f}{tokens / baseline_elapsed:>14.0f}"
+          f"{(len(texts) + args.batch_size - 1) // args.batch_size:>8}")
+    print(f"{'长度分桶':<12}{bucketed_elapsed:>10.2f}{tokens / bucketed_elapsed:>14.0f}{stats['batches']:>8}")
+    if pooled_elapsed is not None:
+        print(f"{f'{args.workers}进程':<12}{pooled_elapsed:>10.2f}{tokens / pooled_elapsed:>14.0f}"
+              f"{pool.last_batch_stats['batches']:>8}")
+    print(f"加速比: {baseline_elapsed / bucketed_elapsed:.2f}x，"
+          f"分桶后填充占比: {1 - stats['tokens'] / stats['padded_tokens']:.1%}")
+    
+    # 分批方式不同只会带来浮点误差级别的差异
+    max_diff = float(np.max(np.abs(np.asarray(bucketed) - baseline)))
+    print(f"向量最大差异: {max_diff:.2e}")
+    if pooled_elapsed is not None:
+        print(f"多进程加速比（相对长度分桶）: {bucketed_elapsed / pooled_elapsed:.2f}x，"
+              f"向量最大差异: {float(np.max(np.abs(np.asarray(pooled) - baseline))):.2e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+重建词法（BM25）索引
+从Milvus（或采集输出的JSON文件）读取全部代码片段，写入词法索引并编译快照。
+用于已有数据的集合启用混合检索，或索引目录丢失后恢复；
+日常采集由vectorize_code.py增量维护索引，不需要运行本脚本
+"""
+
+import json
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core.config import settings
+from app.services.lexical_index import LexicalIndex
+
+
+def main():
+    """主函数"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='重建词法（BM25）索引')
+    parser.add_argument('json_files', nargs='*',
+                       help='代码片段JSON文件（需要已有code_id；不指定时从Milvus读取）')
+    parser.add_argument('--index-dir', default=settings.LEXICAL_INDEX_DIR,
+                       help=f'索引目录（默认：{settings.LEXICAL_INDEX_DIR}）')
+    parser.add_argument('--batch-size', '-b', type=int, default=1000,
+                       help='从Milvus每批读取的记录数（默认：1000）')
+    parser.add_argument('--query', '-q', default=None,
+                       help='重建后用该查询检索一次，检查索引')
+    args = parser.parse_args()
+    
+    lexical_index = LexicalIndex(args.index_dir)
+    start = time.perf_counter()
+    added = 0
+    try:
+        lexical_index.clear()
+        if args.json_files:
+            for json_file in args.json_files:
+                with open(json_file, 'r', encoding='utf-8') as f:
+                    snippets = json.load(f)
+                missing = sum(1 for snippet in snippets if not snippet.get("code_id"))
+                if missing:
+                    print(f"[!] {json_file} 中有 {missing} 个片段没有code_id，已跳过")
+                added += lexical_index.add_snippets(snippets)
+                print(f"  {json_file}: {len(snippets) - missing} 个片段")
+        else:
+            from app.services.milvus_service import get_milvus_service
+            
+            milvus_service = get_milvus_service()
+            print(f"从Milvus集合 {milvus_service.collection_name} 读取代码片段...")
+            for batch in milvus_service.iter_snippets(batch_size=args.batch_size):
+                added += lexical_index.add_snippets(batch)
+                print(f"  已写入 {added} 个片段")
+        
+        lexical_index.build(force=True)
+        print(f"✅ 词法索引已重建: {added} 个片段，耗时 {time.perf_counter() - start:.2f} 秒")
+        
+        if args.query:
+            print(f"\n检索: {args.query}")
+            for code_id, score in lexical_index.search(args.query, top_k=10):
+                print(f"  {score:8.3f}  {code_id}")
+    except Exception as e:
+        print(f"❌ 重建词法索引失败: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+    finally:
+        lexical_index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+嵌入后端精度检查
+用torch后端和ONNX Runtime后端（fp32 / int8量化）编码同一批代码，
+比较向量的余弦相似度和近邻检索结果的一致性，并输出各后端的吞吐量
+"""
+
+import sys
+import json
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core.config import settings
+from app.services.embedding_service import get_embedding_service
+from app.services.onnx_encoder import OnnxEncoder
+
+
+def load_texts(json_files: List[str], limit: int) -> List[str]:
+    """读取待编码文本：指定JSON时使用采集结果，否则使用项目自身代码中的片段"""
+    texts = []
+    if json_files:
+        for json_file in json_files:
+            with open(json_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                data = [s for event in data.get("events", []) for s in event.get("snippets", [])]
+            texts.extend(
+                f"{s.get('name', '')} {s.get('type', '')} {s.get('code', '')}" for s in data
+            )
+    else:
+        from app.services.code_parser import CodeParser
+        parser = CodeParser()
+        for path in sorted((project_root / 'app').rglob('*.py')):
+            for item in parser.extract_snippets(path.read_text(encoding='utf-8'), 'python'):
+                texts.append(f"{item['name']} {item['type']} {item['code']}")
+    return texts[:limit] if limit > 0 else texts
+
+
+def encode_all(encode: Callable[[List[str]], np.ndarray], texts: List[str], batch_size: int) -> Dict:
+    """分批编码并计时"""
+    start = time.perf_counter()
+    vectors = np.concatenate([
+        encode(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)
+    ])
+    return {"vectors": vectors, "seconds": time.perf_counter() - start}
+
+
+def compare(reference: np.ndarray, candidate: np.ndarray, top_k: int) -> Dict:
+    """比较两组向量：逐条余弦相似度，以及以每条为查询时L2近邻的重合率"""
+    ref_norm = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    cand_norm = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosine = np.sum(ref_norm * cand_norm, axis=1)
+    
+    def neighbors(vectors: np.ndarray) -> np.ndarray:
+        squared = np.sum(vectors ** 2, axis=1)
+        distances = squared[:, None] + squared[None, :] - 2 * vectors @ vectors.T
+        np.fill_diagonal(distances, np.inf)
+        return np.argsort(distances, axis=1)[:, :top_k]
+    
+    k = min(top_k, len(reference) - 1)
+    if k > 0:
+        ref_nn, cand_nn = neighbors(reference), neighbors(candidate)
+        overlap = np.mean([
+            len(set(ref_nn[i, :k]) & set(cand_nn[i, :k])) / k for i in range(len(reference))
+        ])
+    else:
+        overlap = 1.0
+    
+    return {
+        "cosine_min": float(cosine.min()),
+        "cosine_mean": float(cosine.mean()),
+        "max_abs_diff": float(np.max(np.abs(reference - candidate))),
+        "neighbor_overlap": float(overlap),
+    }
+
+
+def main():
+    """主函数"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='检查ONNX后端与torch后端的向量差异')
+    parser.add_argument('json_files', nargs='*',
+                       help='代码片段JSON文件（默认使用项目自身代码）')
+    parser.add_argument('--limit', type=int, default=500,
+                       help='最多使用的片段数（默认：500，0 表示全部）')
+    parser.add_argument('--batch-size', '-b', type=int, default=32,
+                       help='批处理大小（默认：32）')
+    parser.add_argument('--top-k', type=int, default=10,
+                       help='近邻重合率的k（默认：10）')
+    parser.add_argument('--min-cosine', type=float, default=0.99,
+                       help='平均余弦相似度下限，低于该值时返回非0（默认：0.99）')
+    parser.add_argument('--skip-quantized', action='store_true',
+                       help='不检查int8量化模型')
+    args = parser.parse_args()
+    
+    texts = load_texts(args.json_files, args.limit)
+    if not texts:
+        print("没有找到可用的代码片段")
+        sys.exit(1)
+    print(f"片段数量: {len(texts)}")
+    
+    service = get_embedding_service()
+    model = service.model
+    
+    def torch_encode(batch: List[str]) -> np.ndarray:
+        return model.encode(batch, batch_size=len(batch), convert_to_numpy=True, show_progress_bar=False)
+    
+    backends = {"torch": torch_encode}
+    for quantize in ([False] if args.skip_quantized else [False, True]):
+        encoder = OnnxEncoder(
+            model,
+            settings.EMBEDDING_MODEL,
+            settings.EMBEDDING_ONNX_DIR,
+            quantize=quantize,
+            num_threads=settings.EMBEDDING_ONNX_THREADS
+        )
+        backends["onnx-int8" if quantize else "onnx-fp32"] = encoder.encode
+    
+    results = {
+        name: encode_all(encode, texts, args.batch_size) for name, encode in backends.items()
+    }
+    reference = results["torch"]
+    
+    print("=" * 80)
+    print(f"{'后端':<12}{'耗时(s)':>10}{'加速比':>8}{'余弦min':>10}{'余弦mean':>10}"
+          f"{'最大差值':>12}{'近邻重合':>10}")
+    failed = False
+    for name, result in results.items():
+        metrics = compare(reference["vectors"], result["vectors"], args.top_k)
+        print(f"{name:<12}{result['seconds']:>10.2f}{reference['seconds'] / result['seconds']:>8.2f}"
+              f"{metrics['cosine_min']:>10.4f}{metrics['cosine_mean']:>10.4f}"
+              f"{metrics['max_abs_diff']:>12.2e}{metrics['neighbor_overlap']:>10.1%}")
+        if metrics["cosine_mean"] < args.min_cosine:
+            failed = True
+    
+    if failed:
+        print(f"❌ 存在平均余弦相似度低于 {args.min_cosine} 的后端")
+        sys.exit(1)
+    print("✅ 各后端向量与torch后端一致")
+
+
+if __name__ == '__main__':
+    main()
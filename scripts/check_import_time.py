@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+启动导入耗时检查
+用 python -X importtime 统计导入应用模块的耗时，超过预算或导入了
+应延迟加载的重型依赖（torch、pymilvus、neo4j、openai等）时返回非0
+"""
+
+import re
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+# 这些库只应在首次使用对应服务时导入
+HEAVY_MODULES = [
+    "torch",
+    "transformers",
+    "sentence_transformers",
+    "onnxruntime",
+    "pymilvus",
+    "neo4j",
+    "openai",
+]
+
+# 例：import time:       333 |      38471 |       importlib.resources
+_LINE_PATTERN = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)')
+
+
+def measure(module: str) -> List[Dict]:
+    """
+    在新的解释器中导入模块，返回 -X importtime 的记录
+    
+    Args:
+        module: 模块名
+    
+    Returns:
+        记录列表（按输出顺序，子模块在父模块之前），每条包含：
+        name, self_us, cumulative_us, depth
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=str(project_root),
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{result.stderr[-2000:]}")
+    
+    records = []
+    for line in result.stderr.splitlines():
+        match = _LINE_PATTERN.match(line)
+        if match:
+            records.append({
+                "name": match.group(4),
+                "self_us": int(match.group(1)),
+                "cumulative_us": int(match.group(2)),
+                "depth": len(match.group(3)) // 2,
+            })
+    return records
+
+
+def importer_of(records: List[Dict], index: int) -> Optional[str]:
+    """找到最先导入该模块的项目模块（importtime按后序输出，父模块在子模块之后）"""
+    depth = records[index]["depth"]
+    for record in records[index + 1:]:
+        if record["depth"] < depth:
+            if record["name"].startswith("app."):
+                return record["name"]
+            depth = record["depth"]
+    return None
+
+
+def main():
+    """主函数"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='检查应用模块的导入耗时')
+    parser.add_argument('modules', nargs='*', default=['app.main'],
+                       help='要检查的模块（默认：app.main）')
+    parser.add_argument('--budget-ms', type=float, default=1500,
+                       help='每个模块的导入耗时预算，毫秒（默认：1500）')
+    parser.add_argument('--runs', type=int, default=3,
+                       help='每个模块测量的次数，取最小值（默认：3）')
+    parser.add_argument('--top', type=int, default=15,
+                       help='列出耗时最多的前N个依赖（默认：15）')
+    parser.add_argument('--allow', nargs='*', default=[],
+                       help='允许导入的重型依赖')
+    args = parser.parse_args()
+    
+    forbidden = [name for name in HEAVY_MODULES if name not in args.allow]
+    failed = False
+    
+    for module in args.modules:
+        try:
+            runs = [measure(module) for _ in range(max(1, args.runs))]
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            failed = True
+            continue
+        
+        # 取总耗时最短的一次，减少磁盘缓存和系统负载的干扰
+        records = min(runs, key=lambda run: run[-1]["cumulative_us"] if run else 0)
+        total_ms = records[-1]["cumulative_us"] / 1000 if records else 0.0
+        
+        print("=" * 60)
+        print(f"{module}: {total_ms:.0f} ms（预算 {args.budget_ms:.0f} ms）")
+        print(f"{'累计(ms)':>10}{'自身(ms)':>10}  模块")
+        top_level = [record for record in records if record["depth"] == 1]
+        for record in sorted(top_level, key=lambda r: r["cumulative_us"], reverse=True)[:args.top]:
+            print(f"{record['cumulative_us'] / 1000:>10.1f}{record['self_us'] / 1000:>10.1f}  {record['name']}")
+        
+        heavy = [
+            (index, record) for index, record in enumerate(records)
+            if record["name"] in forbidden
+        ]
+        for index, record in heavy:
+            importer = importer_of(records, index) or module
+            print(f"❌ 导入了重型依赖 {record['name']}（{record['cumulative_us'] / 1000:.0f} ms），"
+                  f"来自 {importer}，应改为首次使用时导入")
+            failed = True
+        
+        if total_ms > args.budget_ms:
+            print(f"❌ 导入耗时 {total_ms:.0f} ms 超过预算 {args.budget_ms:.0f} ms")
+            failed = True
+    
+    if failed:
+        sys.exit(1)
+    print("✅ 导入耗时检查通过")
+
+
+if __name__ == '__main__':
+    main()
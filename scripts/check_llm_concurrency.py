@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLM并发与超时检查
+启动一个本地的OpenAI兼容桩服务（每次对话补全固定延迟后返回），
+检查多条复用说明是否并发生成、并发数是否受LLM_MAX_CONCURRENCY限制、
+超时的请求是否按LLM_TIMEOUT及时失败，不需要真实的API密钥
+"""
+
+import asyncio
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core.config import settings
+
+
+class StubServer:
+    """OpenAI兼容的对话补全桩服务，记录同时处理中的请求数峰值"""
+    
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+    
+    def _handler_class(self):
+        stub = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with stub._lock:
+                    stub.requests += 1
+                    stub.active += 1
+                    stub.peak = max(stub.peak, stub.active)
+                try:
+                    time.sleep(stub.delay)
+                    body = json.dumps({
+                        "id": "stub",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": "stub",
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": "## 功能描述\n\n桩服务返回的说明"},
+                            "finish_reason": "stop",
+                        }],
+                        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+                    }).encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端超时后断开连接
+                    pass
+                finally:
+                    with stub._lock:
+                        stub.active -= 1
+            
+            def log_message(self, format, *args):
+                pass
+        
+        return Handler
+    
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+    
+    def reset(self):
+        with self._lock:
+            self.peak = 0
+            self.requests = 0
+    
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+async def run_explanations(count: int) -> Dict:
+    """创建LLM服务并并发生成count条说明，返回耗时和成功数"""
+    from app.services.llm_service import LLMService
+    
+    llm = LLMService()
+    items = [
+        {"code_snippet": f"def f{i}():\n    return {i}", "language": "python", "dependencies": []}
+        for i in range(count)
+    ]
+    start = time.perf_counter()
+    try:
+        explanations = await llm.generate_code_reuse_instructions(items, user_query="并发检查")
+    finally:
+        await llm.close()
+    return {
+        "seconds": time.perf_counter() - start,
+        "succeeded": sum(1 for explanation in explanations if explanation),
+    }
+
+
+def main():
+    """主函数"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='检查LLM说明的并发生成和超时')
+    parser.add_argument('--count', type=int, default=5,
+                       help='同时生成的说明数（默认：5，对应explain_top_n）')
+    parser.add_argument('--delay', type=float, default=1.0,
+                       help='桩服务每次补全的延迟，秒（默认：1.0）')
+    parser.add_argument('--concurrency', type=int, default=None,
+                       help='并发上限（默认使用LLM_MAX_CONCURRENCY配置）')
+    args = parser.parse_args()
+    
+    stub = StubServer(args.delay)
+    stub.start()
+    
+    # 指向桩服务
+    settings.LLM_PROVIDER = "openai"
+    settings.LLM_BASE_URL = stub.url
+    settings.LLM_API_KEY = "stub"
+    settings.LLM_MODEL = "stub"
+    # 不使用说明缓存，每条说明都要请求桩服务
+    settings.EXPLANATION_CACHE_ENABLED = False
+    if args.concurrency is not None:
+        settings.LLM_MAX_CONCURRENCY = args.concurrency
+    concurrency = max(1, settings.LLM_MAX_CONCURRENCY)
+    failed = False
+    
+    try:
+        # 1) 并发生成：耗时应约为 ceil(count / concurrency) 次延迟，而不是 count 次
+        settings.LLM_TIMEOUT = args.delay * 5
+        result = asyncio.run(run_explanations(args.count))
+        rounds = -(-args.count // concurrency)
+        expected = rounds * args.delay
+        print(f"并发生成 {args.count} 条说明（并发上限 {concurrency}）: {result['seconds']:.2f} 秒，"
+              f"成功 {result['succeeded']} 条，同时处理峰值 {stub.peak}，"
+              f"顺序执行约需 {args.count * args.delay:.2f} 秒")
+        if result["succeeded"] != args.count:
+            print("❌ 部分说明生成失败")
+            failed = True
+        if stub.peak > concurrency:
+            print(f"❌ 同时处理的请求数 {stub.peak} 超过并发上限 {concurrency}")
+            failed = True
+        if result["seconds"] > expected + args.delay * 0.5:
+            print(f"❌ 耗时超过预期的 {expected:.2f} 秒，说明没有并发生成")
+            failed = True
+        
+        # 2) 超时：桩服务的延迟大于超时，所有说明应在超时后失败（返回None），而不是一直等待
+        stub.reset()
+        settings.LLM_TIMEOUT = args.delay / 4
+        result = asyncio.run(run_explanations(args.count))
+        limit = rounds * settings.LLM_TIMEOUT + args.delay * 0.5
+        print(f"超时 {settings.LLM_TIMEOUT:.2f} 秒: {result['seconds']:.2f} 秒后返回，"
+              f"成功 {result['succeeded']} 条")
+        if result["succeeded"] != 0 or result["seconds"] > limit:
+            print("❌ 超时的请求没有及时失败")
+            failed = True
+    finally:
+        stub.stop()
+    
+    if failed:
+        sys.exit(1)
+    print("✅ LLM并发与超时检查通过")
+
+
+if __name__ == '__main__':
+    main()
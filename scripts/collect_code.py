@@ -9,23 +9,86 @@ import sys
 import json
 import os
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Iterable, Iterator, Tuple
 
 # 添加项目根目录到路径
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 from app.services.github_service import get_github_service
-from app.services.code_parser import get_code_parser
 from app.services.code_cleaner import get_code_cleaner
+from app.services.parse_pool import ParsePool, process_file
+from app.services.languages import get_language_spec, list_languages
+from app.services.collect_manifest import CollectManifest
+from app.services.dedup_index import DedupIndex
 from app.core.config import settings
 
 
+def parse_files(
+    files: Iterable[Tuple[str, str]],
+    language: str,
+    parse_pool: Optional[ParsePool] = None
+) -> Iterator[Tuple[str, List[Dict]]]:
+    """
+    解析并清洗文件
+    
+    Args:
+        files: (file_path, content) 序列，可以是边下载边产出的生成器
+        language: 编程语言
+        parse_pool: 解析进程池（为None时在当前进程解析）
+    
+    Returns:
+        (file_path, 代码片段列表) 迭代器
+    """
+    if parse_pool:
+        return parse_pool.parse_files(files, language)
+    return ((path, process_file(path, content, language)) for path, content in files)
+
+
+def attach_repo_info(snippets: List[Dict], repo_info: Dict) -> List[Dict]:
+    """为代码片段补充仓库信息"""
+    for snippet in snippets:
+        snippet['repo_url'] = repo_info['url']
+        snippet['repo_name'] = repo_info['full_name']
+    return snippets
+
+
+def dedup_file_snippets(
+    snippets: List[Dict],
+    repo_name: str,
+    file_path: str,
+    dedup_index: Optional[DedupIndex] = None
+) -> List[Dict]:
+    """用语料级去重索引过滤一个文件的片段（未指定索引时原样返回）"""
+    if dedup_index is None:
+        return snippets
+    return dedup_index.replace_file(repo_name, file_path, snippets)
+
+
+def save_snippets(snippets: List[Dict], repo_name: str, output_dir: str) -> Path:
+    """保存代码片段到JSON文件"""
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_file = output_path / f"code_snippets_{repo_name.replace('/', '_')}_{timestamp}.json"
+    
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(snippets, f, ensure_ascii=False, indent=2)
+    
+    print(f"结果已保存到: {output_file}")
+    return output_file
+
+
 def collect_code_from_repo(
     repo_name: str,
     language: str = "python",
-    output_dir: Optional[str] = None
+    output_dir: Optional[str] = None,
+    download_executor: Optional[ThreadPoolExecutor] = None,
+    parse_pool: Optional[ParsePool] = None,
+    dedup_index: Optional[DedupIndex] = None
 ) -> List[Dict]:
     """
     从指定仓库采集代码
@@ -34,103 +97,335 @@ def collect_code_from_repo(
         repo_name: 仓库名称（格式：owner/repo）
         language: 编程语言
         output_dir: 输出目录
+        download_executor: 文件下载线程池（为None时串行下载）
+        parse_pool: 解析进程池（为None时在当前进程解析）
+        dedup_index: 语料级去重索引（为None时只在仓库内去重）
     
     Returns:
         代码片段列表
     """
     github_service = get_github_service()
-    code_parser = get_code_parser()
     code_cleaner = get_code_cleaner()
     
     # 获取仓库
     try:
+        github_service.limiter.acquire()
         repo = github_service.github.get_repo(repo_name)
         repo_info = github_service.get_repository_info(repo)
         print(f"采集仓库: {repo_info['full_name']}")
         print(f"描述: {repo_info['description']}")
         print(f"Stars: {repo_info['stars']}")
     except Exception as e:
-        print(f"获取仓库失败: {e}")
+        print(f"获取仓库失败 {repo_name}: {e}")
         return []
     
     # 确定文件扩展名
-    file_extensions = {
-        'python': ['.py'],
-        'java': ['.java'],
-        'cpp': ['.cpp', '.cc', '.cxx', '.h', '.hpp'],
-    }.get(language.lower(), ['.py'])
+    file_extensions = get_language_spec(language.lower()).extensions
     
     # 获取文件列表
-    print("获取文件列表...")
+    print(f"[{repo_name}] 获取文件列表...")
     files = github_service.get_repository_files(
         repo,
         file_extensions=file_extensions
     )
-    print(f"找到 {len(files)} 个文件")
+    print(f"[{repo_name}] 找到 {len(files)} 个文件")
+    
+    # 下载文件：有线程池时并发下载，按完成顺序交给解析
+    if download_executor:
+        download_futures = {
+            download_executor.submit(github_service.get_file_content, file): file.path
+            for file in files
+        }
+        downloads = (
+            (download_futures[future], future.result())
+            for future in as_completed(download_futures)
+        )
+    else:
+        downloads = (
+            (file.path, github_service.get_file_content(file))
+            for file in files
+        )
+    
+    def downloaded_files() -> Iterator[Tuple[str, str]]:
+        for done, (path, content) in enumerate(downloads, 1):
+            print(f"[{repo_name}] 处理文件 {done}/{len(files)}: {path}")
+            if content:
+                yield path, content
+    
+    # 提取代码片段（边下载边解析，输出顺序与文件顺序一致）
+    file_snippets = dict(parse_files(downloaded_files(), language, parse_pool))
     
-    # 提取代码片段
     all_snippets = []
+    total = 0
+    for file in files:
+        snippets = attach_repo_info(file_snippets.get(file.path, []), repo_info)
+        total += len(snippets)
+        all_snippets.extend(
+            dedup_file_snippets(snippets, repo_info['full_name'], file.path, dedup_index)
+        )
+    
+    # 去重（有去重索引时，与已采集语料重复或近似重复的片段已被过滤）
+    print(f"[{repo_name}] 去重前: {total} 个片段")
+    all_snippets = code_cleaner.remove_duplicates(all_snippets)
+    print(f"[{repo_name}] 去重后: {len(all_snippets)} 个片段")
+    
+    # 保存结果
+    if output_dir:
+        save_snippets(all_snippets, repo_name, output_dir)
+    
+    return all_snippets
+
+
+def collect_code_incremental(
+    repo_name: str,
+    language: str,
+    manifest: CollectManifest,
+    output_dir: Optional[str] = None,
+    download_executor: Optional[ThreadPoolExecutor] = None,
+    parse_pool: Optional[ParsePool] = None,
+    dedup_index: Optional[DedupIndex] = None
+) -> Dict:
+    """
+    增量采集仓库：只下载和解析自上次采集以来变化的文件
+    
+    通过带ETag的条件请求检查分支是否有新提交，再用一次文件树请求
+    对比每个文件的blob SHA，生成add/modify/delete事件。
+    
+    Args:
+        repo_name: 仓库名称（格式：owner/repo）
+        language: 编程语言
+        manifest: 采集清单
+        output_dir: 输出目录
+        download_executor: 文件下载线程池（为None时串行下载）
+        parse_pool: 解析进程池（为None时在当前进程解析）
+        dedup_index: 语料级去重索引（为None时只在文件内去重）
+    
+    Returns:
+        变更记录：{"repo_name", "repo_url", "commit_sha", "previous_commit_sha", "events"}
+    """
+    github_service = get_github_service()
+    code_cleaner = get_code_cleaner()
     
-    for i, file in enumerate(files, 1):
-        print(f"处理文件 {i}/{len(files)}: {file.path}")
+    repo_entry = manifest.get_repo(repo_name)
+    state = manifest.get_language_state(repo_name, language)
+    branch = repo_entry.get("default_branch")
+    repo_url = repo_entry.get("url")
+    
+    changes = {
+        "repo_name": repo_name,
+        "repo_url": repo_url,
+        "language": language,
+        "commit_sha": state["commit_sha"],
+        "previous_commit_sha": state["commit_sha"],
+        "events": [],
+    }
+    
+    try:
+        # 首次采集需要查询默认分支
+        if not branch or not repo_url:
+            github_service.limiter.acquire()
+            repo = github_service.github.get_repo(repo_name)
+            branch = repo.default_branch
+            repo_url = repo.html_url
+            changes["repo_url"] = repo_url
         
-        # 获取文件内容
-        content = github_service.get_file_content(file)
-        if not content:
+        head = github_service.get_head_commit(repo_name, branch, etag=state["etag"])
+    except Exception as e:
+        print(f"获取仓库提交失败 {repo_name}: {e}")
+        return changes
+    
+    if head is None or head["sha"] == state["commit_sha"]:
+        if not state["pending"]:
+            print(f"[{repo_name}] 没有新的提交，跳过")
+            if head is not None:
+                manifest.update(repo_name, language, head["sha"], head["etag"], state["files"])
+                manifest.save()
+            return changes
+        # 上次有文件下载失败：分支没有新提交时也按当前提交重新比较，
+        # 失败的文件没有记录新的blob SHA，会再次出现在新增/修改中
+        print(f"[{repo_name}] 没有新的提交，重试上次失败的 {len(state['pending'])} 个文件")
+        if head is None:
+            head = {"sha": state["commit_sha"], "etag": state["etag"]}
+    
+    changes["commit_sha"] = head["sha"]
+    
+    tree = github_service.get_repository_tree(
+        repo_name,
+        head["sha"],
+        file_extensions=get_language_spec(language.lower()).extensions
+    )
+    new_files = {path: sha for path, (sha, _) in tree.items()}
+    diff = CollectManifest.diff_files(state["files"], new_files)
+    print(
+        f"[{repo_name}] {str(state['commit_sha'])[:7]} -> {head['sha'][:7]}: "
+        f"新增 {len(diff['add'])}，修改 {len(diff['modify'])}，删除 {len(diff['delete'])}"
+    )
+    
+    repo_info = {"url": repo_url, "full_name": repo_name}
+    
+    # 只下载变化的文件（跳过超过1MB的文件）
+    changed = [
+        (op, path) for op in ("add", "modify") for path in diff[op]
+        if tree[path][1] <= 1_000_000
+    ]
+    
+    def download(path: str) -> Optional[str]:
+        return github_service.get_blob_content(repo_name, new_files[path])
+    
+    if download_executor:
+        contents = list(download_executor.map(download, [path for _, path in changed]))
+    else:
+        contents = [download(path) for _, path in changed]
+    
+    # 解析/清洗（下载失败的文件不更新清单，下次采集时重试）
+    recorded_files = {
+        path: sha for path, sha in state["files"].items() if path not in diff["delete"]
+    }
+    downloaded = [
+        (path, content) for (_, path), content in zip(changed, contents)
+        if content is not None
+    ]
+    file_snippets = dict(parse_files(downloaded, language, parse_pool))
+    
+    for op, path in changed:
+        if path not in file_snippets:
             continue
         
-        # 解析代码
-        functions = code_parser.extract_functions(content, language)
-        classes = code_parser.extract_classes(content, language)
-        
-        # 清洗代码
-        for func in functions:
-            cleaned = code_cleaner.clean_code_snippet(func['code'])
-            if cleaned:
-                func['code'] = cleaned
-                func['type'] = 'function'
-                func['file_path'] = file.path
-                func['repo_url'] = repo_info['url']
-                func['repo_name'] = repo_info['full_name']
-                func['language'] = language
-                func['dependencies'] = code_cleaner.extract_dependencies(
-                    cleaned, language
-                )
-                all_snippets.append(func)
-        
-        for cls in classes:
-            cleaned = code_cleaner.clean_code_snippet(cls['code'])
-            if cleaned:
-                cls['code'] = cleaned
-                cls['type'] = 'class'
-                cls['file_path'] = file.path
-                cls['repo_url'] = repo_info['url']
-                cls['repo_name'] = repo_info['full_name']
-                cls['language'] = language
-                cls['dependencies'] = code_cleaner.extract_dependencies(
-                    cleaned, language
-                )
-                all_snippets.append(cls)
+        snippets = dedup_file_snippets(
+            attach_repo_info(file_snippets[path], repo_info), repo_name, path, dedup_index
+        )
+        changes["events"].append({
+            "op": op,
+            "file_path": path,
+            "blob_sha": new_files[path],
+            "snippets": code_cleaner.remove_duplicates(snippets),
+        })
+        recorded_files[path] = new_files[path]
     
-    # 去重
-    print(f"去重前: {len(all_snippets)} 个片段")
-    all_snippets = code_cleaner.remove_duplicates(all_snippets)
-    print(f"去重后: {len(all_snippets)} 个片段")
+    for path in diff["delete"]:
+        if dedup_index is not None:
+            dedup_index.remove_file(repo_name, path)
+        changes["events"].append({"op": "delete", "file_path": path})
     
-    # 保存结果
-    if output_dir:
+    # 超过大小限制的文件也记录SHA，避免每次都被当作新文件
+    for path, (sha, size) in tree.items():
+        if size > 1_000_000:
+            recorded_files[path] = sha
+    
+    # 下载失败的文件记为待重试，即使分支之后没有新提交，下次采集也会重新比较
+    pending = [path for _, path in changed if recorded_files.get(path) != new_files[path]]
+    if pending:
+        print(f"[!] [{repo_name}] {len(pending)} 个文件下载失败，下次采集时重试")
+    
+    # 先保存变更事件，再更新清单，保证中断时不会丢失变更
+    if output_dir and changes["events"]:
         output_path = Path(output_dir)
         output_path.mkdir(parents=True, exist_ok=True)
         
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_file = output_path / f"code_snippets_{repo_name.replace('/', '_')}_{timestamp}.json"
+        output_file = output_path / f"code_changes_{repo_name.replace('/', '_')}_{timestamp}.json"
         
         with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(all_snippets, f, ensure_ascii=False, indent=2)
+            json.dump(changes, f, ensure_ascii=False, indent=2)
         
-        print(f"结果已保存到: {output_file}")
+        print(f"变更事件已保存到: {output_file}")
     
-    return all_snippets
+    manifest.update(
+        repo_name,
+        language,
+        head["sha"],
+        head["etag"],
+        recorded_files,
+        default_branch=branch,
+        url=repo_url,
+        pending=pending
+    )
+    manifest.save()
+    
+    return changes
+
+
+def collect_code_from_repos(
+    repo_names: List[str],
+    language: str = "python",
+    output_dir: Optional[str] = None,
+    download_workers: int = settings.COLLECT_DOWNLOAD_WORKERS,
+    parse_workers: int = settings.COLLECT_PARSE_WORKERS,
+    repo_workers: int = 4,
+    manifest: Optional[CollectManifest] = None,
+    dedup_index: Optional[DedupIndex] = None
+) -> Dict[str, int]:
+    """
+    并发采集多个仓库
+    
+    多个仓库同时采集，共享一个下载线程池、一个解析进程池，
+    以及GitHubService中的请求限速器。
+    
+    Args:
+        repo_names: 仓库名称列表（格式：owner/repo）
+        language: 编程语言
+        output_dir: 输出目录（每个仓库一个JSON文件）
+        download_workers: 文件下载线程数
+        parse_workers: 解析/清洗进程数（<=0 表示使用CPU核数）
+        repo_workers: 同时采集的仓库数
+        manifest: 采集清单（指定时进行增量采集，输出变更事件）
+        dedup_index: 语料级去重索引（多个仓库共享，为None时只在仓库内去重）
+    
+    Returns:
+        每个仓库采集到的片段数量
+    """
+    # 在主线程中创建单例，避免多个线程重复初始化
+    get_github_service()
+    get_code_cleaner()
+    
+    parse_workers = parse_workers if parse_workers > 0 else (os.cpu_count() or 1)
+    results: Dict[str, int] = {}
+    
+    with ThreadPoolExecutor(max_workers=max(1, download_workers)) as download_executor, \
+            ParsePool(max_workers=parse_workers) as parse_pool, \
+            ThreadPoolExecutor(max_workers=max(1, repo_workers)) as repo_executor:
+        repo_futures = {}
+        for repo_name in repo_names:
+            if manifest is not None:
+                future = repo_executor.submit(
+                    collect_code_incremental,
+                    repo_name,
+                    language,
+                    manifest,
+                    output_dir,
+                    download_executor,
+                    parse_pool,
+                    dedup_index
+                )
+            else:
+                future = repo_executor.submit(
+                    collect_code_from_repo,
+                    repo_name,
+                    language,
+                    output_dir,
+                    download_executor,
+                    parse_pool,
+                    dedup_index
+                )
+            repo_futures[future] = repo_name
+        
+        for done, future in enumerate(as_completed(repo_futures), 1):
+            repo_name = repo_futures[future]
+            try:
+                result = future.result()
+                if manifest is not None:
+                    result = [
+                        snippet
+                        for event in result["events"]
+                        for snippet in event.get("snippets", [])
+                    ]
+                results[repo_name] = len(result)
+            except Exception as e:
+                print(f"采集仓库失败 {repo_name}: {e}")
+                results[repo_name] = 0
+            print(f"仓库进度 {done}/{len(repo_names)}: {repo_name} -> {results[repo_name]} 个片段")
+    
+    return results
 
 
 def main():
@@ -138,24 +433,67 @@ def main():
     import argparse
     
     parser = argparse.ArgumentParser(description='从GitHub采集代码')
-    parser.add_argument('repo', help='仓库名称（格式：owner/repo）')
+    parser.add_argument('repos', nargs='*',
+                       help='仓库名称（格式：owner/repo），可指定多个')
+    parser.add_argument('--query', '-q',
+                       help='GitHub仓库搜索关键词（与repos二选一或同时使用）')
+    parser.add_argument('--max-repos', type=int, default=30,
+                       help='按关键词搜索时采集的仓库数量（默认：30）')
     parser.add_argument('--language', '-l', default='python',
-                       choices=['python', 'java', 'cpp'],
+                       choices=list_languages(),
                        help='编程语言')
     parser.add_argument('--output', '-o',
                        default=settings.CODE_SNIPPETS_DIR,
                        help='输出目录')
+    parser.add_argument('--download-workers', type=int,
+                       default=settings.COLLECT_DOWNLOAD_WORKERS,
+                       help='文件下载线程数')
+    parser.add_argument('--parse-workers', type=int,
+                       default=settings.COLLECT_PARSE_WORKERS,
+                       help='解析/清洗进程数（0 表示使用CPU核数）')
+    parser.add_argument('--repo-workers', type=int, default=4,
+                       help='同时采集的仓库数（默认：4）')
+    parser.add_argument('--incremental', action='store_true',
+                       help='增量采集：只处理自上次采集以来变化的文件，输出变更事件')
+    parser.add_argument('--manifest',
+                       default=settings.COLLECT_MANIFEST_PATH,
+                       help='增量采集清单路径')
+    parser.add_argument('--dedup-index', nargs='?', const=settings.DEDUP_INDEX_PATH, default=None,
+                       help=f'启用语料级去重索引（跨仓库、跨多次采集过滤重复和近似重复的片段），'
+                            f'可指定索引路径（默认：{settings.DEDUP_INDEX_PATH}）；'
+                            f'不指定时只在仓库内去重')
     
     args = parser.parse_args()
     
+    repo_names = list(args.repos)
+    if args.query:
+        print(f"搜索仓库: {args.query}")
+        repos = get_github_service().search_repositories(
+            args.query,
+            language=args.language,
+            per_page=args.max_repos
+        )
+        repo_names.extend(repo.full_name for repo in repos)
+    
+    # 去掉重复的仓库，保留原有顺序
+    repo_names = list(dict.fromkeys(repo_names))
+    if not repo_names:
+        parser.error('请指定至少一个仓库或使用 --query 搜索仓库')
+    
     try:
-        snippets = collect_code_from_repo(
-            args.repo,
+        results = collect_code_from_repos(
+            repo_names,
             args.language,
-            args.output
+            args.output,
+            download_workers=args.download_workers,
+            parse_workers=args.parse_workers,
+            repo_workers=args.repo_workers,
+            manifest=CollectManifest(args.manifest) if args.incremental else None,
+            dedup_index=DedupIndex(args.dedup_index) if args.dedup_index else None
         )
         
-        print(f"\n采集完成！共获得 {len(snippets)} 个代码片段")
+        total = sum(results.values())
+        print(f"\n采集完成！共 {len(results)} 个仓库，获得 {total} 个代码片段")
         
     except Exception as e:
         print(f"采集失败: {e}")
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+共享嵌入服务
+在单独的进程中加载嵌入模型，API工作进程设置 EMBEDDING_MODE=server 后
+通过Unix socket调用它编码，多个工作进程只占用一份模型内存
+"""
+
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core.config import settings
+from app.services.embedding_server import EmbeddingServer
+
+
+def main():
+    """主函数"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='启动共享嵌入服务')
+    parser.add_argument('--socket', default=settings.EMBEDDING_SERVER_SOCKET,
+                       help=f'Unix socket路径（默认：{settings.EMBEDDING_SERVER_SOCKET}）')
+    args = parser.parse_args()
+    
+    try:
+        EmbeddingServer(args.socket).serve_forever()
+    except KeyboardInterrupt:
+        print("\n嵌入服务已停止")
+
+
+if __name__ == '__main__':
+    main()
@@ -34,7 +34,7 @@ def test_collect():
     try:
         parser = get_code_parser()
         print("✅ 代码解析器初始化成功")
-        print(f"   支持的语言: {list(parser.parsers.keys())}")
+        print(f"   支持的语言: {parser.supported_languages()}")
     except Exception as e:
         print(f"❌ 代码解析器初始化失败: {e}")
         return
@@ -9,7 +9,7 @@ import sys
 import json
 import uuid
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional, Union
 from tqdm import tqdm
 
 # 添加项目根目录到路径
@@ -17,20 +17,27 @@ project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 from app.services.embedding_service import get_embedding_service
+from app.services.embedding_pool import EmbeddingPool
+from app.services.embedding_cache import EmbeddingCache
 from app.services.milvus_service import get_milvus_service
 from app.services.neo4j_service import get_neo4j_service
+from app.services.chunker import CodeChunker
+from app.services.lexical_index import LexicalIndex
 from app.core.config import settings
 
 
-def load_code_snippets(json_file: str) -> List[Dict]:
-    """加载代码片段JSON文件"""
+def load_code_snippets(json_file: str) -> Union[List[Dict], Dict]:
+    """加载代码片段JSON文件（片段列表，或增量采集输出的变更记录）"""
     with open(json_file, 'r', encoding='utf-8') as f:
         return json.load(f)
 
 
 def vectorize_and_store(
     code_snippets: List[Dict],
-    batch_size: int = 100
+    batch_size: int = 100,
+    embedding_pool: Optional[EmbeddingPool] = None,
+    embedding_cache: Optional[EmbeddingCache] = None,
+    lexical_index: Optional[LexicalIndex] = None
 ) -> Dict:
     """
     向量化并存储代码片段
@@ -38,17 +45,24 @@ def vectorize_and_store(
     Args:
         code_snippets: 代码片段列表
         batch_size: 批处理大小
+        embedding_pool: 多进程嵌入服务（为None时在当前进程中编码）
+        embedding_cache: 向量缓存（为None时全部重新编码）
+        lexical_index: 词法索引（为None时不写入）
     
     Returns:
         处理统计信息
     """
-    embedding_service = get_embedding_service()
+    embedding_service = embedding_pool or get_embedding_service()
     milvus_service = get_milvus_service()
     neo4j_service = get_neo4j_service()
+    # 长代码按模型tokenizer切分成有重叠的窗口（旧集合不支持分块时不切分）
+    chunker = CodeChunker(embedding_service.tokenizer)
     
     stats = {
         "total": len(code_snippets),
         "processed": 0,
+        "chunks": 0,
+        "cache_hits": 0,
         "milvus_inserted": 0,
         "neo4j_inserted": 0,
         "errors": 0
@@ -60,28 +74,47 @@ def vectorize_and_store(
         print(f"\n处理批次 {i//batch_size + 1}/{(len(code_snippets) + batch_size - 1)//batch_size}")
         
         try:
-            # 准备代码文本
-            code_texts = []
             processed_snippets = []
             
             for snippet in batch:
                 # 生成唯一ID
                 if "code_id" not in snippet:
                     snippet["code_id"] = str(uuid.uuid4())
-                
-                # 准备向量化的文本（代码 + 名称 + 类型）
-                text = f"{snippet.get('name', '')} {snippet.get('type', '')} {snippet.get('code', '')}"
-                code_texts.append(text)
                 processed_snippets.append(snippet)
             
+            # 准备向量化的文本（名称 + 类型 + 代码窗口），长片段展开为多条记录
+            records = chunker.chunk_snippets(
+                processed_snippets,
+                split_long=milvus_service.supports_chunks
+            )
+            code_texts = [record["embedding_text"] for record in records]
+            stats["chunks"] += len(records) - len(processed_snippets)
+            
             # 批量编码为向量
-            print("  编码向量...")
-            vectors = embedding_service.encode_batch(code_texts, batch_size=batch_size)
+            print(f"  编码向量（{len(processed_snippets)} 个片段，{len(records)} 条记录）...")
+            if embedding_cache is not None:
+                # 只有缓存未命中的文本送入模型
+                vectors = embedding_cache.encode(embedding_service, code_texts, batch_size=batch_size)
+                stats["cache_hits"] += embedding_cache.last_stats["hits"]
+                print(f"  向量缓存命中: {embedding_cache.last_stats['hits']}/{len(code_texts)}")
+            else:
+                vectors = embedding_service.encode_batch(code_texts, batch_size=batch_size)
             
             # 插入Milvus
             print("  插入Milvus...")
-            milvus_ids = milvus_service.insert_code_snippets(processed_snippets, vectors)
-            stats["milvus_inserted"] += len(milvus_ids)
+            inserted_ids = milvus_service.insert_code_snippets(records, vectors)
+            stats["milvus_inserted"] += len(inserted_ids)
+            
+            # 写入词法索引（按片段，使用完整代码）
+            if lexical_index is not None:
+                lexical_index.add_snippets(processed_snippets)
+            
+            # Neo4j节点关联片段第一条记录（包含完整代码）的Milvus ID
+            record_ids = {
+                record["code_id"]: inserted_id
+                for record, inserted_id in zip(records, inserted_ids)
+            }
+            milvus_ids = [record_ids.get(snippet["code_id"]) for snippet in processed_snippets]
             
             # 插入Neo4j
             print("  插入Neo4j...")
@@ -131,35 +164,149 @@ def vectorize_and_store(
     return stats
 
 
+def apply_change_events(
+    changes: Dict,
+    batch_size: int = 100,
+    embedding_pool: Optional[EmbeddingPool] = None,
+    embedding_cache: Optional[EmbeddingCache] = None,
+    lexical_index: Optional[LexicalIndex] = None
+) -> Dict:
+    """
+    应用增量采集的变更事件
+    
+    以文件为单位upsert：add/modify/delete事件先删除该文件已有的全部片段，
+    add/modify事件再写入新片段。重复应用同一批事件结果不变。
+    
+    Args:
+        changes: collect_code.py --incremental 输出的变更记录
+        batch_size: 批处理大小
+        embedding_pool: 多进程嵌入服务（为None时在当前进程中编码）
+        embedding_cache: 向量缓存（为None时全部重新编码）
+        lexical_index: 词法索引（为None时不写入）
+    
+    Returns:
+        处理统计信息
+    """
+    milvus_service = get_milvus_service()
+    neo4j_service = get_neo4j_service()
+    
+    repo_name = changes["repo_name"]
+    events = changes.get("events", [])
+    deleted = {"milvus": 0, "neo4j": 0}
+    upsert_snippets = []
+    
+    print(f"应用变更事件: {repo_name} ({len(events)} 个文件)")
+    for event in events:
+        file_path = event["file_path"]
+        # 删除失败时抛出异常，不写入新片段（避免新旧片段同时存在），修复后重新应用即可
+        deleted["milvus"] += milvus_service.delete_by_file(repo_name, file_path)
+        deleted["neo4j"] += neo4j_service.delete_by_file(repo_name, file_path)
+        if lexical_index is not None:
+            lexical_index.remove_file(repo_name, file_path)
+        
+        if event["op"] in ("add", "modify"):
+            upsert_snippets.extend(event.get("snippets", []))
+    
+    milvus_service.collection.flush()
+    print(f"  已删除旧片段: Milvus {deleted['milvus']} 个，Neo4j {deleted['neo4j']} 个")
+    
+    stats = vectorize_and_store(
+        upsert_snippets,
+        batch_size=batch_size,
+        embedding_pool=embedding_pool,
+        embedding_cache=embedding_cache,
+        lexical_index=lexical_index
+    )
+    stats["milvus_deleted"] = deleted["milvus"]
+    stats["neo4j_deleted"] = deleted["neo4j"]
+    return stats
+
+
 def main():
     """主函数"""
     import argparse
     
     parser = argparse.ArgumentParser(description='向量化代码片段并存储')
-    parser.add_argument('json_file', help='代码片段JSON文件路径')
+    parser.add_argument('json_file', help='代码片段JSON文件路径（或增量采集的变更事件文件）')
     parser.add_argument('--batch-size', '-b', type=int, default=100,
                        help='批处理大小（默认：100）')
+    parser.add_argument('--embed-workers', type=int, default=settings.EMBEDDING_POOL_WORKERS,
+                       help='嵌入进程数，>1 时多进程编码，0 表示CPU核数'
+                            f'（默认：{settings.EMBEDDING_POOL_WORKERS}，建议同时调大 --batch-size）')
+    parser.add_argument('--embed-threads', type=int, default=settings.EMBEDDING_POOL_THREADS,
+                       help='每个嵌入进程的线程数（默认：CPU核数 / 进程数）')
+    parser.add_argument('--embedding-cache',
+                       default=settings.EMBEDDING_CACHE_DIR,
+                       help='向量缓存目录（按模型和内容哈希复用已编码的向量）')
+    parser.add_argument('--no-embedding-cache', action='store_true',
+                       help='不使用向量缓存，全部重新编码')
+    parser.add_argument('--lexical-index', default=settings.LEXICAL_INDEX_DIR,
+                       help='词法（BM25）索引目录')
+    parser.add_argument('--no-lexical-index', action='store_true',
+                       help='不写入词法索引')
     
     args = parser.parse_args()
     
     # 加载代码片段
     print(f"加载代码片段: {args.json_file}")
     code_snippets = load_code_snippets(args.json_file)
-    print(f"共 {len(code_snippets)} 个代码片段")
+    is_changes = isinstance(code_snippets, dict) and "events" in code_snippets
+    if not is_changes:
+        print(f"共 {len(code_snippets)} 个代码片段")
+    
+    # 多进程编码：每个进程持有一份模型，并固定线程数
+    embedding_pool = None
+    if args.embed_workers != 1:
+        embedding_pool = EmbeddingPool(args.embed_workers, args.embed_threads)
+    
+    embedding_cache = None
+    if not args.no_embedding_cache:
+        model_key = (embedding_pool or get_embedding_service()).model_key
+        embedding_cache = EmbeddingCache(model_key, args.embedding_cache)
+        print(f"向量缓存: {args.embedding_cache}（{model_key}，已有 {embedding_cache.count()} 条）")
+    
+    lexical_index = None
+    if not args.no_lexical_index:
+        lexical_index = LexicalIndex(args.lexical_index)
     
     # 向量化并存储
     try:
-        stats = vectorize_and_store(code_snippets, batch_size=args.batch_size)
+        if is_changes:
+            stats = apply_change_events(
+                code_snippets,
+                batch_size=args.batch_size,
+                embedding_pool=embedding_pool,
+                embedding_cache=embedding_cache,
+                lexical_index=lexical_index
+            )
+        else:
+            stats = vectorize_and_store(
+                code_snippets,
+                batch_size=args.batch_size,
+                embedding_pool=embedding_pool,
+                embedding_cache=embedding_cache,
+                lexical_index=lexical_index
+            )
         
         print("\n" + "=" * 60)
         print("处理完成！")
         print("=" * 60)
         print(f"总计: {stats['total']} 个片段")
         print(f"已处理: {stats['processed']} 个片段")
-        print(f"Milvus插入: {stats['milvus_inserted']} 个")
+        print(f"长代码分块: 额外 {stats['chunks']} 条记录")
+        print(f"向量缓存命中: {stats['cache_hits']} 条记录")
+        print(f"Milvus插入: {stats['milvus_inserted']} 条记录")
         print(f"Neo4j插入: {stats['neo4j_inserted']} 个")
+        if is_changes:
+            print(f"Milvus删除: {stats['milvus_deleted']} 个")
+            print(f"Neo4j删除: {stats['neo4j_deleted']} 个")
         print(f"错误: {stats['errors']} 个")
         
+        # 编译词法索引快照（API进程在下次检索时加载）
+        if lexical_index is not None:
+            lexical_index.build()
+            print(f"词法索引: {lexical_index.count()} 个片段")
+        
         # 显示统计信息
         print("\nMilvus统计:")
         milvus_stats = get_milvus_service().get_collection_stats()
@@ -176,6 +323,13 @@ def main():
         import traceback
         traceback.print_exc()
         sys.exit(1)
+    finally:
+        if embedding_pool is not None:
+            embedding_pool.shutdown()
+        if embedding_cache is not None:
+            embedding_cache.close()
+        if lexical_index is not None:
+            lexical_index.close()
 
 
 if __name__ == '__main__':